@@ -0,0 +1,313 @@
+"""
+corine.py - CORINE Land Cover 2018 features for the browse map (/api/map-data).
+
+The polygons come from the EEA ArcGIS MapServer (CORINE_URL), clipped to Czechia with
+czech_esri_geometry.json and paged PAGE_SIZE features at a time. Fetching them takes
+tens of seconds, so they are ingested once into a GeoPackage (STORE_PATH, built by
+models/ingest_corine.py, either from the server or from a local GeoJSON file) and the
+endpoint serves that store without touching the network:
+
+- load_store() reads the GeoPackage once per process into a FeatureStore: an STRtree
+  for viewport (bbox) queries, Code_18 class filters, and geometries pre-simplified to
+  one pixel at each of ZOOM_LEVELS, so a query only serialises what is visible at the
+  precision that is visible. The unfiltered collection is kept pre-serialised.
+- CORINE_STORE (environment) points the backend at another store, e.g. one ingested
+  from fixtures/corine_sample.geojson for local runs; CORINE_URL at another server.
+- iter_pages() is the upstream pager: up to FETCH_CONCURRENCY offset pages in flight on
+  one keep-alive session, each retried with exponential backoff, yielded in offset order.
+  fetch_features() collects them for the ingest script; stream_feature_collection()
+  turns them into response chunks so a refresh is forwarded to the client page by page.
+  fixtures/arcgis_standin.py serves a local file with the same exceededTransferLimit
+  paging for running this without the EEA server.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+
+CORINE_URL = os.environ.get(
+    "CORINE_URL", "https://image.discomap.eea.europa.eu/arcgis/rest/services/Corine/CLC2018_WM/MapServer/0/query")
+PAGE_SIZE = 1000         # max records per request (server limit)
+MAX_OFFSET = 15000       # Czechia has < 16 pages
+REQUEST_TIMEOUT = 30     # seconds per page
+FETCH_CONCURRENCY = 4    # pages in flight at once
+FETCH_RETRIES = 3        # extra attempts per page after a failed request
+FETCH_BACKOFF = 0.5      # seconds before the first retry, doubled after each failure
+ZOOM_LEVELS = (6, 8, 10, 12)  # zooms with a pre-simplified geometry copy; above the last, full precision
+
+log = logging.getLogger("greenhack")
+
+_BASE = os.path.dirname(os.path.abspath(__file__))
+STORE_PATH = os.environ.get("CORINE_STORE", os.path.join(_BASE, "corine_clc2018.gpkg"))
+STORE_LAYER = "corine"
+BOUNDARY_PATH = os.path.join(_BASE, "czech_esri_geometry.json")
+
+
+_boundary = None
+
+def load_boundary():
+    """Czechia outline as an ESRI polygon (read once)."""
+    global _boundary
+    if _boundary is None:
+        with open(BOUNDARY_PATH, "r") as f:
+            _boundary = json.load(f)
+    return _boundary
+
+def page_params(offset, geometry=None, page_size=PAGE_SIZE):
+    """Form fields of one ArcGIS query page (GeoJSON, WGS84, all attributes)."""
+    return {
+        "f": "geojson",
+        "geometry": json.dumps(geometry if geometry is not None else load_boundary()),
+        "geometryType": "esriGeometryPolygon",
+        "spatialRel": "esriSpatialRelIntersects",
+        "inSR": 4326,
+        "outSR": 4326,
+        "outFields": "*",
+        "returnGeometry": "true",
+        "resultOffset": offset,
+        "resultRecordCount": page_size,
+    }
+
+def make_session(concurrency=FETCH_CONCURRENCY):
+    """requests session whose connection pool keeps one connection per concurrent page."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=concurrency)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers["Content-Type"] = "application/x-www-form-urlencoded"
+    return session
+
+def fetch_page(session, url, offset, geometry=None, page_size=PAGE_SIZE,
+               retries=FETCH_RETRIES, backoff=FETCH_BACKOFF):
+    """
+    One page as decoded JSON. Connection errors, timeouts, 5xx/429 answers and ArcGIS
+    error bodies are retried after backoff, 2 * backoff, ... seconds; the last failure is raised.
+    """
+    data = page_params(offset, geometry, page_size)
+    for attempt in range(retries + 1):
+        try:
+            log.debug("Requesting offset %d", offset)
+            response = session.post(url, data=data, timeout=REQUEST_TIMEOUT)
+            response.raise_for_status()
+            page = response.json()
+            if "error" in page:
+                # ArcGIS reports failures as HTTP 200 with an error object
+                raise requests.RequestException(f"ArcGIS error at offset {offset}: {page['error']}")
+            return page
+        except (requests.RequestException, ValueError) as e:
+            status = getattr(getattr(e, "response", None), "status_code", None)
+            if attempt == retries or (status is not None and status < 500 and status != 429):
+                raise
+            time.sleep(backoff * 2 ** attempt)
+
+def iter_pages(url=CORINE_URL, geometry=None, page_size=PAGE_SIZE, concurrency=FETCH_CONCURRENCY,
+               session=None):
+    """
+    Yield the feature lists of consecutive offset pages, in order, with up to `concurrency`
+    requests in flight. The total is unknown up front, so pages are requested ahead
+    speculatively; once a page reports no exceededTransferLimit (or comes back short)
+    the pages queued behind it are dropped.
+    """
+    own_session = session is None
+    session = session or make_session(concurrency)
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+    pending = deque()
+    next_offset = 0
+    try:
+        while True:
+            while len(pending) < concurrency and next_offset <= MAX_OFFSET:
+                pending.append(executor.submit(fetch_page, session, url, next_offset, geometry, page_size))
+                next_offset += page_size
+            if not pending:
+                return
+            data = pending.popleft().result()
+            page = data.get("features", [])
+            yield page
+            # If server indicates no more data or fewer features than page_size returned, stop
+            if not data.get("exceededTransferLimit", False) or len(page) < page_size:
+                return
+    finally:
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=False)
+        if own_session:
+            session.close()
+
+def fetch_features(url=CORINE_URL, geometry=None, **kwargs):
+    """
+    All features of the query as one list (concurrent paging, see iter_pages).
+    Raises if a page still fails after its retries.
+    """
+    features = []
+    for page in iter_pages(url, geometry, **kwargs):
+        features.extend(page)
+    return features
+
+def stream_feature_collection(pages):
+    """
+    Encode an iterable of feature pages as a GeoJSON FeatureCollection, one chunk per
+    page, so the response starts before the last page has been fetched.
+    """
+    yield b'{"type": "FeatureCollection", "features": ['
+    first = True
+    for page in pages:
+        if not page:
+            continue
+        chunk = ", ".join(json.dumps(f) for f in page).encode()
+        yield chunk if first else b", " + chunk
+        first = False
+    yield b"]}"
+
+def read_feature_file(path):
+    """Features of a GeoJSON FeatureCollection file (e.g. a saved server response)."""
+    with open(path, "r") as f:
+        data = json.load(f)
+    return data["features"] if data.get("type") == "FeatureCollection" else [data]
+
+def write_store(features, path=STORE_PATH):
+    """
+    Write GeoJSON features (WGS84) to a GeoPackage; the feature ids are kept in a
+    feature_id column. Written to a temp file first so a running server never sees
+    a half-written store.
+    """
+    import geopandas as gpd
+
+    gdf = gpd.GeoDataFrame.from_features(features, crs="EPSG:4326")
+    gdf.insert(0, "feature_id", [f.get("id", i) for i, f in enumerate(features)])
+    root, ext = os.path.splitext(path)
+    tmp = f"{root}.{os.getpid()}.tmp{ext}"
+    gdf.to_file(tmp, layer=STORE_LAYER, driver="GPKG")
+    os.replace(tmp, path)
+    return len(gdf)
+
+
+def pixel_tolerance(zoom):
+    """Width of one 256 px web-map tile pixel at zoom, in degrees of longitude."""
+    return 360.0 / (256 * 2 ** zoom)
+
+def parse_classes(value):
+    """Code_18 filter from a request: "211", "21" (prefix) or a list of them; "" / None = all."""
+    if value is None or value == "":
+        return ()
+    values = [value] if isinstance(value, (str, int)) else value
+    return tuple(str(v).strip() for v in values if str(v).strip())
+
+
+class FeatureStore:
+    """
+    In-memory copy of the ingested store, indexed for viewport queries:
+    - tree: shapely STRtree over the full-precision geometries (bbox queries);
+    - simplified[z]: every geometry simplified to one pixel at zoom z, for z in ZOOM_LEVELS;
+    - properties / ids: each feature's attributes pre-serialised as JSON.
+    query() serialises only the features it returns, so the work scales with the viewport.
+    """
+
+    def __init__(self, gdf, path=None):
+        import shapely
+
+        self.gdf = gdf
+        self.path = path
+        self.mtime = os.path.getmtime(path) if path else None
+        self.geometries = np.asarray(gdf.geometry.values, dtype=object)
+        self.tree = shapely.STRtree(self.geometries)
+        # finest level first, each coarser one simplified from the previous copy (far fewer
+        # vertices; deviations add up to < 4/3 pixel). Plain Douglas-Peucker is ~4x faster than
+        # the topology-preserving variant, which is only used for polygons it collapses.
+        self.simplified = {}
+        current = self.geometries
+        for z in sorted(ZOOM_LEVELS, reverse=True):
+            simple = shapely.simplify(current, pixel_tolerance(z), preserve_topology=False)
+            collapsed = shapely.is_empty(simple) & ~shapely.is_empty(current)
+            if collapsed.any():
+                simple[collapsed] = shapely.simplify(current[collapsed], pixel_tolerance(z),
+                                                     preserve_topology=True)
+            self.simplified[z] = current = simple
+        codes = gdf["Code_18"].astype(str).to_numpy() if "Code_18" in gdf.columns else [""] * len(gdf)
+        self.codes = np.asarray(codes, dtype=str)
+        attrs = gdf.drop(columns=gdf.geometry.name)
+        attrs = attrs.astype(object).where(attrs.notna(), None)
+        self.properties = [json.dumps(r) for r in attrs.to_dict("records")]
+        self.ids = [json.dumps(i) for i in gdf.index.tolist()]
+        self._geojson = None
+
+    def __len__(self):
+        return len(self.gdf)
+
+    @property
+    def geojson(self):
+        """The whole store as one FeatureCollection (built on first use, then kept)."""
+        if self._geojson is None:
+            self._geojson = self.query()
+        return self._geojson
+
+    def select(self, bbox=None, classes=()):
+        """
+        Indices (ascending) of the features intersecting bbox = (south, west, north, east)
+        whose Code_18 starts with one of classes.
+        """
+        import shapely
+
+        if bbox is None:
+            idx = np.arange(len(self.gdf))
+        else:
+            south, west, north, east = (float(v) for v in bbox)
+            idx = np.sort(self.tree.query(shapely.box(west, south, east, north), predicate="intersects"))
+        if classes:
+            mask = np.zeros(len(idx), dtype=bool)
+            codes = self.codes[idx]
+            for c in classes:
+                mask |= np.char.startswith(codes, c)
+            idx = idx[mask]
+        return idx
+
+    def geometry_level(self, zoom):
+        """The coarsest simplified copy that is still finer than a pixel at zoom (None = full)."""
+        if zoom is None:
+            return None
+        finer = [z for z in ZOOM_LEVELS if z >= zoom]
+        return min(finer) if finer else None
+
+    def query(self, bbox=None, zoom=None, classes=()):
+        """GeoJSON FeatureCollection (bytes) of the selected features at the zoom's precision."""
+        import shapely
+
+        idx = self.select(bbox, classes)
+        level = self.geometry_level(zoom)
+        geoms = (self.geometries if level is None else self.simplified[level])[idx]
+        geojson = shapely.to_geojson(geoms) if len(idx) else []
+        features = ",".join(
+            f'{{"type": "Feature", "id": {self.ids[i]}, "geometry": {g}, "properties": {self.properties[i]}}}'
+            for i, g in zip(idx.tolist(), geojson)
+        )
+        return f'{{"type": "FeatureCollection", "features": [{features}]}}'.encode()
+
+
+_store = None
+_store_lock = threading.Lock()
+
+def load_store(path=None):
+    """
+    The FeatureStore for path (default STORE_PATH), loaded on first use and reloaded
+    when the file is re-ingested. None if no store has been built.
+    """
+    global _store
+    path = path or STORE_PATH
+    if not os.path.exists(path):
+        return None
+    with _store_lock:
+        if _store is None or _store.path != path or _store.mtime != os.path.getmtime(path):
+            import geopandas as gpd
+
+            gdf = gpd.read_file(path, layer=STORE_LAYER)
+            gdf = gdf.set_index("feature_id")
+            gdf.index.name = None
+            _store = FeatureStore(gdf, path)
+        return _store
@@ -0,0 +1,156 @@
+"""
+costlayers.py - per-layer cost stack and query-time layer weights.
+
+models/prepare_rasters.py stores the scored layers that make up final_grid.npy (CORINE,
+Natura 2000, ZABAGED, ...) as one stacked array, final_grid_layers.npy of shape
+(layers, rows, cols) (int16 while all scores are whole numbers), with final_grid_layers.json
+listing the layer names and the digest of the routing grid they add up to. The stack is
+memory-mapped read-only.
+
+A request can weight the layers ({"natura": 2, "zabaged": 0.5}, missing layers keep 1).
+A weight scales its layer's score: 0 drops the layer, 2 doubles its effect. Penalty layers
+(positive scores) get dearer as their weight grows and bonus layers (negative scores, e.g.
+ZABAGED corridors) get cheaper, so raising a weight never lowers the cost of a cell the
+layer penalises nor raises the cost of a cell it favours. The weighted cost grid is
+sum(w_k * layer_k), summed in float32 and converted like the routing grid
+(gridsearch.routing_costs: negative sums clamp to 0), so all-ones weights reproduce it bit
+for bit. It is filled lazily in TILE x TILE blocks: a search only computes the blocks of
+its window.
+Weighted grids are kept per weight vector in an LRU of CACHE_SIZE entries, so repeated
+profiles reuse the blocks computed before them.
+"""
+
+import json
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from gridsearch import corridor_window, routing_costs
+
+TILE = 64          # block side in cells computed at once
+CACHE_SIZE = 8     # weighted grids kept (least recently used are dropped)
+
+
+class WeightedGrid:
+    """Routing grid of one weight vector, computed block by block on demand."""
+
+    def __init__(self, layers, weights, tile=TILE):
+        self.layers = layers
+        self.weights = tuple(float(w) for w in weights)
+        self.tile = tile
+        rows, cols = layers.shape[1:]
+        self.grid = np.zeros((rows, cols), dtype=np.uint16)
+        self.done = np.zeros((-(-rows // tile), -(-cols // tile)), dtype=np.bool_)
+        self._lock = threading.Lock()
+
+    @property
+    def shape(self):
+        return self.grid.shape
+
+    def ensure(self, r_lo, r_hi, c_lo, c_hi):
+        """Compute the blocks overlapping rows r_lo:r_hi, cols c_lo:c_hi; returns the full grid."""
+        t = self.tile
+        tr_lo, tr_hi, tc_lo, tc_hi = r_lo // t, -(-r_hi // t), c_lo // t, -(-c_hi // t)
+        with self._lock:
+            if self.done[tr_lo:tr_hi, tc_lo:tc_hi].all():
+                return self.grid
+            # one vectorised pass over each run of missing blocks in a block row
+            for tr in range(tr_lo, tr_hi):
+                missing = np.flatnonzero(~self.done[tr, tc_lo:tc_hi]) + tc_lo
+                if not len(missing):
+                    continue
+                for run in np.split(missing, np.flatnonzero(np.diff(missing) > 1) + 1):
+                    rows = slice(tr * t, (tr + 1) * t)
+                    cols = slice(int(run[0]) * t, (int(run[-1]) + 1) * t)
+                    self.grid[rows, cols] = self._weighted(rows, cols)
+                    self.done[tr, run] = True
+        return self.grid
+
+    def ensure_window(self, start_rc, goal_rc, margin):
+        """ensure() for the bounding box of start/goal grown by margin cells."""
+        return self.ensure(*corridor_window(self.shape, start_rc, goal_rc, margin))
+
+    def ensure_all(self):
+        return self.ensure(0, self.shape[0], 0, self.shape[1])
+
+    def _weighted(self, rows, cols):
+        total = np.zeros(self.grid[rows, cols].shape, dtype=np.float32)
+        for w, layer in zip(self.weights, self.layers):
+            if w:
+                total += np.float32(w) * layer[rows, cols]
+        return routing_costs(total)
+
+
+class LayerStack:
+    """The memory-mapped layer stack plus an LRU of weighted grids."""
+
+    def __init__(self, layers, names, cache_size=CACHE_SIZE):
+        self.layers = layers
+        self.names = list(names)
+        self.cache_size = cache_size
+        self._grids = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def weight_vector(self, weights):
+        """
+        Tuple of one weight per layer from {"name": w} (missing = 1) or a list in layer
+        order. Raises ValueError for unknown layers, wrong lengths or negative weights.
+        """
+        if isinstance(weights, dict):
+            unknown = sorted(set(weights) - set(self.names))
+            if unknown:
+                raise ValueError(f"Unknown cost layers {unknown} (expected some of {self.names})")
+            vector = [weights.get(name, 1) for name in self.names]
+        else:
+            vector = list(weights)
+            if len(vector) != len(self.names):
+                raise ValueError(f"Expected {len(self.names)} weights ({', '.join(self.names)})")
+        try:
+            vector = tuple(round(float(w), 6) for w in vector)
+        except (TypeError, ValueError):
+            raise ValueError("Layer weights must be numbers")
+        if any(not np.isfinite(w) or w < 0 for w in vector):
+            raise ValueError("Layer weights must be finite and non-negative")
+        return vector
+
+    def grid(self, weights):
+        """WeightedGrid for weights, or None when they are all 1 (the stored routing grid)."""
+        vector = self.weight_vector(weights)
+        if all(w == 1 for w in vector):
+            return None
+        with self._lock:
+            grid = self._grids.get(vector)
+            if grid is not None:
+                self._grids.move_to_end(vector)
+                self.hits += 1
+                return grid
+            self.misses += 1
+            grid = self._grids[vector] = WeightedGrid(self.layers, vector)
+            while len(self._grids) > self.cache_size:
+                self._grids.popitem(last=False)
+            return grid
+
+    def stats(self):
+        with self._lock:
+            return {"layers": self.names, "cached": len(self._grids), "hits": self.hits, "misses": self.misses}
+
+
+def load_layer_stack(prefix, digest):
+    """
+    LayerStack from prefix.npy / prefix.json, or None when it has not been built or adds up
+    to another grid than the one with this digest (gridsearch.grid_digest).
+    """
+    try:
+        with open(prefix + ".json") as fh:
+            meta = json.load(fh)
+        if meta.get("digest") != digest:
+            return None
+        layers = np.load(prefix + ".npy", mmap_mode="r")
+    except (OSError, ValueError):
+        return None
+    if layers.ndim != 3 or layers.shape[0] != len(meta["layers"]):
+        return None
+    return LayerStack(layers, meta["layers"])
@@ -0,0 +1,94 @@
+"""
+Local stand-in for the EEA ArcGIS query endpoint (corine.CORINE_URL).
+
+Serves the features of a GeoJSON file with the server's paging behaviour: POST form
+fields resultOffset / resultRecordCount select a page and "exceededTransferLimit": true
+is set while more features follow. Optional per-page latency and injected failures
+(every n-th request answers 503) make the fetcher's concurrency and retries observable.
+
+Usage: python arcgis_standin.py [features.geojson] [port] [latency_s]
+       then point corine.fetch_features / iter_pages at http://127.0.0.1:<port>/query
+In code: server, url = serve(features, latency=0.2); ...; server.shutdown()
+server.RequestHandlerClass.counter has the request and 503 counts and the peak number in flight.
+"""
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+SAMPLE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "corine_sample.geojson")
+
+
+def make_handler(features, latency=0.0, fail_every=0):
+    # requests so far, 503s sent, requests being answered now and the most at once
+    counter = {"requests": 0, "failed": 0, "in_flight": 0, "peak": 0}
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive, like the real server
+        disable_nagle_algorithm = True  # headers and body go out as separate writes
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            form = parse_qs(self.rfile.read(length).decode())
+            with lock:
+                counter["requests"] += 1
+                counter["in_flight"] += 1
+                counter["peak"] = max(counter["peak"], counter["in_flight"])
+                n = counter["requests"]
+            try:
+                self._answer(form, n)
+            finally:
+                with lock:
+                    counter["in_flight"] -= 1
+
+        def _answer(self, form, n):
+            if latency:
+                time.sleep(latency)
+            if fail_every and n % fail_every == 0:
+                with lock:
+                    counter["failed"] += 1
+                self._send(503, b'{"error": "busy"}')
+                return
+            offset = int(form.get("resultOffset", ["0"])[0])
+            count = int(form.get("resultRecordCount", ["1000"])[0])
+            page = features[offset:offset + count]
+            body = {"type": "FeatureCollection", "features": page}
+            if offset + count < len(features):
+                body["exceededTransferLimit"] = True
+            self._send(200, json.dumps(body).encode())
+
+        def _send(self, status, body):
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    Handler.counter = counter
+    return Handler
+
+
+def serve(features, port=0, latency=0.0, fail_every=0):
+    """Start the stand-in on a background thread; returns (server, query_url)."""
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(features, latency, fail_every))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/query"
+
+
+if __name__ == "__main__":
+    path = sys.argv[1] if len(sys.argv) > 1 else SAMPLE
+    port = int(sys.argv[2]) if len(sys.argv) > 2 else 8765
+    latency = float(sys.argv[3]) if len(sys.argv) > 3 else 0.0
+    with open(path) as f:
+        features = json.load(f)["features"]
+    server, url = serve(features, port, latency)
+    print(f"Serving {len(features)} features at {url}")
+    threading.Event().wait()
@@ -0,0 +1,1084 @@
+"""
+gridsearch.py - Compiled flat-index search kernels for the cost grid.
+
+The grid is treated as a flat array of cell costs (index = row * cols + col) so the
+kernels never build (r, c) tuples or read NumPy scalars one at a time from Python.
+The open set is an indexed binary heap stored in preallocated int arrays, which gives
+decrease-key instead of pushing duplicate tuples onto heapq.
+
+Search buffers live in a per-thread SearchWorkspace and are reused between calls. Every
+per-cell array is only valid where stamp[i] == the current generation, so starting a new
+search is a counter increment instead of refilling ~20 MB of arrays.
+
+Kernels are compiled with numba when it is installed. Without numba the same code runs
+as plain Python (correct, but much slower than plan.a_star_numpy_grid), so plan.py only
+picks the "flat" backend by default when HAVE_NUMBA is True.
+
+With the default Manhattan heuristic, ordering matches plan.a_star_numpy_grid exactly:
+heap keys are (f, push counter), the neighbour order is up/down/left/right and closed
+cells still get their g/parent updated. The returned paths are therefore the same cells,
+not just the same cost. Landmark tables (landmarks.py) swap in the ALT heuristic; closed
+cells are then reopened when improved, so those paths are cost-optimal.
+
+The A* kernel takes a control vector (CTL_*) that it updates every CHECK_INTERVAL
+expansions with the nodes expanded so far and the current best f, and it stops when
+control[CTL_CANCEL] is set (SearchCancelled). The kernel runs without the GIL, so
+another thread can watch the progress and request the cancel while it searches.
+"""
+
+import hashlib
+import threading
+import time
+
+import numpy as np
+
+try:
+    from numba import njit
+    HAVE_NUMBA = True
+except ImportError:  # pragma: no cover - depends on the deployment image
+    HAVE_NUMBA = False
+
+    def njit(*args, **kwargs):
+        # bare @njit or @njit(...) both return the plain Python function
+        if len(args) == 1 and callable(args[0]) and not kwargs:
+            return args[0]
+        return lambda fn: fn
+
+INF_COST = np.iinfo(np.int64).max
+
+# corridor vector layout: [r0, c0, dr, dc, limit]; limit < 0 means "no corridor"
+NO_CORRIDOR = np.array([0.0, 0.0, 0.0, 0.0, -1.0])
+
+# cell state stored in pos[] for stamped cells: >= 0 heap slot, -1 not queued, -2 closed
+_CLOSED = -2
+COST_MAX = np.iinfo(np.uint16).max  # dearest routing cost of a cell
+_GEN_LIMIT = np.iinfo(np.int32).max
+
+# landmark tables: uint16 value reserved for "landmark cannot reach / be reached"
+LM_UNREACHED = np.iinfo(np.uint16).max
+# empty (cells x 0) tables make the kernels fall back to the Manhattan heuristic
+NO_LANDMARKS = (np.zeros((1, 0), dtype=np.uint16), np.zeros((1, 0), dtype=np.uint16),
+                np.zeros(0, dtype=np.int64))
+_NO_SEEDS = np.zeros(0, dtype=np.int64)
+# landmark frame: [row offset, col offset, full-grid cols] mapping window cells to table rows
+
+# kernel stats vector layout
+STAT_EXPANDED, STAT_TOUCHED, STAT_PEAK_HEAP, STAT_PUSHES = range(4)
+DIR_NONE = 255  # direction code of a cell without successor (target / unreachable)
+
+# control vector layout: cumulative expanded cells and top-of-heap f written by the
+# kernel at each checkpoint, cancel flag written by the caller
+CTL_EXPANDED, CTL_BEST_F, CTL_CANCEL = range(3)
+CHECK_INTERVAL = 4096   # expansions between checkpoints
+_CANCELLED = -2         # astar_kernel result when stopped via CTL_CANCEL
+
+
+class SearchCancelled(Exception):
+    """Raised when a search stops at a checkpoint because its control vector was cancelled."""
+
+
+def new_control():
+    """Fresh control vector for a_star_flat / a_star_widening (and plan.a_star_numpy_grid)."""
+    return np.zeros(3, dtype=np.int64)
+
+
+# ------------- helpers -------------
+def corridor_params(start_rc, goal_rc, width):
+    """
+    Pack the corridor test used by plan.make_corridor_mask into a small float vector
+    so the kernel can evaluate it per cell instead of reading a full-grid mask.
+    """
+    if width is None:
+        return NO_CORRIDOR
+    r0, c0 = start_rc
+    r1, c1 = goal_rc
+    dr = r1 - r0
+    dc = c1 - c0
+    limit = width * np.sqrt(dr * dr + dc * dc)
+    return np.array([r0, c0, dr, dc, limit], dtype=np.float64)
+
+
+def grid_digest(grid):
+    """Stable fingerprint of a cost grid (shape, dtype and contents)."""
+    h = hashlib.sha1()
+    h.update(str((grid.shape, str(grid.dtype))).encode())
+    h.update(np.ascontiguousarray(grid).tobytes())
+    return h.hexdigest()
+
+
+def routing_costs(scores):
+    """
+    uint16 routing costs of a float score grid (final_grid.npy, weighted layer sums).
+    Negative scores - bonus layers such as ZABAGED corridors - make a cell cheaper down to
+    a floor of 0 (free), never expensive; scores beyond the uint16 range are capped.
+    Fractions are truncated, so whole-number scores are kept exactly.
+    """
+    return np.clip(scores, 0, COST_MAX).astype(np.uint16)
+
+
+def pick_cost_dtype(grid):
+    """
+    Smallest dtype that can hold any g/f value on this grid: int32 when
+    max_cost * cells + rows + cols fits, otherwise int64.
+    """
+    rows, cols = grid.shape
+    bound = int(grid.max()) * rows * cols + rows + cols
+    return np.dtype(np.int32) if bound < np.iinfo(np.int32).max else np.dtype(np.int64)
+
+
+# ------------- reusable workspaces -------------
+class SearchWorkspace:
+    """
+    Flat search buffers for up to n cells, reused across searches (any grid or window
+    of at most n cells can use them). Arrays are allocated with np.empty/np.zeros, so
+    pages the searches never touch are never committed by the OS.
+    """
+
+    def __init__(self, n, cost_dtype):
+        self.n = n
+        self.cost_dtype = np.dtype(cost_dtype)
+        self.stamp = np.zeros(n, dtype=np.int32)
+        self.g = np.empty(n, dtype=self.cost_dtype)
+        self.parent = np.empty(n, dtype=np.int32)
+        self.pos = np.empty(n, dtype=np.int32)
+        self.heap = np.empty(n, dtype=np.int32)
+        self.heap_f = np.empty(n, dtype=self.cost_dtype)
+        self.heap_seq = np.empty(n, dtype=np.int32)
+        self.gen = 0
+        self.searches = 0
+
+    def next_generation(self):
+        """Invalidate every cell in O(1); only refills stamps once per 2**31 searches."""
+        self.gen += 1
+        if self.gen >= _GEN_LIMIT:
+            self.stamp.fill(0)
+            self.gen = 1
+        self.searches += 1
+        return self.gen
+
+    @property
+    def cell_bytes(self):
+        """Bytes of per-cell state for one touched cell."""
+        return (self.stamp.itemsize + self.g.itemsize + self.parent.itemsize
+                + self.pos.itemsize)
+
+    @property
+    def heap_entry_bytes(self):
+        return self.heap.itemsize + self.heap_f.itemsize + self.heap_seq.itemsize
+
+    @property
+    def nbytes(self):
+        return self.n * (self.cell_bytes + self.heap_entry_bytes)
+
+
+_local = threading.local()
+
+
+def get_workspace(n, cost_dtype, slot=0):
+    """
+    Return this thread's workspace for searches over n cells with the given cost dtype,
+    allocating it on first use and growing it (by at least 1.5x) when n no longer fits.
+    slot: searches that need several workspaces at once (bidirectional) use slots 0, 1, ...
+    """
+    key = (np.dtype(cost_dtype), slot)
+    pool = getattr(_local, "workspaces", None)
+    if pool is None:
+        pool = _local.workspaces = {}
+    ws = pool.get(key)
+    if ws is None or ws.n < n:
+        ws = SearchWorkspace(max(n, int(ws.n * 1.5)) if ws is not None else n, key[0])
+        pool[key] = ws
+    return ws
+
+
+# ------------- indexed binary heap (keys: f, seq) -------------
+@njit(cache=True)
+def _sift_up(heap, heap_f, heap_seq, pos, i):
+    node = heap[i]
+    fk = heap_f[i]
+    sk = heap_seq[i]
+    while i > 0:
+        p = (i - 1) >> 1
+        if heap_f[p] < fk or (heap_f[p] == fk and heap_seq[p] < sk):
+            break
+        heap[i] = heap[p]
+        heap_f[i] = heap_f[p]
+        heap_seq[i] = heap_seq[p]
+        pos[heap[i]] = i
+        i = p
+    heap[i] = node
+    heap_f[i] = fk
+    heap_seq[i] = sk
+    pos[node] = i
+
+
+@njit(cache=True)
+def _sift_down(heap, heap_f, heap_seq, pos, i, size):
+    node = heap[i]
+    fk = heap_f[i]
+    sk = heap_seq[i]
+    while True:
+        child = 2 * i + 1
+        if child >= size:
+            break
+        right = child + 1
+        if right < size and (heap_f[right] < heap_f[child] or
+                             (heap_f[right] == heap_f[child] and heap_seq[right] < heap_seq[child])):
+            child = right
+        if fk < heap_f[child] or (fk == heap_f[child] and sk < heap_seq[child]):
+            break
+        heap[i] = heap[child]
+        heap_f[i] = heap_f[child]
+        heap_seq[i] = heap_seq[child]
+        pos[heap[i]] = i
+        i = child
+    heap[i] = node
+    heap_f[i] = fk
+    heap_seq[i] = sk
+    pos[node] = i
+
+
+@njit(cache=True)
+def _heap_pop(heap, heap_f, heap_seq, pos, size):
+    node = heap[0]
+    size -= 1
+    if size > 0:
+        heap[0] = heap[size]
+        heap_f[0] = heap_f[size]
+        heap_seq[0] = heap_seq[size]
+        _sift_down(heap, heap_f, heap_seq, pos, 0, size)
+    return node, size
+
+
+# ------------- A* kernel -------------
+@njit(cache=True)
+def _heuristic(lm_fwd, lm_rev, lm_scale, lm_frame, r, c, gr, gc):
+    """
+    Manhattan distance without landmark tables, otherwise the ALT bound
+    max_k(d(L,goal) - d(L,v), d(v,L) - d(goal,L)) on the quantised tables.
+    Quantised values are floors, so each difference is reduced by one step
+    to stay a lower bound. (r, c) are search-local; lm_frame maps them to table rows.
+    """
+    k_count = lm_fwd.shape[1]
+    if k_count == 0:
+        return abs(r - gr) + abs(c - gc)
+    v = (r + lm_frame[0]) * lm_frame[2] + c + lm_frame[1]
+    goal = (gr + lm_frame[0]) * lm_frame[2] + gc + lm_frame[1]
+    h = 0
+    for k in range(k_count):
+        a = lm_fwd[goal, k]
+        b = lm_fwd[v, k]
+        if a != LM_UNREACHED and b != LM_UNREACHED:
+            d = (np.int64(a) - np.int64(b) - 1) * lm_scale[k]
+            if d > h:
+                h = d
+        a = lm_rev[v, k]
+        b = lm_rev[goal, k]
+        if a != LM_UNREACHED and b != LM_UNREACHED:
+            d = (np.int64(a) - np.int64(b) - 1) * lm_scale[k_count + k]
+            if d > h:
+                h = d
+    return h
+
+
+@njit(cache=True)
+def _in_corridor(corridor, r, c):
+    if corridor[4] < 0:
+        return True
+    num = abs(corridor[2] * (c - corridor[1]) - corridor[3] * (r - corridor[0]))
+    return num <= corridor[4]
+
+
+@njit(cache=True, nogil=True)
+def astar_kernel(costs, rows, cols, start, goal, corridor, lm_fwd, lm_rev, lm_scale, lm_frame,
+                 seeds, stamp, gen, g, parent, pos, heap, heap_f, heap_seq, stats, control):
+    """
+    A* over flat cell indices; heuristic from _heuristic (Manhattan or landmarks).
+    Per-cell arrays are only read where stamp == gen, so they never need resetting.
+    seeds: empty for a fresh search. Otherwise the search resumes the state left in
+    the arrays by a previous call of the same generation (e.g. with a narrower
+    corridor): the seed cells are re-queued with their g, closed cells are reopened
+    when improved and the search stops once no queued f can beat g[goal].
+    Fills stats (see STAT_*; STAT_PUSHES carries the push counter between calls) and
+    returns the number of expanded cells, or -1 if the goal was not reached, or
+    _CANCELLED if control[CTL_CANCEL] was set at a checkpoint. control[CTL_EXPANDED]
+    accumulates over calls.
+    """
+    gr = goal // cols
+    gc = goal - gr * cols
+    resume = seeds.shape[0] > 0
+    reopen = resume or lm_fwd.shape[1] > 0
+    expanded = 0
+
+    if not resume:
+        sr = start // cols
+        sc = start - sr * cols
+        stamp[start] = gen
+        g[start] = 0
+        parent[start] = -1
+        heap[0] = start
+        heap_f[0] = _heuristic(lm_fwd, lm_rev, lm_scale, lm_frame, sr, sc, gr, gc)
+        heap_seq[0] = 0
+        pos[start] = 0
+        counter = 1
+        size = 1
+        touched = 1
+    else:
+        counter = stats[STAT_PUSHES]
+        size = 0
+        touched = 0
+        for s in seeds:
+            r = s // cols
+            c = s - r * cols
+            heap[size] = s
+            heap_f[size] = g[s] + _heuristic(lm_fwd, lm_rev, lm_scale, lm_frame, r, c, gr, gc)
+            heap_seq[size] = counter
+            pos[s] = size
+            counter += 1
+            size += 1
+            _sift_up(heap, heap_f, heap_seq, pos, size - 1)
+    peak = size
+    reported = 0
+    countdown = CHECK_INTERVAL
+    cancelled = False
+
+    while size > 0:
+        if resume and stamp[goal] == gen and pos[goal] == _CLOSED and heap_f[0] >= g[goal]:
+            break
+        countdown -= 1
+        if countdown == 0:
+            countdown = CHECK_INTERVAL
+            control[CTL_EXPANDED] += expanded - reported
+            reported = expanded
+            control[CTL_BEST_F] = heap_f[0]
+            if control[CTL_CANCEL] != 0:
+                cancelled = True
+                break
+        node, size = _heap_pop(heap, heap_f, heap_seq, pos, size)
+        pos[node] = _CLOSED
+        expanded += 1
+        if node == goal:
+            break
+
+        r = node // cols
+        c = node - r * cols
+        gnode = np.int64(g[node])
+        for k in range(4):
+            if k == 0:
+                if r == 0:
+                    continue
+                nr = r - 1
+                nc = c
+            elif k == 1:
+                if r == rows - 1:
+                    continue
+                nr = r + 1
+                nc = c
+            elif k == 2:
+                if c == 0:
+                    continue
+                nr = r
+                nc = c - 1
+            else:
+                if c == cols - 1:
+                    continue
+                nr = r
+                nc = c + 1
+            if not _in_corridor(corridor, nr, nc):
+                continue
+            nb = nr * cols + nc
+            tentative = gnode + np.int64(costs[nb])
+            if stamp[nb] != gen:
+                stamp[nb] = gen
+                pos[nb] = -1
+                touched += 1
+            elif tentative >= g[nb]:
+                continue
+            g[nb] = tentative
+            parent[nb] = node
+            if pos[nb] == _CLOSED:
+                if not reopen:
+                    # the reference loop pushes a stale entry here that is skipped on pop
+                    counter += 1
+                    continue
+                # quantised ALT bounds are admissible but not consistent, and a resumed
+                # search corrects earlier labels: reopen
+                pos[nb] = -1
+            if pos[nb] < 0:
+                heap[size] = nb
+                pos[nb] = size
+                size += 1
+                if size > peak:
+                    peak = size
+            i = pos[nb]
+            heap_f[i] = tentative + _heuristic(lm_fwd, lm_rev, lm_scale, lm_frame, nr, nc, gr, gc)
+            heap_seq[i] = counter
+            counter += 1
+            _sift_up(heap, heap_f, heap_seq, pos, i)
+
+    stats[STAT_EXPANDED] = expanded
+    stats[STAT_TOUCHED] = touched
+    stats[STAT_PEAK_HEAP] = peak
+    stats[STAT_PUSHES] = counter
+    control[CTL_EXPANDED] += expanded - reported
+    if cancelled:
+        return _CANCELLED
+    if stamp[goal] == gen and pos[goal] == _CLOSED:
+        return expanded
+    return -1
+
+
+@njit(cache=True)
+def trace_path(parent, start, goal):
+    """Follow parent pointers from goal back to start; returns flat indices start..goal."""
+    n = 1
+    cur = goal
+    while cur != start and parent[cur] != -1 and n <= parent.shape[0]:
+        cur = parent[cur]
+        n += 1
+    out = np.empty(n, dtype=np.int64)
+    cur = goal
+    for i in range(n - 1, -1, -1):
+        out[i] = cur
+        cur = parent[cur]
+    return out
+
+
+@njit(cache=True)
+def trace_directions(direction, cols, start, goal):
+    """
+    Walk a predecessor field stored as direction codes (0 up, 1 down, 2 left, 3 right,
+    DIR_NONE = no successor) from start until goal. Returns flat indices start..goal,
+    or an empty array if the walk dead-ends.
+    """
+    n = direction.shape[0]
+    out = np.empty(16, dtype=np.int64)
+    size = 0
+    cur = start
+    while True:
+        if size == out.shape[0]:
+            grown = np.empty(size * 2, dtype=np.int64)
+            grown[:size] = out
+            out = grown
+        out[size] = cur
+        size += 1
+        if cur == goal:
+            return out[:size]
+        d = direction[cur]
+        if d == 0:
+            cur -= cols
+        elif d == 1:
+            cur += cols
+        elif d == 2:
+            cur -= 1
+        elif d == 3:
+            cur += 1
+        else:
+            return out[:0]
+        if size > n:
+            return out[:0]
+
+
+@njit(cache=True)
+def simplify_kernel(pts, tolerance, keep):
+    """
+    Douglas-Peucker over float64 (N, 2) points with an explicit stack; sets keep[i] for
+    the retained vertices (endpoints included). Deviation is the perpendicular distance
+    to the chord, or the distance to its start when the chord is a single point.
+    """
+    n = pts.shape[0]
+    keep[0] = True
+    keep[n - 1] = True
+    stack = np.empty((n, 2), dtype=np.int64)
+    top = 0
+    stack[0, 0] = 0
+    stack[0, 1] = n - 1
+    top = 1
+    while top > 0:
+        top -= 1
+        i = stack[top, 0]
+        j = stack[top, 1]
+        if j - i < 2:
+            continue
+        sr = pts[j, 0] - pts[i, 0]
+        sc = pts[j, 1] - pts[i, 1]
+        norm = np.sqrt(sr * sr + sc * sc)
+        best = -1.0
+        m = i
+        for k in range(i + 1, j):
+            rr = pts[k, 0] - pts[i, 0]
+            rc = pts[k, 1] - pts[i, 1]
+            if norm == 0.0:
+                d = np.sqrt(rr * rr + rc * rc)
+            else:
+                d = abs(sr * rc - sc * rr) / norm
+            if d > best:
+                best = d
+                m = k
+        if best > tolerance + 1e-9:
+            keep[m] = True
+            stack[top, 0] = i
+            stack[top, 1] = m
+            stack[top + 1, 0] = m
+            stack[top + 1, 1] = j
+            top += 2
+
+
+@njit(cache=True)
+def dijkstra_kernel(costs, rows, cols, sources, box, reverse, targets,
+                    stamp, gen, g, parent, pos, heap, heap_f, heap_seq, stats):
+    """
+    Multi-source Dijkstra over flat cell indices, limited to box = [r_lo, r_hi, c_lo, c_hi)
+    (half-open). Moving into a cell costs that cell's value; with reverse=True the
+    search runs on the reversed graph, so g[x] is the cost from x *to* the sources.
+    targets: sorted unique flat indices; the search stops once all are settled
+    (empty array = settle the whole box). Returns the number of settled cells.
+    """
+    r_lo = box[0]
+    r_hi = box[1]
+    c_lo = box[2]
+    c_hi = box[3]
+    counter = 0
+    size = 0
+    touched = 0
+    peak = 0
+    for s in sources:
+        if stamp[s] == gen:
+            continue
+        stamp[s] = gen
+        g[s] = 0
+        parent[s] = -1
+        heap[size] = s
+        heap_f[size] = 0
+        heap_seq[size] = counter
+        pos[s] = size
+        counter += 1
+        size += 1
+        touched += 1
+    peak = size
+    remaining = targets.shape[0]
+    expanded = 0
+
+    while size > 0:
+        node, size = _heap_pop(heap, heap_f, heap_seq, pos, size)
+        pos[node] = _CLOSED
+        expanded += 1
+        if remaining > 0:
+            t = np.searchsorted(targets, node)
+            if t < targets.shape[0] and targets[t] == node:
+                remaining -= 1
+                if remaining == 0:
+                    break
+
+        r = node // cols
+        c = node - r * cols
+        gnode = np.int64(g[node])
+        for k in range(4):
+            if k == 0:
+                nr = r - 1
+                nc = c
+            elif k == 1:
+                nr = r + 1
+                nc = c
+            elif k == 2:
+                nr = r
+                nc = c - 1
+            else:
+                nr = r
+                nc = c + 1
+            if nr < r_lo or nr >= r_hi or nc < c_lo or nc >= c_hi:
+                continue
+            nb = nr * cols + nc
+            if reverse:
+                tentative = gnode + np.int64(costs[node])
+            else:
+                tentative = gnode + np.int64(costs[nb])
+            if stamp[nb] != gen:
+                stamp[nb] = gen
+                pos[nb] = -1
+                touched += 1
+            elif pos[nb] == _CLOSED or tentative >= g[nb]:
+                continue
+            g[nb] = tentative
+            parent[nb] = node
+            if pos[nb] < 0:
+                heap[size] = nb
+                pos[nb] = size
+                size += 1
+                if size > peak:
+                    peak = size
+            i = pos[nb]
+            heap_f[i] = tentative
+            heap_seq[i] = counter
+            counter += 1
+            _sift_up(heap, heap_f, heap_seq, pos, i)
+
+    stats[STAT_EXPANDED] = expanded
+    stats[STAT_TOUCHED] = touched
+    stats[STAT_PEAK_HEAP] = peak
+    stats[STAT_PUSHES] = counter
+    return expanded
+
+
+@njit(cache=True)
+def _expand_side(costs, rows, cols, corridor, backward, node,
+                 stamp, gen, g, parent, pos, heap, heap_f, heap_seq, size, counter,
+                 o_stamp, o_gen, o_g, mu, meet):
+    """
+    Relax the neighbours of node for one side of the bidirectional search.
+    Forward moves pay the entered cell, backward moves pay the cell being left.
+    Returns (size, counter, touched, mu, meet) with mu/meet updated on contact.
+    """
+    r = node // cols
+    c = node - r * cols
+    gnode = np.int64(g[node])
+    touched = 0
+    for k in range(4):
+        if k == 0:
+            if r == 0:
+                continue
+            nr = r - 1
+            nc = c
+        elif k == 1:
+            if r == rows - 1:
+                continue
+            nr = r + 1
+            nc = c
+        elif k == 2:
+            if c == 0:
+                continue
+            nr = r
+            nc = c - 1
+        else:
+            if c == cols - 1:
+                continue
+            nr = r
+            nc = c + 1
+        if not _in_corridor(corridor, nr, nc):
+            continue
+        nb = nr * cols + nc
+        if backward:
+            tentative = gnode + np.int64(costs[node])
+        else:
+            tentative = gnode + np.int64(costs[nb])
+        if stamp[nb] != gen:
+            stamp[nb] = gen
+            pos[nb] = -1
+            touched += 1
+        elif pos[nb] == _CLOSED or tentative >= g[nb]:
+            continue
+        g[nb] = tentative
+        parent[nb] = node
+        if o_stamp[nb] == o_gen and tentative + o_g[nb] < mu:
+            mu = tentative + o_g[nb]
+            meet = nb
+        if pos[nb] < 0:
+            heap[size] = nb
+            pos[nb] = size
+            size += 1
+        i = pos[nb]
+        heap_f[i] = tentative
+        heap_seq[i] = counter
+        counter += 1
+        _sift_up(heap, heap_f, heap_seq, pos, i)
+    return size, counter, touched, mu, meet
+
+
+@njit(cache=True)
+def bidir_kernel(costs, rows, cols, start, goal, corridor,
+                 f_stamp, f_gen, f_g, f_parent, f_pos, f_heap, f_heap_f, f_heap_seq,
+                 b_stamp, b_gen, b_g, b_parent, b_pos, b_heap, b_heap_f, b_heap_seq, stats):
+    """
+    Bidirectional Dijkstra: forward from start, backward (reversed moves) from goal,
+    always expanding the side with the smaller queue top. mu is the best
+    start -> v -> goal cost seen at any contact; the search stops once
+    top_forward + top_backward >= mu, which makes mu optimal.
+    Returns the meeting cell (path = forward parents to start + backward parents to
+    goal), or -1 if the two searches never met.
+    """
+    for side in range(2):
+        if side == 0:
+            cell, stamp, gen, g, parent, pos = start, f_stamp, f_gen, f_g, f_parent, f_pos
+            heap, heap_f, heap_seq = f_heap, f_heap_f, f_heap_seq
+        else:
+            cell, stamp, gen, g, parent, pos = goal, b_stamp, b_gen, b_g, b_parent, b_pos
+            heap, heap_f, heap_seq = b_heap, b_heap_f, b_heap_seq
+        stamp[cell] = gen
+        g[cell] = 0
+        parent[cell] = -1
+        heap[0] = cell
+        heap_f[0] = 0
+        heap_seq[0] = 0
+        pos[cell] = 0
+
+    f_size = 1
+    b_size = 1
+    f_counter = 1
+    b_counter = 1
+    mu = INF_COST
+    meet = -1
+    expanded = 0
+    touched = 2
+    peak = 2
+    while f_size > 0 and b_size > 0:
+        if np.int64(f_heap_f[0]) + np.int64(b_heap_f[0]) >= mu:
+            break
+        expanded += 1
+        if f_heap_f[0] <= b_heap_f[0]:
+            node, f_size = _heap_pop(f_heap, f_heap_f, f_heap_seq, f_pos, f_size)
+            f_pos[node] = _CLOSED
+            f_size, f_counter, t, mu, meet = _expand_side(
+                costs, rows, cols, corridor, False, node,
+                f_stamp, f_gen, f_g, f_parent, f_pos, f_heap, f_heap_f, f_heap_seq,
+                f_size, f_counter, b_stamp, b_gen, b_g, mu, meet)
+        else:
+            node, b_size = _heap_pop(b_heap, b_heap_f, b_heap_seq, b_pos, b_size)
+            b_pos[node] = _CLOSED
+            b_size, b_counter, t, mu, meet = _expand_side(
+                costs, rows, cols, corridor, True, node,
+                b_stamp, b_gen, b_g, b_parent, b_pos, b_heap, b_heap_f, b_heap_seq,
+                b_size, b_counter, f_stamp, f_gen, f_g, mu, meet)
+        touched += t
+        if f_size + b_size > peak:
+            peak = f_size + b_size
+
+    stats[STAT_EXPANDED] = expanded
+    stats[STAT_TOUCHED] = touched
+    stats[STAT_PEAK_HEAP] = peak
+    stats[STAT_PUSHES] = f_counter + b_counter
+    return meet
+
+
+# ------------- Dijkstra on a CSR graph (abstract graphs) -------------
+@njit(cache=True)
+def csr_dijkstra_kernel(indptr, indices, weights, src_nodes, src_costs, dst_costs,
+                        g, parent, pos, heap, heap_f, heap_seq):
+    """
+    Dijkstra on a directed CSR graph from several seeded sources (src_costs >= 0)
+    to a virtual target reached from node v at cost dst_costs[v] (< 0 = unreachable).
+    g must arrive filled with INF_COST and pos with -1.
+    Returns the node through which the target is cheapest, or -1.
+    """
+    size = 0
+    counter = 0
+    for i in range(src_nodes.shape[0]):
+        v = src_nodes[i]
+        d = src_costs[i]
+        if d < 0 or d >= g[v]:
+            continue
+        g[v] = d
+        parent[v] = -1
+        if pos[v] < 0:
+            heap[size] = v
+            pos[v] = size
+            size += 1
+        heap_f[pos[v]] = d
+        heap_seq[pos[v]] = counter
+        counter += 1
+        _sift_up(heap, heap_f, heap_seq, pos, pos[v])
+
+    best = INF_COST
+    best_node = -1
+    while size > 0:
+        node, size = _heap_pop(heap, heap_f, heap_seq, pos, size)
+        pos[node] = _CLOSED
+        d = g[node]
+        if d >= best:
+            break
+        if dst_costs[node] >= 0 and d + dst_costs[node] < best:
+            best = d + dst_costs[node]
+            best_node = node
+        for e in range(indptr[node], indptr[node + 1]):
+            v = indices[e]
+            tentative = d + weights[e]
+            if pos[v] == _CLOSED or tentative >= g[v]:
+                continue
+            g[v] = tentative
+            parent[v] = node
+            if pos[v] < 0:
+                heap[size] = v
+                pos[v] = size
+                size += 1
+            heap_f[pos[v]] = tentative
+            heap_seq[pos[v]] = counter
+            counter += 1
+            _sift_up(heap, heap_f, heap_seq, pos, pos[v])
+    return best_node
+
+
+# ------------- Python entry point -------------
+def corridor_window(shape, start_rc, goal_rc, margin):
+    """
+    Bounding box of start/goal grown by margin cells, clipped to the grid:
+    (r_lo, r_hi, c_lo, c_hi), half-open.
+    """
+    rows, cols = shape
+    return (max(0, min(start_rc[0], goal_rc[0]) - margin),
+            min(rows, max(start_rc[0], goal_rc[0]) + margin + 1),
+            max(0, min(start_rc[1], goal_rc[1]) - margin),
+            min(cols, max(start_rc[1], goal_rc[1]) + margin + 1))
+
+
+def a_star_flat(grid, start, goal, corridor_width=None, stats=None, landmarks=None, window=None,
+                control=None, blocked=None):
+    """
+    Drop-in counterpart of plan.a_star_numpy_grid using the compiled kernel.
+    grid: 2D numpy array of costs, start/goal: (row, col) tuples.
+    corridor_width: same half-width as plan.make_corridor_mask, evaluated per cell.
+    landmarks: optional landmarks.LandmarkTables; replaces the Manhattan heuristic
+      with the (admissible) ALT bound, so paths become cost-optimal in the corridor.
+    window: optional (r_lo, r_hi, c_lo, c_hi) crop (see corridor_window); the search
+      then runs in window-local coordinates on window-sized buffers.
+    stats: optional dict, filled with expanded/touched/peak_heap/pushes and memory
+      figures (workspace_bytes, peak_bytes, allocated_bytes, window_cells).
+    control: optional control vector (new_control()) for progress and cancellation;
+      raises SearchCancelled when its cancel flag is seen.
+    blocked: optional bool mask of the window's shape; the search never enters its cells
+      (they are closed with g = 0 before it starts, so no cost makes them worth it).
+    returns: list of (row, col) tuples in grid coordinates, or empty list if not found.
+    """
+    full_rows, full_cols = grid.shape
+    sr, sc = start
+    gr, gc = goal
+    if not (0 <= sr < full_rows and 0 <= sc < full_cols and 0 <= gr < full_rows and 0 <= gc < full_cols):
+        return []
+    if sr == gr and sc == gc:
+        return [(sr, sc)]
+
+    r_lo, r_hi, c_lo, c_hi = window if window is not None else (0, full_rows, 0, full_cols)
+    if not (r_lo <= min(sr, gr) and max(sr, gr) < r_hi and c_lo <= min(sc, gc) and max(sc, gc) < c_hi):
+        raise ValueError(f"Window {window} does not contain {start} and {goal}")
+    sub = grid[r_lo:r_hi, c_lo:c_hi]
+    rows, cols = sub.shape
+    n = rows * cols
+    costs = np.ascontiguousarray(sub).reshape(n)
+    ws = get_workspace(n, pick_cost_dtype(sub))
+    fresh = ws.searches == 0
+    gen = ws.next_generation()
+
+    local_s = (sr - r_lo, sc - c_lo)
+    local_g = (gr - r_lo, gc - c_lo)
+    start_i = local_s[0] * cols + local_s[1]
+    goal_i = local_g[0] * cols + local_g[1]
+    corridor = corridor_params(local_s, local_g, corridor_width)
+    if blocked is not None:
+        if blocked.shape != (rows, cols):
+            raise ValueError(f"blocked mask {blocked.shape} does not match the window {(rows, cols)}")
+        if blocked[local_s] or blocked[local_g]:
+            return []
+        cells = np.flatnonzero(blocked)
+        ws.stamp[cells] = gen
+        ws.pos[cells] = _CLOSED
+        ws.g[cells] = 0
+    kstats = np.zeros(4, dtype=np.int64)
+    lm_fwd, lm_rev, lm_scale = landmarks.arrays() if landmarks is not None else NO_LANDMARKS
+    lm_frame = np.array([r_lo, c_lo, full_cols], dtype=np.int64)
+    found = astar_kernel(costs, rows, cols, start_i, goal_i, corridor,
+                         lm_fwd, lm_rev, lm_scale, lm_frame, _NO_SEEDS,
+                         ws.stamp, gen, ws.g, ws.parent, ws.pos,
+                         ws.heap, ws.heap_f, ws.heap_seq, kstats,
+                         control if control is not None else new_control())
+
+    if stats is not None:
+        stats["expanded"] = int(kstats[STAT_EXPANDED])
+        stats["touched"] = int(kstats[STAT_TOUCHED])
+        stats["peak_heap"] = int(kstats[STAT_PEAK_HEAP])
+        stats["pushes"] = int(kstats[STAT_PUSHES])
+        stats["window_cells"] = n
+        stats["workspace_bytes"] = ws.nbytes
+        stats["peak_bytes"] = (int(kstats[STAT_TOUCHED]) * ws.cell_bytes
+                               + int(kstats[STAT_PEAK_HEAP]) * ws.heap_entry_bytes)
+        stats["allocated_bytes"] = ws.nbytes if fresh else 0
+
+    if found == _CANCELLED:
+        raise SearchCancelled()
+    if found < 0:
+        return []
+    path = trace_path(ws.parent, start_i, goal_i)
+    return [(int(i // cols) + r_lo, int(i % cols) + c_lo) for i in path]
+
+
+def a_star_widening(grid, start, goal, widths, landmarks=None, windowed=True, edge_slack=1,
+                    stats=None, control=None):
+    """
+    Corridor A* that starts with widths[0] and moves to the next width only when the
+    search fails or the path comes within edge_slack cells of the corridor edge.
+    Each wider attempt resumes the previous search state (settled cells keep their g,
+    only the corridor frontier and open cells are re-queued) instead of restarting.
+    All attempts share one frame: the window for widths[-1] (or the full grid).
+    stats: optional dict; stats["attempts"] gets one dict per attempt (width, expanded,
+      touched, peak_heap, seeds, hugs_edge, cost, ms) and the totals are filled in like a_star_flat.
+    control: as in a_star_flat; one vector covers all attempts.
+    returns: list of (row, col) tuples in grid coordinates, or empty list if not found.
+    """
+    full_rows, full_cols = grid.shape
+    sr, sc = start
+    gr, gc = goal
+    if not (0 <= sr < full_rows and 0 <= sc < full_cols and 0 <= gr < full_rows and 0 <= gc < full_cols):
+        return []
+    if sr == gr and sc == gc:
+        return [(sr, sc)]
+
+    if windowed:
+        r_lo, r_hi, c_lo, c_hi = corridor_window(grid.shape, start, goal, widths[-1])
+    else:
+        r_lo, r_hi, c_lo, c_hi = 0, full_rows, 0, full_cols
+    sub = grid[r_lo:r_hi, c_lo:c_hi]
+    rows, cols = sub.shape
+    n = rows * cols
+    costs = np.ascontiguousarray(sub).reshape(n)
+    ws = get_workspace(n, pick_cost_dtype(sub))
+    gen = ws.next_generation()
+
+    local_s = (sr - r_lo, sc - c_lo)
+    local_g = (gr - r_lo, gc - c_lo)
+    start_i = local_s[0] * cols + local_s[1]
+    goal_i = local_g[0] * cols + local_g[1]
+    lm_fwd, lm_rev, lm_scale = landmarks.arrays() if landmarks is not None else NO_LANDMARKS
+    lm_frame = np.array([r_lo, c_lo, full_cols], dtype=np.int64)
+    dr = local_g[0] - local_s[0]
+    dc = local_g[1] - local_s[1]
+    norm = np.sqrt(dr * dr + dc * dc)
+    step = max(abs(dr), abs(dc))
+
+    kstats = np.zeros(4, dtype=np.int64)
+    if control is None:
+        control = new_control()
+    attempts = []
+    seeds = _NO_SEEDS
+    path = None
+    for k, width in enumerate(widths):
+        t0 = time.perf_counter()
+        corridor = corridor_params(local_s, local_g, width)
+        found = astar_kernel(costs, rows, cols, start_i, goal_i, corridor,
+                             lm_fwd, lm_rev, lm_scale, lm_frame, seeds,
+                             ws.stamp, gen, ws.g, ws.parent, ws.pos,
+                             ws.heap, ws.heap_f, ws.heap_seq, kstats, control)
+        if found == _CANCELLED:
+            raise SearchCancelled()
+        path = trace_path(ws.parent, start_i, goal_i) if found >= 0 or (
+            ws.stamp[goal_i] == gen and ws.pos[goal_i] == _CLOSED) else None
+        hugs = False
+        if path is not None:
+            pr = path // cols
+            pc = path - pr * cols
+            dist = np.abs(dr * (pc - local_s[1]) - dc * (pr - local_s[0])) / norm
+            hugs = bool(dist.max() >= width - edge_slack)
+        attempts.append({
+            "width": int(width),
+            "expanded": int(kstats[STAT_EXPANDED]),
+            "touched": int(kstats[STAT_TOUCHED]),
+            "peak_heap": int(kstats[STAT_PEAK_HEAP]),
+            "seeds": int(seeds.shape[0]),
+            "hugs_edge": hugs,
+            "cost": int(ws.g[goal_i]) if path is not None else -1,
+            "ms": round((time.perf_counter() - t0) * 1e3, 3),
+        })
+        if (path is not None and not hugs) or k == len(widths) - 1:
+            break
+        # re-queue open cells and every stamped cell that may border the wider band
+        stamped = np.flatnonzero(ws.stamp[:n] == gen)
+        r = stamped // cols
+        c = stamped - r * cols
+        num = np.abs(dr * (c - local_s[1]) - dc * (r - local_s[0]))
+        near_edge = num > width * norm - step
+        seeds = stamped[near_edge | (ws.pos[stamped] >= 0)].astype(np.int64)
+
+    if stats is not None:
+        stats["attempts"] = attempts
+        stats["expanded"] = sum(a["expanded"] for a in attempts)
+        stats["touched"] = sum(a["touched"] for a in attempts)
+        stats["peak_heap"] = max(a["peak_heap"] for a in attempts)
+        stats["pushes"] = int(kstats[STAT_PUSHES])
+        stats["window_cells"] = n
+        stats["workspace_bytes"] = ws.nbytes
+    if path is None:
+        return []
+    return [(int(i // cols) + r_lo, int(i % cols) + c_lo) for i in path]
+
+
+def bidirectional_flat(grid, start, goal, corridor_width=None, window=None, stats=None):
+    """
+    Bidirectional Dijkstra counterpart of a_star_flat (same arguments, no landmarks).
+    Returns a cost-optimal path inside the corridor/window, so it is the exact
+    reference the A* variants can be checked against.
+    """
+    full_rows, full_cols = grid.shape
+    sr, sc = start
+    gr, gc = goal
+    if not (0 <= sr < full_rows and 0 <= sc < full_cols and 0 <= gr < full_rows and 0 <= gc < full_cols):
+        return []
+    if sr == gr and sc == gc:
+        return [(sr, sc)]
+
+    r_lo, r_hi, c_lo, c_hi = window if window is not None else (0, full_rows, 0, full_cols)
+    sub = grid[r_lo:r_hi, c_lo:c_hi]
+    rows, cols = sub.shape
+    n = rows * cols
+    costs = np.ascontiguousarray(sub).reshape(n)
+    cost_dtype = pick_cost_dtype(sub)
+    fw = get_workspace(n, cost_dtype, slot=0)
+    bw = get_workspace(n, cost_dtype, slot=1)
+    f_gen = fw.next_generation()
+    b_gen = bw.next_generation()
+
+    local_s = (sr - r_lo, sc - c_lo)
+    local_g = (gr - r_lo, gc - c_lo)
+    start_i = local_s[0] * cols + local_s[1]
+    goal_i = local_g[0] * cols + local_g[1]
+    corridor = corridor_params(local_s, local_g, corridor_width)
+    kstats = np.zeros(4, dtype=np.int64)
+    meet = bidir_kernel(costs, rows, cols, start_i, goal_i, corridor,
+                        fw.stamp, f_gen, fw.g, fw.parent, fw.pos, fw.heap, fw.heap_f, fw.heap_seq,
+                        bw.stamp, b_gen, bw.g, bw.parent, bw.pos, bw.heap, bw.heap_f, bw.heap_seq,
+                        kstats)
+
+    if stats is not None:
+        stats["expanded"] = int(kstats[STAT_EXPANDED])
+        stats["touched"] = int(kstats[STAT_TOUCHED])
+        stats["peak_heap"] = int(kstats[STAT_PEAK_HEAP])
+        stats["pushes"] = int(kstats[STAT_PUSHES])
+        stats["window_cells"] = n
+        stats["workspace_bytes"] = fw.nbytes + bw.nbytes
+    if meet < 0:
+        return []
+    head = trace_path(fw.parent, start_i, meet)
+    tail = trace_path(bw.parent, goal_i, meet)[::-1]
+    path = np.concatenate((head, tail[1:]))
+    return [(int(i // cols) + r_lo, int(i % cols) + c_lo) for i in path]
+
+
+def dijkstra_flat(grid, sources, box=None, reverse=False, targets=None, cost_dtype=None, stats=None):
+    """
+    Run dijkstra_kernel on a 2D grid. sources/targets: iterables of flat indices,
+    box: (r_lo, r_hi, c_lo, c_hi) or None for the whole grid.
+    stats: optional dict filled with expanded / touched / peak_heap / pushes.
+    Returns (workspace, generation): read results with settled_costs() / trace_path()
+    before starting another search on the same thread.
+    """
+    rows, cols = grid.shape
+    n = rows * cols
+    costs = np.ascontiguousarray(grid).reshape(n)
+    ws = get_workspace(n, cost_dtype or pick_cost_dtype(grid))
+    gen = ws.next_generation()
+    if box is None:
+        box = (0, rows, 0, cols)
+    targets = np.unique(np.asarray(targets if targets is not None else [], dtype=np.int64))
+    kstats = np.zeros(4, dtype=np.int64)
+    dijkstra_kernel(costs, rows, cols, np.asarray(sources, dtype=np.int64),
+                    np.asarray(box, dtype=np.int64), reverse, targets,
+                    ws.stamp, gen, ws.g, ws.parent, ws.pos,
+                    ws.heap, ws.heap_f, ws.heap_seq, kstats)
+    if stats is not None:
+        stats["expanded"] = int(kstats[STAT_EXPANDED])
+        stats["touched"] = int(kstats[STAT_TOUCHED])
+        stats["peak_heap"] = int(kstats[STAT_PEAK_HEAP])
+        stats["pushes"] = int(kstats[STAT_PUSHES])
+    return ws, gen
+
+
+def settled_costs(ws, gen, cells):
+    """Final costs of the given flat cells from the last dijkstra_flat run (-1 = not settled)."""
+    cells = np.asarray(cells, dtype=np.int64)
+    ok = (ws.stamp[cells] == gen) & (ws.pos[cells] == _CLOSED)
+    return np.where(ok, ws.g[cells].astype(np.int64), -1)
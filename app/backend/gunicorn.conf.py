@@ -0,0 +1,36 @@
+"""
+gunicorn.conf.py - serving settings (gunicorn -c gunicorn.conf.py main:app).
+
+With preload_app the app is imported once in the master: the routing grid and its
+memory-mapped companions, the CORINE store, the transforms and the compiled kernels
+(warmed by plan.warm_up) are then shared copy-on-write by every forked worker instead of
+being loaded WEB_WORKERS times. gc.freeze() moves everything loaded so far out of the
+collector's reach, so the workers' collections do not touch (and copy) those pages.
+Anything that must not cross a fork - the segment process pool - is started per worker
+in post_fork (main.init_worker), while the worker still has a single thread; a pool
+replaced later, under running request threads, comes from a forkserver instead.
+
+Environment: WEB_WORKERS, WEB_THREADS, WEB_TIMEOUT, WEB_PRELOAD (0 for --reload).
+"""
+
+import gc
+import os
+
+bind = os.environ.get("WEB_BIND", "0.0.0.0:5001")
+workers = int(os.environ.get("WEB_WORKERS", "2"))
+worker_class = "gthread"
+threads = int(os.environ.get("WEB_THREADS", "8"))
+timeout = int(os.environ.get("WEB_TIMEOUT", "180"))
+preload_app = os.environ.get("WEB_PRELOAD", "1") == "1"
+
+
+def when_ready(server):
+    if preload_app:
+        import plan
+        plan.warm_up()
+        gc.freeze()
+
+
+def post_fork(server, worker):
+    import main
+    main.init_worker()
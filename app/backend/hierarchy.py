@@ -0,0 +1,316 @@
+"""
+hierarchy.py - HPA*-style abstraction graph over the cost grid.
+
+The grid is cut into square clusters (CLUSTER_SIZE cells). Along every border between
+two neighbouring clusters we place one entrance per ENTRANCE_SPACING cells, at the
+cheapest crossing of that stretch. The entrance cells become abstract nodes:
+- inter edges connect the two cells of an entrance (cost = entering the other cell),
+- intra edges connect every pair of nodes in one cluster with the exact in-cluster
+  shortest-path cost (Dijkstra restricted to the cluster).
+
+Queries connect start/goal to the nodes of their clusters, search the small abstract
+graph, then refine each abstract hop with a Dijkstra confined to one cluster. Refined
+paths cost exactly what the abstract search reported, and the work done depends on the
+number of clusters crossed, not on the area between start and goal.
+
+The graph is built offline (models/build_hierarchy.py) and stored next to
+final_grid.npy; it carries a digest of the grid so a stale file is ignored.
+Entrances make the abstract path approximate, so the build measures the cost excess
+against an exact full-grid Dijkstra (measure_excess) and rejects a graph whose worst
+excess is above MAX_EXCESS; plan.py only routes through a graph validated that way.
+"""
+
+import numpy as np
+
+from gridsearch import (INF_COST, csr_dijkstra_kernel, dijkstra_flat, grid_digest,
+                        pick_cost_dtype, settled_costs, trace_path)
+
+CLUSTER_SIZE = 50        # cluster side in grid cells
+ENTRANCE_SPACING = 5     # one entrance per this many border cells
+MAX_EXCESS = 0.10        # worst validated cost excess over the exact optimum (0.10 = 10 %)
+EXACT_REFERENCE = "dijkstra"  # what max_excess was measured against (older files: unvalidated)
+
+
+class Abstraction:
+    """Abstract graph in CSR form plus the node -> cell / cluster lookups."""
+
+    def __init__(self, shape, cluster_size, node_cell, adj_indptr, adj_indices, adj_weights,
+                 digest, max_excess=float("nan"), mean_excess=float("nan")):
+        self.shape = tuple(int(v) for v in shape)
+        self.cluster_size = int(cluster_size)
+        self.node_cell = np.asarray(node_cell, dtype=np.int64)
+        self.adj_indptr = np.asarray(adj_indptr, dtype=np.int64)
+        self.adj_indices = np.asarray(adj_indices, dtype=np.int32)
+        self.adj_weights = np.asarray(adj_weights, dtype=np.int64)
+        self.digest = str(digest)
+        self.max_excess = float(max_excess)
+        self.mean_excess = float(mean_excess)
+
+        rows, cols = self.shape
+        self.cluster_cols = -(-cols // self.cluster_size)
+        node_cluster = self.cluster_of(self.node_cell)
+        order = np.argsort(node_cluster, kind="stable")
+        n_clusters = -(-rows // self.cluster_size) * self.cluster_cols
+        self.cluster_indptr = np.zeros(n_clusters + 1, dtype=np.int64)
+        np.cumsum(np.bincount(node_cluster, minlength=n_clusters), out=self.cluster_indptr[1:])
+        self.cluster_nodes = order.astype(np.int32)
+
+    @property
+    def n_nodes(self):
+        return self.node_cell.shape[0]
+
+    def cluster_of(self, cells):
+        cols = self.shape[1]
+        cs = self.cluster_size
+        r = np.asarray(cells) // cols
+        c = np.asarray(cells) % cols
+        return (r // cs) * self.cluster_cols + c // cs
+
+    def cluster_box(self, cluster):
+        rows, cols = self.shape
+        cs = self.cluster_size
+        cr, cc = divmod(int(cluster), self.cluster_cols)
+        return (cr * cs, min(rows, (cr + 1) * cs), cc * cs, min(cols, (cc + 1) * cs))
+
+    def nodes_in(self, cluster):
+        return self.cluster_nodes[self.cluster_indptr[cluster]:self.cluster_indptr[cluster + 1]]
+
+    def save(self, path):
+        np.savez(path, shape=np.array(self.shape), cluster_size=self.cluster_size,
+                 node_cell=self.node_cell, adj_indptr=self.adj_indptr,
+                 adj_indices=self.adj_indices, adj_weights=self.adj_weights,
+                 digest=np.array(self.digest), max_excess=self.max_excess,
+                 mean_excess=self.mean_excess, reference=np.array(EXACT_REFERENCE))
+
+
+def load_abstraction(path, grid=None):
+    """
+    Load a saved abstraction. Returns None when the file is missing or was built
+    for a different grid than `grid`. Files not validated against the exact search load
+    with max_excess = nan (never within a tolerance).
+    """
+    try:
+        data = np.load(path)
+    except (OSError, ValueError):
+        return None
+    with data:
+        validated = "reference" in data.files and str(data["reference"]) == EXACT_REFERENCE
+        a = Abstraction(data["shape"], int(data["cluster_size"]), data["node_cell"],
+                        data["adj_indptr"], data["adj_indices"], data["adj_weights"],
+                        str(data["digest"]),
+                        float(data["max_excess"]) if validated else float("nan"),
+                        float(data["mean_excess"]) if validated else float("nan"))
+    if grid is not None and a.digest != grid_digest(grid):
+        return None
+    return a
+
+
+# ------------- offline build -------------
+def build_abstraction(grid, cluster_size=CLUSTER_SIZE, spacing=ENTRANCE_SPACING):
+    """
+    Partition grid into clusters, place entrances and precompute inter/intra edge costs.
+    """
+    rows, cols = grid.shape
+    cost_dtype = pick_cost_dtype(grid)
+    node_of = {}
+    edges = []  # (u, v, w)
+
+    def node(cell):
+        if cell not in node_of:
+            node_of[cell] = len(node_of)
+        return node_of[cell]
+
+    flat_costs = np.ascontiguousarray(grid).reshape(-1)
+
+    def add_entrances(cells_a, cells_b):
+        # cells_a[i] and cells_b[i] are neighbours on opposite sides of a border
+        for lo in range(0, len(cells_a), spacing):
+            a = cells_a[lo:lo + spacing]
+            b = cells_b[lo:lo + spacing]
+            k = int(np.argmin(flat_costs[a].astype(np.int64) + flat_costs[b]))
+            u = node(int(a[k]))
+            v = node(int(b[k]))
+            edges.append((u, v, int(flat_costs[b[k]])))
+            edges.append((v, u, int(flat_costs[a[k]])))
+
+    # vertical borders (between horizontally adjacent clusters)
+    for x in range(cluster_size, cols, cluster_size):
+        for r0 in range(0, rows, cluster_size):
+            rs = np.arange(r0, min(rows, r0 + cluster_size))
+            add_entrances(rs * cols + x - 1, rs * cols + x)
+    # horizontal borders (between vertically adjacent clusters)
+    for y in range(cluster_size, rows, cluster_size):
+        for c0 in range(0, cols, cluster_size):
+            cc = np.arange(c0, min(cols, c0 + cluster_size))
+            add_entrances((y - 1) * cols + cc, y * cols + cc)
+
+    node_cell = np.empty(len(node_of), dtype=np.int64)
+    for cell, idx in node_of.items():
+        node_cell[idx] = cell
+
+    # intra edges: exact in-cluster costs between every pair of nodes of a cluster
+    partial = Abstraction((rows, cols), cluster_size, node_cell,
+                          np.zeros(len(node_cell) + 1), [], [], "")
+    for cluster in range(partial.cluster_indptr.shape[0] - 1):
+        members = partial.nodes_in(cluster)
+        if members.shape[0] < 2:
+            continue
+        member_cells = node_cell[members]
+        box = partial.cluster_box(cluster)
+        for u in members:
+            ws, gen = dijkstra_flat(grid, [node_cell[u]], box=box, targets=member_cells,
+                                    cost_dtype=cost_dtype)
+            costs = settled_costs(ws, gen, member_cells)
+            for v, w in zip(members, costs):
+                if v != u and w >= 0:
+                    edges.append((int(u), int(v), int(w)))
+
+    # CSR, keeping the cheapest edge per (u, v)
+    e = np.array(edges, dtype=np.int64).reshape(-1, 3)
+    e = e[np.lexsort((e[:, 2], e[:, 1], e[:, 0]))]
+    keep = np.ones(e.shape[0], dtype=bool)
+    keep[1:] = (e[1:, 0] != e[:-1, 0]) | (e[1:, 1] != e[:-1, 1])
+    e = e[keep]
+    indptr = np.zeros(len(node_cell) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(e[:, 0], minlength=len(node_cell)), out=indptr[1:])
+    return Abstraction((rows, cols), cluster_size, node_cell, indptr, e[:, 1], e[:, 2],
+                       grid_digest(grid))
+
+
+def exact_cost(grid, start, goal, cost_dtype=None):
+    """Optimal path cost start -> goal over the whole grid (plain Dijkstra), -1 if unreachable."""
+    cols = grid.shape[1]
+    t = goal[0] * cols + goal[1]
+    ws, gen = dijkstra_flat(grid, [start[0] * cols + start[1]], targets=[t], cost_dtype=cost_dtype)
+    return int(settled_costs(ws, gen, [t])[0])
+
+
+def measure_excess(abstraction, grid, n_pairs=50, min_distance=300, seed=0):
+    """
+    Compare hpa_search against the exact full-grid optimum (exact_cost) on seeded random
+    pairs at least min_distance (Manhattan cells) apart. Stores and returns
+    (max_excess, mean_excess) as relative cost differences (0.05 = 5 % dearer).
+    A corridor-limited A* is no reference here: zero-cost cells make its Manhattan
+    heuristic inadmissible and the corridor cuts off optimal detours.
+    """
+    rows, cols = grid.shape
+    cost_dtype = pick_cost_dtype(grid)
+    rng = np.random.default_rng(seed)
+    excess = []
+    while len(excess) < n_pairs:
+        s = (int(rng.integers(rows)), int(rng.integers(cols)))
+        t = (int(rng.integers(rows)), int(rng.integers(cols)))
+        if abs(s[0] - t[0]) + abs(s[1] - t[1]) < min_distance:
+            continue
+        optimum = exact_cost(grid, s, t, cost_dtype)
+        approx = hpa_search(abstraction, grid, s, t)
+        if optimum < 0 or not approx:
+            continue
+        approx_cost = sum(int(grid[p]) for p in approx[1:])
+        excess.append((approx_cost - optimum) / max(optimum, 1))
+    abstraction.max_excess = float(max(excess))
+    abstraction.mean_excess = float(np.mean(excess))
+    return abstraction.max_excess, abstraction.mean_excess
+
+
+# ------------- queries -------------
+def _add_search_stats(total, part):
+    """Accumulate dijkstra_flat stats of one sub-search into the hpa_search totals."""
+    for key in ("expanded", "touched", "pushes"):
+        total[key] = total.get(key, 0) + part.get(key, 0)
+    total["peak_heap"] = max(total.get("peak_heap", 0), part.get("peak_heap", 0))
+
+
+def _refine(grid, src, dst, box, cost_dtype, stats=None):
+    """Exact in-box path src -> dst as flat indices (src first)."""
+    part = {}
+    ws, gen = dijkstra_flat(grid, [src], box=box, targets=[dst], cost_dtype=cost_dtype, stats=part)
+    if stats is not None:
+        _add_search_stats(stats, part)
+    if settled_costs(ws, gen, [dst])[0] < 0:
+        return None
+    return trace_path(ws.parent, src, dst)
+
+
+def hpa_search(abstraction, grid, start, goal, stats=None):
+    """
+    Route start -> goal ((row, col) tuples) through the abstraction.
+    stats: optional dict, filled with abstract/refined search figures, the path cost and
+      the cell-level totals of all sub-searches (expanded, touched, pushes, peak_heap).
+    returns: list of (row, col) tuples, or empty list if not found.
+    """
+    rows, cols = grid.shape
+    totals = {}
+    s = start[0] * cols + start[1]
+    t = goal[0] * cols + goal[1]
+    cost_dtype = pick_cost_dtype(grid)
+    cl_s = int(abstraction.cluster_of(s))
+    cl_t = int(abstraction.cluster_of(t))
+    box_s = abstraction.cluster_box(cl_s)
+    box_t = abstraction.cluster_box(cl_t)
+    nodes_s = abstraction.nodes_in(cl_s)
+    nodes_t = abstraction.nodes_in(cl_t)
+
+    # start -> nodes of its cluster (and to goal when it shares the cluster)
+    targets = abstraction.node_cell[nodes_s]
+    if cl_s == cl_t:
+        targets = np.append(targets, t)
+    part = {}
+    ws, gen = dijkstra_flat(grid, [s], box=box_s, targets=targets, cost_dtype=cost_dtype, stats=part)
+    _add_search_stats(totals, part)
+    src_costs = settled_costs(ws, gen, abstraction.node_cell[nodes_s])
+    direct = int(settled_costs(ws, gen, [t])[0]) if cl_s == cl_t else -1
+
+    # nodes of the goal cluster -> goal (reverse search)
+    part = {}
+    ws, gen = dijkstra_flat(grid, [t], box=box_t, reverse=True,
+                            targets=abstraction.node_cell[nodes_t], cost_dtype=cost_dtype, stats=part)
+    _add_search_stats(totals, part)
+    dst_costs = np.full(abstraction.n_nodes, -1, dtype=np.int64)
+    dst_costs[nodes_t] = settled_costs(ws, gen, abstraction.node_cell[nodes_t])
+
+    n = abstraction.n_nodes
+    g = np.full(n, INF_COST, dtype=np.int64)
+    parent = np.full(n, -1, dtype=np.int32)
+    pos = np.full(n, -1, dtype=np.int32)
+    last = csr_dijkstra_kernel(abstraction.adj_indptr, abstraction.adj_indices,
+                               abstraction.adj_weights, nodes_s.astype(np.int64), src_costs,
+                               dst_costs, g, parent, pos, np.empty(n, dtype=np.int32),
+                               np.empty(n, dtype=np.int64), np.empty(n, dtype=np.int32))
+    abstract_cost = int(g[last] + dst_costs[last]) if last >= 0 else -1
+
+    if direct >= 0 and (abstract_cost < 0 or direct <= abstract_cost):
+        chain = []
+        total = direct
+    elif last >= 0:
+        chain = [last]
+        while parent[chain[-1]] != -1:
+            chain.append(int(parent[chain[-1]]))
+        chain.reverse()
+        total = abstract_cost
+    else:
+        return []
+
+    # refine hop by hop, each inside a single cluster
+    waypoints = [s] + [int(abstraction.node_cell[v]) for v in chain] + [t]
+    pieces = [np.array([s], dtype=np.int64)]
+    for a, b in zip(waypoints[:-1], waypoints[1:]):
+        if a == b:
+            continue
+        ca = int(abstraction.cluster_of(a))
+        if ca != int(abstraction.cluster_of(b)):
+            # inter edge: the two cells are neighbours
+            pieces.append(np.array([b], dtype=np.int64))
+            continue
+        piece = _refine(grid, a, b, abstraction.cluster_box(ca), cost_dtype, totals)
+        if piece is None:
+            return []
+        pieces.append(piece[1:])
+    path = np.concatenate(pieces)
+
+    if stats is not None:
+        stats["abstract_nodes"] = len(chain)
+        stats["refined_hops"] = len(waypoints) - 1
+        stats["cost"] = total
+        stats.update(totals)
+    return [(int(i // cols), int(i % cols)) for i in path]
@@ -0,0 +1,421 @@
+"""
+jobs.py - background route jobs with progress and cancellation.
+
+POST /api/plan-route with "async": true (or ?async=1) does not search inside the request:
+the route is handed to a small thread pool and the client gets a job id back at once.
+While the job runs, the search kernels write their progress into the job's control
+vector (gridsearch.CTL_*: nodes expanded, top-of-heap f) at every checkpoint and
+search_segments reports finished segments. events() turns that into a Server-Sent
+Events stream; cancel() sets the control vector's cancel flag, which the running
+search sees at its next checkpoint (SearchCancelled), a queued job never starts.
+
+Jobs run in threads of the serving process: the compiled kernels release the GIL, so
+the worker keeps answering other requests (run gunicorn with --worker-class gthread).
+Finished jobs are kept for JOB_TTL seconds.
+
+With several gunicorn workers, a job's status, events, result or cancel request may reach
+a worker other than the one running it. JobManager(store=JobStore(...)) therefore mirrors
+its jobs into a SQLite file shared by all workers (like segcache.py): the owning process
+publishes every job's progress each PROGRESS_INTERVAL and its result when done; other
+processes answer from that snapshot (RemoteJob), and a remote cancel is a flag that the owner
+picks up on its next publish and turns into the usual control-vector cancel. Results (a tuple
+of arrays and numbers, e.g. plan_route's lon, lat, length) are stored as np.save records with
+allow_pickle=False, never pickled, and the file lives in the app directory or a private
+per-user one (private_directory), not in the shared temp directory. Each row records
+its owner's pid and a heartbeat (the owner's last publish): a job whose owner died (a killed or
+recycled worker) is marked failed as soon as another process finds the pid gone or the
+heartbeat older than HEARTBEAT_TIMEOUT, instead of staying "running" forever.
+"""
+
+import io
+import json
+import os
+import sqlite3
+import stat
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from gridsearch import SearchCancelled, new_control, CTL_BEST_F, CTL_CANCEL, CTL_EXPANDED
+
+JOB_WORKERS = 2          # routes searched at the same time (per process)
+JOB_TTL = 600            # seconds a finished job stays available
+PROGRESS_INTERVAL = 0.5  # seconds between progress events of a running job
+HEARTBEAT_TIMEOUT = 30   # seconds without a publish after which an unfinished job is orphaned
+
+FINISHED = ("done", "failed", "cancelled")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    state TEXT NOT NULL,
+    progress TEXT NOT NULL,
+    result BLOB,
+    error TEXT,
+    cancel INTEGER NOT NULL DEFAULT 0,
+    updated REAL NOT NULL,
+    owner INTEGER NOT NULL DEFAULT 0,
+    heartbeat REAL NOT NULL DEFAULT 0
+);
+"""
+# columns added after the first release of the table, for stores created before
+_MIGRATIONS = {
+    "owner": "ALTER TABLE jobs ADD COLUMN owner INTEGER NOT NULL DEFAULT 0",
+    "heartbeat": "ALTER TABLE jobs ADD COLUMN heartbeat REAL NOT NULL DEFAULT 0",
+}
+
+
+class RouteJob:
+    """One submitted route: state, progress counters and the result once done."""
+
+    def __init__(self):
+        self.id = uuid.uuid4().hex
+        self.state = "queued"
+        self.control = new_control()
+        self.segments = 0
+        self.segments_done = 0
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.result = None
+        self.error = None
+        self.future = None
+        self._changed = threading.Condition()
+
+    def _update(self, **fields):
+        with self._changed:
+            for name, value in fields.items():
+                setattr(self, name, value)
+            self._changed.notify_all()
+
+    def segment_done(self, done, total):
+        """search_segments callback."""
+        self._update(segments_done=done, segments=total)
+
+    def wait(self, timeout):
+        """Block until the job changes state or a segment finishes (or timeout)."""
+        with self._changed:
+            if self.state not in FINISHED:
+                self._changed.wait(timeout)
+
+    def cancel(self):
+        """Request cancellation; True unless the job had already finished."""
+        if self.state in FINISHED:
+            return False
+        self.control[CTL_CANCEL] = 1
+        if self.future is not None and self.future.cancel():
+            self._update(state="cancelled", finished=time.time())
+        return True
+
+    def progress(self):
+        end = self.finished or time.time()
+        return {
+            "id": self.id,
+            "state": self.state,
+            "segments": self.segments,
+            "segmentsDone": self.segments_done,
+            "expanded": int(self.control[CTL_EXPANDED]),
+            "bestF": int(self.control[CTL_BEST_F]),
+            "elapsed": round(end - (self.started or end), 3),
+            "error": self.error,
+        }
+
+
+class RemoteJob:
+    """A job owned by another serving process, as last published to the JobStore."""
+
+    def __init__(self, store, row):
+        self.store = store
+        self._load(row)
+
+    def _load(self, row):
+        self.id, self.state, progress, result, self.error = row
+        # the state may have been set by another process than the owner (orphaned job)
+        try:
+            self.result = decode_result(result) if result is not None else None
+        except (ValueError, OSError):
+            self.state, self.error, self.result = "failed", "The job's result could not be read.", None
+        self._progress = dict(json.loads(progress), state=self.state, error=self.error)
+
+    def wait(self, timeout):
+        time.sleep(timeout)
+        row = self.store.row(self.id)
+        if row is not None:
+            self._load(row)
+
+    def cancel(self):
+        if self.state in FINISHED:
+            return False
+        self.store.request_cancel(self.id)
+        return True
+
+    def progress(self):
+        return dict(self._progress)
+
+
+class JobStore:
+    """Job snapshots in a SQLite file shared by all serving processes."""
+
+    def __init__(self, path, ttl=JOB_TTL):
+        self.path = path
+        self.ttl = ttl
+        self._local = threading.local()
+        self._conn()
+
+    def _conn(self):
+        # one connection per process and thread (sqlite connections must not cross a fork)
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            columns = {r[1] for r in conn.execute("PRAGMA table_info(jobs)")}
+            for name, statement in _MIGRATIONS.items():
+                if name not in columns:
+                    conn.execute(statement)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def publish(self, job):
+        """
+        Store job's current state and progress (and its result once done), with this process
+        as its owner; also the owner's heartbeat. updated only moves when the state changes.
+        """
+        result = encode_result(job.result) if job.state == "done" and job.result is not None else None
+        now = time.time()
+        self._conn().execute(
+            "INSERT INTO jobs (id, state, progress, result, error, updated, owner, heartbeat) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (id) DO UPDATE SET progress = excluded.progress, result = excluded.result, "
+            "error = excluded.error, owner = excluded.owner, heartbeat = excluded.heartbeat, "
+            "updated = CASE WHEN state = excluded.state THEN updated ELSE excluded.updated END, "
+            "state = excluded.state",
+            (job.id, job.state, json.dumps(job.progress()), result, job.error, now, os.getpid(), now))
+
+    def row(self, job_id):
+        """(id, state, progress, result, error), after failing the job if its owner is gone."""
+        conn = self._conn()
+        row = conn.execute("SELECT id, state, progress, result, error, owner, heartbeat FROM jobs WHERE id = ?",
+                           (job_id,)).fetchone()
+        if row is None:
+            return None
+        state, owner, heartbeat = row[1], row[5], row[6]
+        if state not in FINISHED and (heartbeat < time.time() - HEARTBEAT_TIMEOUT or not _alive(owner)):
+            # only if the owner has not published since (it may just have been slow)
+            conn.execute("UPDATE jobs SET state = 'failed', error = ?, updated = ? WHERE id = ? AND heartbeat = ?",
+                         ("The worker running this job stopped.", time.time(), job_id, heartbeat))
+            return self.row(job_id)
+        return row[:5]
+
+    def get(self, job_id):
+        row = self.row(job_id)
+        return RemoteJob(self, row) if row is not None else None
+
+    def request_cancel(self, job_id):
+        self._conn().execute("UPDATE jobs SET cancel = 1 WHERE id = ?", (job_id,))
+
+    def cancel_requested(self, job_ids):
+        if not job_ids:
+            return set()
+        marks = ",".join("?" * len(job_ids))
+        rows = self._conn().execute(f"SELECT id FROM jobs WHERE cancel = 1 AND id IN ({marks})", list(job_ids))
+        return {r[0] for r in rows}
+
+    def purge(self):
+        """Drop finished jobs after ttl, and jobs nobody has published for that long (orphans)."""
+        cutoff = time.time() - self.ttl
+        marks = ",".join("?" * len(FINISHED))
+        self._conn().execute(f"DELETE FROM jobs WHERE (updated < ? AND state IN ({marks})) OR heartbeat < ?",
+                             (cutoff, *FINISHED, cutoff))
+
+
+def _alive(pid):
+    """Whether process pid exists (the serving processes share one host); unknown (0) counts as alive."""
+    if pid <= 0:
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def encode_result(result):
+    """A job result (tuple of arrays / numbers) as consecutive np.save records, without pickle."""
+    buf = io.BytesIO()
+    for item in result:
+        np.save(buf, np.asarray(item), allow_pickle=False)
+    return buf.getvalue()
+
+
+def decode_result(blob):
+    """Inverse of encode_result (numbers come back as Python scalars); ValueError if not one."""
+    buf = io.BytesIO(blob)
+    items = []
+    while buf.tell() < len(blob):
+        value = np.load(buf, allow_pickle=False)
+        items.append(value.item() if value.ndim == 0 else value)
+    return tuple(items)
+
+
+def private_directory(name):
+    """
+    <temp dir>/<name>-<uid>, created mode 0700: a place for the stores when the app directory
+    is not writable. None if it exists but is not a directory of this user closed to others.
+    """
+    path = os.path.join(tempfile.gettempdir(), f"{name}-{os.getuid()}")
+    try:
+        os.mkdir(path, 0o700)
+    except FileExistsError:
+        pass
+    except OSError:
+        return None
+    st = os.lstat(path)
+    if not stat.S_ISDIR(st.st_mode) or st.st_uid != os.getuid() or st.st_mode & 0o077:
+        return None
+    return path
+
+
+def open_job_store(directories, filename, **kwargs):
+    """Open the job store in the first writable directory (None entries skipped); None if none works."""
+    for directory in directories:
+        if directory is None:
+            continue
+        try:
+            return JobStore(os.path.join(directory, filename), **kwargs)
+        except (sqlite3.Error, OSError):
+            continue
+    return None
+
+
+class JobManager:
+    """
+    Runs fn(*args, control=..., on_segment=..., **kwargs) for each submitted job.
+    store: optional JobStore, to share the jobs with the other serving processes.
+    """
+
+    def __init__(self, fn, workers=JOB_WORKERS, ttl=JOB_TTL, store=None):
+        self.fn = fn
+        self.ttl = ttl
+        self.store = store
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="route-job")
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._publisher = None
+
+    def submit(self, *args, **kwargs):
+        self._purge()
+        job = RouteJob()
+        with self._lock:
+            self._jobs[job.id] = job
+        if self.store is not None:
+            self._publish(job)
+            self._start_publisher()
+        job.future = self._executor.submit(self._run, job, args, kwargs)
+        return job
+
+    def get(self, job_id):
+        """The job (a RemoteJob if another process runs it), or None."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None and self.store is not None:
+            try:
+                return self.store.get(job_id)
+            except sqlite3.Error:
+                return None
+        return job
+
+    def cancel(self, job_id):
+        """
+        Cancel a job, wherever it runs; returns it (None if unknown). A queued job of this
+        process is finished at once, so its final state is published here: _run never runs
+        for it and the publisher only publishes unfinished jobs.
+        """
+        job = self.get(job_id)
+        if job is not None and job.cancel() and isinstance(job, RouteJob) and job.state in FINISHED:
+            if self.store is not None:
+                self._publish(job)
+        return job
+
+    def _publish(self, job):
+        try:
+            self.store.publish(job)
+        except sqlite3.Error:
+            pass  # the owning process still serves the job; others see an older snapshot
+
+    def _start_publisher(self):
+        # started on first use: threads do not survive the fork into the serving workers
+        with self._lock:
+            if self._publisher is None or not self._publisher.is_alive():
+                self._publisher = threading.Thread(target=self._publish_loop, name="route-job-publisher",
+                                                   daemon=True)
+                self._publisher.start()
+
+    def _publish_loop(self):
+        """Owner side of the store: publish running jobs, apply cancels requested elsewhere."""
+        while True:
+            time.sleep(PROGRESS_INTERVAL)
+            with self._lock:
+                running = {job.id: job for job in self._jobs.values() if job.state not in FINISHED}
+            try:
+                for job_id in self.store.cancel_requested(list(running)):
+                    running[job_id].cancel()
+            except sqlite3.Error:
+                pass
+            for job in running.values():
+                self._publish(job)
+
+    def _run(self, job, args, kwargs):
+        job._update(state="running", started=time.time())
+        try:
+            result = self.fn(*args, control=job.control, on_segment=job.segment_done, **kwargs)
+        except SearchCancelled:
+            job._update(state="cancelled", finished=time.time())
+        except Exception as e:
+            job._update(state="failed", error=str(e), finished=time.time())
+        else:
+            job._update(state="done", result=result, finished=time.time())
+        if self.store is not None:
+            self._publish(job)
+
+    def _purge(self):
+        cutoff = time.time() - self.ttl
+        with self._lock:
+            for job_id in [k for k, job in self._jobs.items() if job.finished and job.finished < cutoff]:
+                del self._jobs[job_id]
+        if self.store is not None:
+            try:
+                self.store.purge()
+            except sqlite3.Error:
+                pass
+
+    def shutdown(self):
+        with self._lock:
+            jobs = list(self._jobs.values())
+        for job in jobs:
+            if job.cancel() and job.state in FINISHED and self.store is not None:
+                self._publish(job)
+        self._executor.shutdown(wait=False)
+
+
+def events(job, interval=PROGRESS_INTERVAL):
+    """
+    Server-Sent Events for one job: a "progress" event every interval seconds (and on
+    each finished segment) while it runs, then one final event named after its state.
+    """
+    while True:
+        state = job.state
+        payload = json.dumps(job.progress(), separators=(",", ":"))
+        if state in FINISHED:
+            yield f"event: {state}\ndata: {payload}\n\n"
+            return
+        yield f"event: progress\ndata: {payload}\n\n"
+        job.wait(interval)
@@ -0,0 +1,120 @@
+"""
+landmarks.py - ALT (A*, Landmarks, Triangle inequality) heuristic tables.
+
+For a handful of landmark cells L we precompute full-grid Dijkstra distances in both
+directions: d(L, v) and d(v, L) (moves cost the entered cell, so the grid is directed).
+For any cell v and goal t the triangle inequality gives
+    d(v, t) >= max(d(L, t) - d(L, v), d(v, L) - d(t, L))
+which is admissible and consistent, unlike plain Manhattan distance on a grid where
+most cells cost 15-65 per step.
+
+Tables are stored as (cells, landmarks) uint16 arrays of floor(d / scale), one scale per
+table, and memory-mapped read-only at load time: 8 landmarks on the 1000x1000 grid are
+2 x 16 MB shared by every process instead of 2 x 64 MB of int64.
+Built offline by models/build_landmarks.py.
+"""
+
+import numpy as np
+
+from gridsearch import LM_UNREACHED, dijkstra_flat, grid_digest, pick_cost_dtype, settled_costs
+
+LANDMARK_COUNT = 8
+
+
+class LandmarkTables:
+    """Quantised forward/reverse landmark distances plus the landmark cells."""
+
+    def __init__(self, cells, fwd, rev, scale, digest):
+        self.cells = np.asarray(cells, dtype=np.int64)
+        self.fwd = fwd
+        self.rev = rev
+        self.scale = np.asarray(scale, dtype=np.int64)
+        self.digest = str(digest)
+
+    @property
+    def count(self):
+        return self.cells.shape[0]
+
+    @property
+    def nbytes(self):
+        return self.fwd.nbytes + self.rev.nbytes
+
+    def arrays(self):
+        """(fwd, rev, scale) in the layout gridsearch.astar_kernel expects."""
+        return self.fwd, self.rev, self.scale
+
+    def save(self, prefix):
+        np.save(prefix + "_fwd.npy", self.fwd)
+        np.save(prefix + "_rev.npy", self.rev)
+        np.savez(prefix + ".npz", cells=self.cells, scale=self.scale,
+                 digest=np.array(self.digest))
+
+
+def load_landmarks(prefix, grid=None):
+    """
+    Memory-map tables saved with LandmarkTables.save(prefix). Returns None when they
+    are missing or were built for a different grid than `grid`.
+    """
+    try:
+        with np.load(prefix + ".npz") as meta:
+            cells = meta["cells"]
+            scale = meta["scale"]
+            digest = str(meta["digest"])
+        # np.asarray drops the memmap subclass but keeps the mapped buffer
+        fwd = np.asarray(np.load(prefix + "_fwd.npy", mmap_mode="r"))
+        rev = np.asarray(np.load(prefix + "_rev.npy", mmap_mode="r"))
+    except (OSError, ValueError, KeyError):
+        return None
+    if grid is not None and (digest != grid_digest(grid) or fwd.shape[0] != grid.size):
+        return None
+    return LandmarkTables(cells, fwd, rev, scale, digest)
+
+
+def quantise(dist):
+    """
+    Map int64 distances (-1 = unreachable) to uint16 floor(d / scale).
+    Returns (table, scale).
+    """
+    reach = dist >= 0
+    top = int(dist[reach].max()) if reach.any() else 0
+    scale = max(1, -(-top // (int(LM_UNREACHED) - 1)))
+    table = np.full(dist.shape, LM_UNREACHED, dtype=np.uint16)
+    table[reach] = dist[reach] // scale
+    return table, scale
+
+
+def _full_dijkstra(grid, cell, reverse, cost_dtype):
+    ws, gen = dijkstra_flat(grid, [cell], reverse=reverse, cost_dtype=cost_dtype)
+    return settled_costs(ws, gen, np.arange(grid.size))
+
+
+def build_landmarks(grid, count=LANDMARK_COUNT):
+    """
+    Pick landmarks by farthest-point selection on cost distance (starting from the
+    cell farthest from the grid centre) and build their quantised tables.
+    """
+    rows, cols = grid.shape
+    cost_dtype = pick_cost_dtype(grid)
+    centre = (rows // 2) * cols + cols // 2
+    min_dist = _full_dijkstra(grid, centre, False, cost_dtype)
+
+    cells, fwd_cols, rev_cols, scales_f, scales_r = [], [], [], [], []
+    for _ in range(count):
+        cell = int(np.argmax(min_dist))
+        fwd = _full_dijkstra(grid, cell, False, cost_dtype)
+        rev = _full_dijkstra(grid, cell, True, cost_dtype)
+        if not cells:
+            min_dist = fwd.copy()
+        else:
+            np.minimum(min_dist, fwd, out=min_dist, where=fwd >= 0)
+        cells.append(cell)
+        qf, sf = quantise(fwd)
+        qr, sr = quantise(rev)
+        fwd_cols.append(qf)
+        rev_cols.append(qr)
+        scales_f.append(sf)
+        scales_r.append(sr)
+
+    # (cells, landmarks) so one cell's bounds sit next to each other in memory
+    return LandmarkTables(cells, np.stack(fwd_cols, axis=1), np.stack(rev_cols, axis=1),
+                          scales_f + scales_r, grid_digest(grid))
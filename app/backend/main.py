@@ -1,20 +1,75 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, g
 from flask_cors import CORS
 from flask import Response
-import geopandas as gpd
-from plan import compute_route
+from plan import (check_route_options, cost_layers, plan_ordered_route, plan_route, plan_route_fine,
+                  plan_routes, segment_cache_stats, start_worker_pool, surface_store, surface_targets,
+                  USE_PARALLEL)
+from corine import iter_pages, load_store, parse_classes, stream_feature_collection
+from routeformat import compress, encode, encode_polyline, negotiate
+from jobs import JobManager, events, open_job_store, private_directory
+from metrics import REQUEST_SECONDS, ROUTE_FAILURES, RouteTrace, open_metrics_store, render as render_metrics
 # from plan import greedy_route
-import sys
-import requests
-import traceback
+import itertools
 import json
-from shapely.geometry import mapping
+import logging
+import tempfile
+import time
 import os
 
+# per-request details go to the log at DEBUG level instead of stdout (LOG_LEVEL=DEBUG to see them)
+logging.basicConfig(level=os.environ.get("LOG_LEVEL", "INFO"))
+log = logging.getLogger("greenhack")
+
 app = Flask(__name__)
 
 CORS(app)
 
+def init_worker():
+    """
+    Per-process start-up that must not happen before a fork: the long-lived segment pool,
+    shared by all requests of this worker. gunicorn.conf.py calls it after forking each worker
+    (the app itself may be imported once in the master); elsewhere the pool starts on the
+    first multi-segment route.
+    """
+    if USE_PARALLEL:
+        start_worker_pool()
+
+# read the CORINE store now rather than on the first browse request
+# (once in the gunicorn master with preload_app, then shared by the workers)
+load_store()
+
+def plan_job(points, resolution=None, backend=None, weights=None, **kwargs):
+    """Job body: plan_route, or plan_route_fine for "resolution": "fine"."""
+    if resolution == "fine":
+        return plan_route_fine(points, **kwargs)
+    return plan_route(points, backend=backend, weights=weights, **kwargs)
+
+# background route jobs (POST /api/plan-route with "async": true), see jobs.py;
+# the store lets any gunicorn worker answer for a job another worker runs; it holds route
+# results, so it stays out of the world-writable temp directory
+_BASE = os.path.dirname(os.path.abspath(__file__))
+route_jobs = JobManager(plan_job, store=open_job_store((_BASE, private_directory("greenhack")),
+                                                       "route_jobs.sqlite"))
+
+# every worker's metrics, summed by /metrics whichever worker answers (see metrics.py)
+metrics_store = open_metrics_store((_BASE, tempfile.gettempdir()), "metrics.sqlite")
+
+# request latency histogram for /metrics (streamed responses: time until the body starts)
+@app.before_request
+def start_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def observe_latency(response):
+    started = getattr(g, "request_started", None)
+    if started is not None:
+        endpoint = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint=endpoint,
+                                method=request.method, status=response.status_code)
+    if metrics_store is not None:
+        metrics_store.start()
+    return response
+
 # Endpoint when no route 
 @app.route("/")
 def hello():
@@ -29,88 +84,214 @@ def health_check():
 def get_filtered_map_data():
     # filters = request.get_json()
     # print("Received filters:", filters)
-    data = request.get_json()
-    corine_url = "https://image.discomap.eea.europa.eu/arcgis/rest/services/Corine/CLC2018_WM/MapServer/0/query"
-    
-   # THIS code was used to load and prepare the ESRI geometry - borders of the CZ 
-    # borders_gdf = gpd.read_file("./ne_10m_admin_0_countries.shp")
-    # czech_polygon = borders_gdf[borders_gdf["ADMIN"] == "Czechia"].geometry.values[0]
-
-    # esri_geometry = {
-    #     "rings": mapping(czech_polygon)["coordinates"],
-    #     "spatialReference": {"wkid": 4326}
-    # }
-
-    # # Save to file (run this once)
-    # with open("czech_esri_geometry.json", "w") as f:
-    #     json.dump(esri_geometry, f)
-    # until here
-
-    # Later, in your fetch loop, load it from the file and use it:
-    with open("czech_esri_geometry.json", "r") as f:
-        esri_geometry_loaded = json.load(f)
-
-    all_features = []
-    result_offset = 0
-    page_size = 1000  # Max records per request
-    
-    while result_offset < 15001:
-        params = {
-            "f": "geojson",
-            "geometry": json.dumps(esri_geometry_loaded),
-            "geometryType": "esriGeometryPolygon",
-            "spatialRel": "esriSpatialRelIntersects",
-            "inSR": 4326,
-            "outSR": 4326,
-            "outFields": "*",
-            "returnGeometry": "true",
-            "resultOffset": result_offset,
-            "resultRecordCount": page_size,
-        }
-        
+    data = request.get_json(silent=True) or {}
+
+    # served from the local CORINE store (models/ingest_corine.py), no network per request;
+    # bbox = [south, west, north, east], zoom = web-map zoom, zone / classes = Code_18 (prefixes)
+    store = None if data.get("refresh") else load_store()
+    if store is not None:
+        bbox = data.get("bbox")
+        zoom = data.get("zoom")
+        classes = parse_classes(data.get("classes", data.get("zone")))
+        if bbox is None and zoom is None and not classes:
+            return Response(store.geojson, mimetype="application/json")
         try:
-            print(f"[DEBUG] Requesting offset {result_offset}", file=sys.stderr, flush=True)
-            response = requests.post(corine_url, data=params, stream=True, headers={'Content-Type': 'application/x-www-form-urlencoded'}, timeout=30)
-            response.raise_for_status()
-            data = response.json()
-            
-            features = data.get("features", [])
-            all_features.extend(features)
-            
-            # If server indicates no more data or fewer features than page_size returned, break loop
-            if not data.get("exceededTransferLimit", False) or len(features) < page_size:
-                break
-            
-            result_offset += page_size
-        
+            if bbox is not None and len(bbox) != 4:
+                raise ValueError("bbox must be [south, west, north, east]")
+            body = store.query(bbox, None if zoom is None else float(zoom), classes)
+        except (TypeError, ValueError) as e:
+            return jsonify({"error": str(e)}), 400
+        return Response(body, mimetype="application/json")
+
+    # no store built yet (or "refresh": true): page through the EEA server concurrently and
+    # stream the collection as pages arrive (the Czech border polygon was prepared once
+    # from ne_10m_admin_0_countries.shp, see czech_esri_geometry.json / corine.load_boundary)
+    pages = iter_pages()
+    try:
+        first = next(pages, [])
+    except Exception as e:
+        log.error("Exception during request: %s", e)
+        return jsonify({"error": str(e)}), 500
+
+    def stream():
+        try:
+            yield from stream_feature_collection(itertools.chain([first], pages))
         except Exception as e:
-            print(f"[ERROR] Exception during request: {str(e)}", file=sys.stderr, flush=True)
-            return jsonify({"error": str(e)}), 500
-    
-    geojson = {
-        "type": "FeatureCollection",
-        "features": all_features
-    }
+            # headers are gone already; the truncated body tells the client it failed
+            log.error("Exception during request: %s", e)
 
-    return jsonify(geojson)
+    return Response(stream(), mimetype="application/json")
     
 # ROUTE PLANNING 
 @app.route("/api/plan-route", methods=["POST"])
 def route_endpoint():
     try:
         data = request.get_json()
-        print("Received data:", data)
+        log.debug("plan-route request: %s", data)
         input_points = data.get("points", [])
-        
-        planned_route, length = compute_route(input_points)
-        print("Planned route:", planned_route)
+        # optional per-layer cost weights, e.g. {"natura": 2}; see GET /api/layers
+        weights = data.get("weights")
+        try:
+            # ?format= (or "format" in the body) wins over the Accept header, see routeformat.py
+            fmt = negotiate(request.args.get("format") or data.get("format"), request.headers.get("Accept"))
+            check_route_options(data.get("backend"), weights)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        if weights is not None and (data.get("optimizeOrder") or data.get("resolution") == "fine"):
+            return jsonify({"error": "weights are not supported with optimizeOrder or resolution fine."}), 400
 
-        return jsonify({"route": planned_route, "totalLength": length})
+        if request.args.get("async") in ("1", "true") or data.get("async"):
+            if data.get("optimizeOrder"):
+                return jsonify({"error": "optimizeOrder is not supported for async jobs."}), 400
+            # answer at once; progress via /api/jobs/<id>/events, result via /api/jobs/<id>/result
+            job = route_jobs.submit(input_points, resolution=data.get("resolution"), backend=data.get("backend"),
+                                    simplify=data.get("simplify"), weights=weights)
+            return jsonify({"job": job.id, "status": f"/api/jobs/{job.id}",
+                            "events": f"/api/jobs/{job.id}/events",
+                            "result": f"/api/jobs/{job.id}/result"}), 202, {"Location": f"/api/jobs/{job.id}"}
+
+        # stage timings / search counters: always in Server-Timing and /metrics,
+        # as a "debug" block in the body with ?debug=1 or "debug": true
+        trace = RouteTrace()
+        debug = request.args.get("debug") in ("1", "true") or bool(data.get("debug"))
+        extra = {}
+        if data.get("optimizeOrder"):
+            # visit the waypoints in the cheapest order (first fixed, last too unless fixEnd is false)
+            lon, lat, length, order, cost, clicked = plan_ordered_route(
+                input_points, fix_end=data.get("fixEnd", True), simplify=data.get("simplify"), trace=trace)
+            extra = {"order": order, "cost": cost, "clickedCost": clicked}
+        elif data.get("resolution") == "fine":
+            # finest level of the tiled grid pyramid, searched coarse to fine (plan.plan_route_fine)
+            lon, lat, length = plan_route_fine(input_points, simplify=data.get("simplify"), trace=trace)
+        else:
+            lon, lat, length = plan_route(input_points, backend=data.get("backend"),
+                                          simplify=data.get("simplify"), trace=trace, weights=weights)
+        log.debug("planned route: %d points, %s km", len(lon), length)
+        if debug:
+            extra["debug"] = trace.as_dict()
+        response = route_response(fmt, lon, lat, length, extra, trace)
+        trace.record()
+        return response
     
     except Exception as e:
-        print("Error in /api/plan-route:", str(e))
+        ROUTE_FAILURES.inc(endpoint="/api/plan-route")
+        log.error("Error in /api/plan-route: %s", e)
+        return jsonify({"error": str(e)}), 500
+
+def route_response(fmt, lon, lat, length, extra=None, trace=None):
+    """Encoded (and, if accepted, gzipped) route body, shared by the sync and job routes."""
+    started = time.perf_counter()
+    body, mimetype, headers = encode(fmt, lon, lat, length, extra)
+    body, encoding = compress(body, request.headers.get("Accept-Encoding"))
+    response = Response(body, mimetype=mimetype, headers={**headers, **encoding})
+    response.vary.add("Accept")
+    response.vary.add("Accept-Encoding")
+    if trace is not None:
+        trace.add_time("encode", time.perf_counter() - started)
+        response.headers["Server-Timing"] = trace.server_timing()
+    return response
+
+# ROUTE JOBS: status / cancel, progress stream, result
+@app.route("/api/jobs/<job_id>", methods=["GET", "DELETE"])
+def job_endpoint(job_id):
+    job = route_jobs.cancel(job_id) if request.method == "DELETE" else route_jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job."}), 404
+    return jsonify(job.progress()), 202 if request.method == "DELETE" else 200
+
+@app.route("/api/jobs/<job_id>/events", methods=["GET"])
+def job_events(job_id):
+    job = route_jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job."}), 404
+    return Response(events(job), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.route("/api/jobs/<job_id>/result", methods=["GET"])
+def job_result(job_id):
+    job = route_jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job."}), 404
+    if job.state == "failed":
+        return jsonify({"error": job.error}), 500
+    if job.state == "cancelled":
+        return jsonify({"error": "Job was cancelled."}), 410
+    if job.state != "done":
+        return jsonify(job.progress()), 409
+    try:
+        fmt = negotiate(request.args.get("format"), request.headers.get("Accept"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return route_response(fmt, *job.result)
+
+# BATCH ROUTE PLANNING: origins x destinations, one search tree per origin
+@app.route("/api/plan-routes", methods=["POST"])
+def routes_endpoint():
+    try:
+        data = request.get_json()
+        with_paths = bool(data.get("paths", False))
+        costs, lengths, paths = plan_routes(data.get("origins", []), data.get("destinations", []),
+                                            pairs=data.get("pairs"), with_paths=with_paths,
+                                            simplify=data.get("simplify"))
+        result = {"costs": costs, "lengths": lengths}
+        if with_paths:
+            # Google encoded polylines (precision 5), see routeformat.py
+            result["paths"] = [[encode_polyline(p[1], p[0]) if p is not None else None for p in row]
+                               for row in paths]
+            result["pathEncoding"] = "polyline"
+        body, encoding = compress(json.dumps(result, separators=(",", ":")).encode(),
+                                  request.headers.get("Accept-Encoding"))
+        response = Response(body, mimetype="application/json", headers=encoding)
+        response.vary.add("Accept-Encoding")
+        return response
+
+    except Exception as e:
+        ROUTE_FAILURES.inc(endpoint="/api/plan-routes")
+        log.error("Error in /api/plan-routes: %s", e)
         return jsonify({"error": str(e)}), 500
 
+# segment cache hit/miss counters (shared by all workers)
+@app.route("/api/segment-cache", methods=["GET"])
+def segment_cache_endpoint():
+    return jsonify(segment_cache_stats())
+
+# cost layers that /api/plan-route "weights" can scale (empty without final_grid_layers.npy)
+@app.route("/api/layers", methods=["GET"])
+def layers_endpoint():
+    return jsonify(cost_layers())
+
+# accumulated-cost surfaces of fixed targets (substations), see surfaces.py; they are built
+# offline by models/build_surfaces.py (a full-grid search and ~5 MB per target)
+@app.route("/api/surfaces", methods=["GET"])
+def surfaces_endpoint():
+    return jsonify({"targets": surface_targets()})
+
+# cost surface overview: ?factor= cells per pixel, ?format=json (NaN -> null) or png
+@app.route("/api/surfaces/<int:row>/<int:col>", methods=["GET"])
+def surface_overview(row, col):
+    surface = surface_store.get((row, col))
+    if surface is None:
+        return jsonify({"error": "No surface for this target."}), 404
+    try:
+        factor = max(1, int(request.args.get("factor", 8)))
+    except ValueError:
+        return jsonify({"error": "factor must be an integer"}), 400
+    if request.args.get("format", "json") == "png":
+        return Response(surface.png(factor), mimetype="image/png")
+    grid = surface.overview(factor)
+    values = [[None if v != v else int(v) for v in line] for line in grid.tolist()]
+    body, encoding = compress(json.dumps({"factor": factor, "shape": list(grid.shape), "cost": values},
+                                         separators=(",", ":")).encode(),
+                              request.headers.get("Accept-Encoding"))
+    response = Response(body, mimetype="application/json", headers=encoding)
+    response.vary.add("Accept-Encoding")
+    return response
+
+# Prometheus scrape endpoint (counters and histograms of all workers, see metrics.py)
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    return Response(render_metrics(metrics_store), mimetype="text/plain; version=0.0.4")
+
 # running the Flask server
 # 0.0.0.0: binds to all network interfaces, making your Flask app reachable from outside (e.g., your browser via the EC2 public IP).
 if __name__ == "__main__":
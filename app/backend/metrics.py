@@ -0,0 +1,318 @@
+"""
+metrics.py - per-request route traces and Prometheus-style metrics.
+
+RouteTrace collects what one /api/plan-route request spent its time on: wall time per
+stage (snap = reprojection + snapping, search, mask = corridor mask of the numpy backend
+(part of search), post = stitching / simplification / reprojection back, encode) and the search
+counters of every segment (nodes expanded, heap pushes, peak heap, corridor area in
+cells, and whether it came from a surface, the cache or a search). main.py returns it
+as a Server-Timing header and, on request, as a "debug" block.
+
+Finished traces are folded into the process-wide metrics below, which /metrics renders
+in the Prometheus text format (0.0.4). The registry is a small in-tree implementation
+(counters and histograms with labels) since prometheus_client is not a dependency.
+Values are kept per process; with several gunicorn workers each one publishes a snapshot
+of its registry into a SQLite file shared by all of them (MetricsStore, like jobs.JobStore)
+every PUBLISH_INTERVAL, and a scrape, whichever worker answers it, sums the snapshots of all
+workers of the running server (including workers that have since exited, so counters never go
+back).
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+NODE_BUCKETS = (1e3, 1e4, 3e4, 1e5, 3e5, 1e6, 3e6, 1e7)
+PUBLISH_INTERVAL = 1.0   # seconds between snapshots of a process's metrics in the shared store
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshots (
+    pid INTEGER PRIMARY KEY,
+    server INTEGER NOT NULL,
+    values_json TEXT NOT NULL,
+    updated REAL NOT NULL
+);
+"""
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _label_text(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values)) + "}"
+
+
+def _number(value):
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Counter:
+    def __init__(self, name, doc, labels=()):
+        self.name, self.doc, self.labels = name, doc, tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(n, "") for n in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def snapshot(self):
+        """[[label values, value], ...] (JSON-serialisable)."""
+        with self._lock:
+            return [[list(key), value] for key, value in self._values.items()]
+
+    @staticmethod
+    def merge(values, snapshot):
+        """Add one snapshot() into values ({label values: value})."""
+        for key, value in snapshot:
+            key = tuple(key)
+            values[key] = values.get(key, 0) + value
+
+    def render(self, values=None):
+        """Exposition lines of this process's values, or of values (merged snapshots)."""
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} counter"]
+        if values is None:
+            with self._lock:
+                values = dict(self._values)
+        items = sorted(values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_label_text(self.labels, key)} {_number(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, doc, labels=(), buckets=LATENCY_BUCKETS):
+        self.name, self.doc, self.labels = name, doc, tuple(labels)
+        self.buckets = tuple(float(b) for b in buckets)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(n, "") for n in self.labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            counts[-1] += 1
+            self._values[key] = (counts, total + value)
+
+    def snapshot(self):
+        """[[label values, bucket counts, sum], ...] (JSON-serialisable)."""
+        with self._lock:
+            return [[list(key), list(counts), total] for key, (counts, total) in self._values.items()]
+
+    @staticmethod
+    def merge(values, snapshot):
+        """Add one snapshot() into values ({label values: (bucket counts, sum)})."""
+        for key, counts, total in snapshot:
+            key = tuple(key)
+            if key in values:
+                old, old_total = values[key]
+                values[key] = ([a + b for a, b in zip(old, counts)], old_total + total)
+            else:
+                values[key] = (list(counts), total)
+
+    def render(self, values=None):
+        """Exposition lines of this process's values, or of values (merged snapshots)."""
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} histogram"]
+        if values is None:
+            with self._lock:
+                values = dict(self._values)
+        items = sorted((k, (list(c), s)) for k, (c, s) in values.items())
+        names = self.labels + ("le",)
+        for key, (counts, total) in items:
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                le = "+Inf" if bound == float("inf") else _number(bound)
+                lines.append(f"{self.name}_bucket{_label_text(names, key + (le,))} {count}")
+            lines.append(f"{self.name}_sum{_label_text(self.labels, key)} {_number(total)}")
+            lines.append(f"{self.name}_count{_label_text(self.labels, key)} {counts[-1]}")
+        return lines
+
+
+REQUEST_SECONDS = Histogram("greenhack_request_seconds", "HTTP request latency.",
+                            ("endpoint", "method", "status"))
+STAGE_SECONDS = Histogram("greenhack_route_stage_seconds", "Route planning time per stage.", ("stage",))
+SEGMENTS = Counter("greenhack_route_segments_total", "Route segments by backend and source.",
+                   ("backend", "source"))
+SEGMENT_EXPANDED = Histogram("greenhack_segment_expanded_nodes", "Nodes expanded per searched segment.",
+                             ("backend",), NODE_BUCKETS)
+HEAP_PUSHES = Counter("greenhack_search_heap_pushes_total", "Heap pushes of all segment searches.")
+ROUTE_FAILURES = Counter("greenhack_route_failures_total", "Route requests that raised.", ("endpoint",))
+REGISTRY = (REQUEST_SECONDS, STAGE_SECONDS, SEGMENTS, SEGMENT_EXPANDED, HEAP_PUSHES, ROUTE_FAILURES)
+
+
+def snapshot():
+    """This process's values of every metric, {name: metric.snapshot()}."""
+    return {metric.name: metric.snapshot() for metric in REGISTRY}
+
+
+def render(store=None):
+    """
+    All metrics in the Prometheus text exposition format: this process's values, or with a
+    MetricsStore the sum over every serving process (this one's snapshot published first).
+    """
+    snapshots = None
+    if store is not None:
+        try:
+            store.publish()
+            snapshots = store.collect()
+        except sqlite3.Error:
+            pass  # fall back to this process's values
+    lines = []
+    for metric in REGISTRY:
+        values = None
+        if snapshots is not None:
+            values = {}
+            for snap in snapshots:
+                metric.merge(values, snap.get(metric.name, []))
+        lines.extend(metric.render(values))
+    return "\n".join(lines) + "\n"
+
+
+class MetricsStore:
+    """
+    Metric snapshots of all serving processes in a SQLite file, one row per process.
+    Rows are tagged with the process's parent (the gunicorn master): a scrape sums the rows
+    of its own server, rows of an earlier server run are deleted.
+    """
+
+    def __init__(self, path, interval=PUBLISH_INTERVAL):
+        self.path = path
+        self.interval = interval
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._publisher = None
+        self._published = None
+        self._conn()
+
+    def _conn(self):
+        # one connection per process and thread (sqlite connections must not cross a fork)
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            conn.execute("DELETE FROM snapshots WHERE server != ?", (os.getppid(),))
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def publish(self):
+        """Store this process's snapshot (skipped when nothing changed since the last one)."""
+        text = json.dumps(snapshot(), separators=(",", ":"))
+        if text == self._published:
+            return
+        self._conn().execute(
+            "INSERT INTO snapshots (pid, server, values_json, updated) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (pid) DO UPDATE SET server = excluded.server, values_json = excluded.values_json, "
+            "updated = excluded.updated",
+            (os.getpid(), os.getppid(), text, time.time()))
+        self._published = text
+
+    def collect(self):
+        """The snapshots of every process of this server."""
+        rows = self._conn().execute("SELECT values_json FROM snapshots WHERE server = ?", (os.getppid(),))
+        return [json.loads(r[0]) for r in rows]
+
+    def start(self):
+        """
+        Publish every interval from a daemon thread (idempotent). Started on first use, like
+        the job publisher: threads do not survive the fork into the serving workers.
+        """
+        with self._lock:
+            if self._publisher is None or not self._publisher.is_alive():
+                self._publisher = threading.Thread(target=self._publish_loop, name="metrics-publisher",
+                                                   daemon=True)
+                self._publisher.start()
+
+    def _publish_loop(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.publish()
+            except sqlite3.Error:
+                pass  # the next round tries again
+
+
+def open_metrics_store(directories, filename, **kwargs):
+    """Open the metrics store in the first writable directory; None if none works."""
+    for directory in directories:
+        try:
+            return MetricsStore(os.path.join(directory, filename), **kwargs)
+        except (sqlite3.Error, OSError):
+            continue
+    return None
+
+
+class RouteTrace:
+    """Stage timings and per-segment search counters of one route request."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = {}
+        self.segments = []
+
+    @contextmanager
+    def stage(self, name):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - t0
+
+    def add_time(self, name, seconds):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def add_segment(self, backend, source, stats=None):
+        """source: "search", "cache" or "surface"; stats: the find_path stats dict."""
+        stats = stats or {}
+        self.segments.append({
+            "backend": backend,
+            "source": source,
+            "expanded": int(stats.get("expanded", 0)),
+            "pushes": int(stats.get("pushes", 0)),
+            "peakHeap": int(stats.get("peak_heap", 0)),
+            "areaCells": int(stats.get("window_cells", 0)),
+        })
+
+    def totals(self):
+        return {
+            "expanded": sum(s["expanded"] for s in self.segments),
+            "pushes": sum(s["pushes"] for s in self.segments),
+            "peakHeap": max((s["peakHeap"] for s in self.segments), default=0),
+            "areaCells": sum(s["areaCells"] for s in self.segments),
+        }
+
+    def as_dict(self):
+        return {
+            "stagesMs": {k: round(v * 1e3, 3) for k, v in self.stages.items()},
+            "totalMs": round((time.perf_counter() - self.started) * 1e3, 3),
+            **self.totals(),
+            "segments": self.segments,
+        }
+
+    def server_timing(self):
+        """Server-Timing header value (durations in ms)."""
+        parts = [f"{k};dur={v * 1e3:.2f}" for k, v in self.stages.items()]
+        parts.append(f"total;dur={(time.perf_counter() - self.started) * 1e3:.2f}")
+        return ", ".join(parts)
+
+    def record(self):
+        """Fold this trace into the process metrics."""
+        for name, seconds in self.stages.items():
+            STAGE_SECONDS.observe(seconds, stage=name)
+        for seg in self.segments:
+            SEGMENTS.inc(backend=seg["backend"], source=seg["source"])
+            if seg["source"] == "search":
+                SEGMENT_EXPANDED.observe(seg["expanded"], backend=seg["backend"])
+                HEAP_PUSHES.inc(seg["pushes"])
@@ -0,0 +1,143 @@
+"""
+ordering.py - visiting order of route waypoints from a pairwise cost matrix.
+
+The grid is directed (a step costs the cell it enters), so cost[i][j] != cost[j][i] in
+general and the solvers below never assume symmetry. The first waypoint always stays
+first; with fix_end the last one also stays last, otherwise the route may end anywhere.
+
+- up to EXACT_MAX free waypoints: Held-Karp dynamic programme over subsets, exact;
+- more: 2-opt (segment reversal) and or-opt (moving runs of 1-3 waypoints) until neither
+  improves, once from a nearest-neighbour start and once from the given order; the
+  cheaper result wins, so it never costs more than the input order. Every move is priced
+  in O(1) from prefix sums of the forward and backward leg costs along the current order.
+Unreachable pairs are given UNREACHABLE, so they are only used when nothing else works.
+"""
+
+import numpy as np
+
+EXACT_MAX = 12           # free waypoints solved exactly (2^n * n^2 work)
+UNREACHABLE = 1 << 40    # cost of a pair the search could not connect
+OR_OPT_RUNS = (1, 2, 3)  # run lengths tried by or-opt
+
+
+def order_cost(cost, order):
+    """Total cost of visiting order (consecutive legs only)."""
+    order = np.asarray(order)
+    return int(cost[order[:-1], order[1:]].sum())
+
+
+def solve_order(cost, fix_end=True):
+    """
+    Cheapest visiting order for an n x n cost matrix (int, UNREACHABLE for missing legs).
+    Returns a list of waypoint indices starting with 0 (and ending with n - 1 if fix_end).
+    """
+    cost = np.asarray(cost, dtype=np.int64)
+    n = cost.shape[0]
+    if n <= 2 or (fix_end and n == 3):
+        return list(range(n))
+    free = list(range(1, n - 1 if fix_end else n))
+    if len(free) <= EXACT_MAX:
+        return _held_karp(cost, free, fix_end)
+    # local search from the nearest-neighbour tour and from the given order, so the result is
+    # never dearer than visiting the waypoints as they came
+    given = [0] + free + ([n - 1] if fix_end else [])
+    candidates = [_improve(cost, _nearest_neighbour(cost, free, fix_end), fix_end), _improve(cost, given, fix_end)]
+    return min(candidates, key=lambda order: order_cost(cost, order))
+
+
+def _held_karp(cost, free, fix_end):
+    """Exact DP: best[mask, j] = cheapest path from 0 through the free nodes in mask ending at free[j]."""
+    m = len(free)
+    idx = np.array(free)
+    inner = cost[np.ix_(idx, idx)]
+    full = (1 << m) - 1
+    best = np.full((1 << m, m), np.iinfo(np.int64).max // 4, dtype=np.int64)
+    came = np.full((1 << m, m), -1, dtype=np.int64)
+    bits = 1 << np.arange(m)
+    best[bits, np.arange(m)] = cost[0, idx]
+    for mask in range(1, full + 1):
+        inside = (mask & bits) != 0
+        row = best[mask]
+        # extend every path ending inside the mask by one node outside it
+        step = row[inside][:, None] + inner[inside]
+        pick = step.argmin(axis=0)
+        value = step[pick, np.arange(m)]
+        src = np.flatnonzero(inside)[pick]
+        for k in np.flatnonzero(~inside):
+            nxt = mask | (1 << k)
+            if value[k] < best[nxt, k]:
+                best[nxt, k] = value[k]
+                came[nxt, k] = src[k]
+    tail = best[full] + (cost[idx, cost.shape[0] - 1] if fix_end else 0)
+    j = int(tail.argmin())
+    mask = full
+    rev = []
+    while j >= 0:
+        rev.append(free[j])
+        j, mask = int(came[mask, j]), mask & ~(1 << j)
+    order = [0] + rev[::-1]
+    return order + [cost.shape[0] - 1] if fix_end else order
+
+
+def _nearest_neighbour(cost, free, fix_end):
+    order = [0]
+    left = set(free)
+    while left:
+        here = order[-1]
+        nxt = min(left, key=lambda j: cost[here, j])
+        order.append(nxt)
+        left.discard(nxt)
+    return order + [cost.shape[0] - 1] if fix_end else order
+
+
+def _improve(cost, order, fix_end):
+    """2-opt and or-opt moves on the free part of order until a full pass finds nothing."""
+    order = list(order)
+    n = len(order)
+    last = n - 2 if fix_end else n - 1   # last movable position
+    improved = True
+    while improved:
+        improved = False
+        seq = np.array(order)
+        fwd = np.concatenate(([0], np.cumsum(cost[seq[:-1], seq[1:]])))
+        bwd = np.concatenate(([0], np.cumsum(cost[seq[1:], seq[:-1]])))
+        # 2-opt: reverse order[i..j]
+        for i in range(1, last):
+            for j in range(i + 1, last + 1):
+                a, si, sj = order[i - 1], order[i], order[j]
+                delta = (cost[a, sj] - cost[a, si]) + (bwd[j] - bwd[i]) - (fwd[j] - fwd[i])
+                if j + 1 < n:
+                    b = order[j + 1]
+                    delta += cost[si, b] - cost[sj, b]
+                if delta < 0:
+                    order[i:j + 1] = order[i:j + 1][::-1]
+                    improved = True
+                    break
+            if improved:
+                break
+        if improved:
+            continue
+        # or-opt: move the run order[i..i+k-1] between order[p] and order[p+1]
+        for k in OR_OPT_RUNS:
+            for i in range(1, last - k + 2):
+                j = i + k - 1
+                a, si, sj = order[i - 1], order[i], order[j]
+                b = order[j + 1] if j + 1 < n else None
+                removed = cost[a, si] + (cost[sj, b] - cost[a, b] if b is not None else 0)
+                for p in range(0, last + 1):
+                    if i - 1 <= p <= j:
+                        continue
+                    q = order[p + 1] if p + 1 < n else None
+                    added = cost[order[p], si] + (cost[sj, q] - cost[order[p], q] if q is not None else 0)
+                    if added < removed:
+                        run = order[i:j + 1]
+                        rest = order[:i] + order[j + 1:]
+                        at = rest.index(order[p]) + 1
+                        order = rest[:at] + run + rest[at:]
+                        improved = True
+                        break
+                if improved:
+                    break
+            if improved:
+                break
+    return order
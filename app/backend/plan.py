@@ -5,31 +5,102 @@ Features:
 - Keeps your reprojection and grid loading (transform.pkl, final_grid.npy).
 - A* core uses NumPy arrays (no Python dict overhead).
 - Corridor mask to drastically limit search area.
-- Optional parallel execution for multiple segments (each worker loads the grid itself).
+- Windowed search: the corridor's bounding box plus CORRIDOR_WIDTH is cropped out of the grid and
+  searched with window-sized arrays, so short segments cost time/memory proportional to their
+  corridor. (Unlike the full-grid mask, the band then stops CORRIDOR_WIDTH past the endpoints.)
+- Adaptive corridor: with ADAPTIVE_CORRIDOR the flat/alt search starts at the requested width
+  and resumes with the next wider entry of CORRIDOR_WIDTHS while the search fails or the path
+  touches the corridor edge. Per-attempt stats end up in stats["attempts"].
+- Selectable search backend: "flat" (compiled flat-index kernel in gridsearch.py) or
+  "numpy" (the original a_star_numpy_grid loop). At the same fixed corridor width both return
+  identical paths; with ADAPTIVE_CORRIDOR "flat" may widen past it and find a cheaper path.
+- Optional hierarchical search ("hpa", hierarchy.py) for long segments when the abstraction
+  graph built by models/build_hierarchy.py sits next to final_grid.npy.
+- Optional landmark (ALT) heuristic ("alt", landmarks.py) from tables built by
+  models/build_landmarks.py; admissible, so it also returns cost-optimal corridor paths.
+- Bidirectional Dijkstra ("bidir", gridsearch.bidirectional_flat): forward from the start and
+  backward from the goal until the two frontiers prove the best meeting point. Exact within the
+  corridor; per request via backend="bidir", or for every long segment (>= BIDIR_MIN_DISTANCE)
+  without a usable hierarchy when USE_BIDIRECTIONAL is set.
+- Optional parallel execution for multiple segments on a persistent worker pool.
+- Segment cache (segcache.py): finished segment paths are kept in final_grid_segments.sqlite,
+  shared by all workers, keyed on snapped start/goal cells, corridor width, backend and a grid /
+  search-settings version; repeated or overlapping routes only search their new segments.
+  segment_cache_stats() reports hits/misses.
+- Cost surfaces (surfaces.py): for fixed targets (substations, USE_SURFACES) registered offline
+  by models/build_surfaces.py a whole-grid accumulated-cost raster and a 1-byte next-step raster
+  sit in final_grid_surfaces/; a segment ending on such a target is a walk along the
+  directions, no search, and exact.
+- Array post-processing: the whole cell path goes through one affine transform, one pyproj call
+  and a vectorised haversine; with SIMPLIFY_ROUTE each segment is reduced by Douglas-Peucker
+  (SIMPLIFY_TOLERANCE cells, 0 = only drop collinear points), so 4-connected staircases come
+  back as a few vertices. The reported length is always measured on the full cell path.
+- Batch planning (plan_routes): origin/destination sets are snapped in one pass, pairs are grouped
+  by origin cell and each origin runs one Dijkstra (gridsearch.dijkstra_flat) that stops once all
+  of its destinations are settled (optionally inside their bounding box + BATCH_MARGIN). Groups
+  run on the worker pool. Costs are exact, so never above what compute_route finds for a pair.
+- Waypoint ordering (plan_ordered_route): pairwise cost matrix from one multi-target Dijkstra
+  per waypoint, visiting order from ordering.py (exact up to ordering.EXACT_MAX free waypoints,
+  2-opt / or-opt beyond), route stitched from the trees' own paths.
+- Progress and cancellation: plan_route(control=..., on_segment=...) runs the searches in the
+  calling thread with a gridsearch control vector that the flat/alt/numpy searches update and
+  check every CHECK_INTERVAL expansions; jobs.py uses it for background route jobs.
+- Multi-resolution grid (pyramid.py, plan_route_fine): when models/prepare_rasters.py has built
+  final_grid_pyramid/ (tiled, memory-mapped levels, finest first), routes can be planned on its
+  finest level: the top level is searched whole, each finer level only in a band around the path
+  one level up, so memory follows the tiles touched, not the grid size.
+- Query-time layer weights (costlayers.py): plan_route(weights={"natura": 2, ...}) routes on
+  sum(w_k * layer_k) of the per-layer stack final_grid_layers.npy instead of final_grid. The
+  weighted grid is computed lazily over each segment's search window and kept per weight vector
+  (LRU); such segments use the flat / numpy / bidir backends (the hierarchy, landmark and
+  surface tables belong to final_grid) and run in this process.
+- Instrumentation: plan_route / plan_ordered_route(trace=metrics.RouteTrace()) record stage
+  timings and per-segment search counters (main.py: Server-Timing, debug block, /metrics).
 - Returns the same output your frontend expects:
     {"route": [{"x": <lng>, "y": <lat>}, ...], "totalLength": <km>}
 
 Usage:
 - Drop into your backend (same folder as transform.pkl and final_grid.npy).
 - Import compute_route(points) into main.py or your Flask route.
-- Configure DEBUG, USE_PARALLEL, CORRIDOR_WIDTH, SEGMENT_TIMEOUT if needed.
+- Configure DEBUG, USE_PARALLEL, CORRIDOR_WIDTH, SEGMENT_TIMEOUT, SEARCH_BACKEND if needed.
 
 Notes:
-- Parallel mode spawns processes that each load final_grid.npy. This avoids copying a big numpy
-  array from the parent process and is more robust on macOS.
+- The routing grid is a uint16 copy of final_grid.npy (final_grid_costs.npy, rebuilt when the
+  source is newer; negative scores clamp to 0, see gridsearch.routing_costs) that every process
+  memory-maps read-only, so the parent and all pool workers share one copy through the page cache.
+- Parallel mode keeps one long-lived process pool per serving process (start_worker_pool() after
+  the fork, see gunicorn.conf.py, or lazily on the first multi-segment route). Results come back
+  in segment order and SEGMENT_TIMEOUT is enforced: a timed-out segment fails its route and is
+  cancelled through its own control vector; only a search that cannot be cancelled gets its
+  pool retired, once the other requests' tasks on it are done (_retire).
 - Keep your Docker/Gunicorn memory/timeouts reasonable; this reduces memory usage but very large
   queries may still be heavy.
 """
 
-from rasterio.transform import rowcol
+from affine import Affine
 import numpy as np
 import pickle
 from pyproj import Transformer
 from math import radians, sin, cos, sqrt, atan2
 import heapq
-from concurrent.futures import ProcessPoolExecutor, as_completed
+import atexit
+import multiprocessing
 import os
+import signal
+import tempfile
+import threading
 import time
+from contextlib import nullcontext
+from gridsearch import (a_star_flat, a_star_widening, bidirectional_flat, corridor_window, dijkstra_flat,
+                        grid_digest, new_control, routing_costs, settled_costs, simplify_kernel, trace_path,
+                        SearchCancelled, CHECK_INTERVAL, CTL_BEST_F, CTL_CANCEL, CTL_EXPANDED, HAVE_NUMBA)
+from hierarchy import hpa_search, load_abstraction, MAX_EXCESS
+from costlayers import load_layer_stack
+from landmarks import load_landmarks
+from ordering import order_cost, solve_order, UNREACHABLE
+from pyramid import coarse_to_fine, load_pyramid
+from segcache import open_segment_cache
+from surfaces import SurfaceStore
 
 # ------------- CONFIG -------------
 DEBUG = False            # Set True to print debug traces
@@ -37,6 +108,28 @@ USE_PARALLEL = True      # Use multiprocessing for multiple segments
 CORRIDOR_WIDTH = 40      # corridor half-width in grid cells (tweak to taste)
 SEGMENT_TIMEOUT = 25     # seconds per segment (worker timeout)
 MAX_WORKERS = 3          # processes for parallel execution (min(cores, ...))
+SEARCH_BACKEND = "flat" if HAVE_NUMBA else "numpy"  # "flat" (compiled) or "numpy" (legacy loop)
+USE_HIERARCHY = True     # route long segments through final_grid_hpa.npz when present
+HPA_MIN_DISTANCE = 300   # Manhattan distance (cells) from which a segment counts as long
+HPA_TOLERANCE = MAX_EXCESS  # max validated cost excess vs. the exact optimum before HPA is disabled
+USE_LANDMARKS = True     # use the ALT heuristic (final_grid_alt*.npy) instead of Manhattan when present
+WINDOWED_SEARCH = True   # search a crop of the corridor's bounding box (+CORRIDOR_WIDTH) instead of the full grid
+ADAPTIVE_CORRIDOR = True # flat/alt: widen the corridor through CORRIDOR_WIDTHS while the path hugs its edge
+CORRIDOR_WIDTHS = (40, 80)  # widening schedule; tune with benchmarks/bench_corridor_schedule.py
+USE_BIDIRECTIONAL = False # long segments without a usable hierarchy use bidirectional Dijkstra
+                          # (off: on final_grid it is ~1.5x slower than Manhattan A*, see benchmarks/bench_bidirectional.py)
+BIDIR_MIN_DISTANCE = 300 # Manhattan distance (cells) from which bidirectional search is chosen
+USE_SEGMENT_CACHE = True # reuse segment paths across requests and workers (final_grid_segments.sqlite)
+SEGMENT_CACHE_SIZE = 5000     # max cached segments (least recently used are evicted)
+SEGMENT_CACHE_TTL = 24 * 3600 # seconds a cached segment stays valid
+SIMPLIFY_ROUTE = True    # return a simplified polyline instead of every grid cell
+SIMPLIFY_TOLERANCE = 1.0 # max deviation (grid cells) of the simplified route from the cell path
+BATCH_MARGIN = None      # plan_routes: limit each tree to the origin/destinations bounding box + this
+                         # many cells (None = whole grid, exact; cheap detours can run far outside)
+USE_SURFACES = True      # answer segments ending on a registered target from its cost surface
+ORDER_MAX_WAYPOINTS = 30 # plan_ordered_route: one full-grid tree per waypoint, keep it bounded
+USE_PYRAMID = True       # plan_route_fine on final_grid_pyramid/ when it has been built
+WEIGHTED_BACKENDS = ("flat", "numpy", "bidir")  # backends that can search a weighted grid
 # ----------------------------------
 
 # Load transformers and grid
@@ -46,24 +139,92 @@ to_wgs84 = Transformer.from_crs("EPSG:5514", "EPSG:4326", always_xy=True)
 _BASE = os.path.dirname(__file__) if '__file__' in globals() else '.'
 _transform_path = os.path.join(_BASE, "transform.pkl")
 _grid_path = os.path.join(_BASE, "final_grid.npy")
+_hpa_path = os.path.join(_BASE, "final_grid_hpa.npz")
+_alt_prefix = os.path.join(_BASE, "final_grid_alt")
+_surface_dir = os.path.join(_BASE, "final_grid_surfaces")
+_pyramid_dir = os.path.join(_BASE, "final_grid_pyramid")
+_layers_prefix = os.path.join(_BASE, "final_grid_layers")
 
 with open(_transform_path, "rb") as f:
     transform = pickle.load(f)
 
+def _routing_grid_path():
+    """
+    Path of a uint16 copy of final_grid.npy that processes can memory-map.
+    Written next to the source grid (or in the temp dir if that is read-only) and
+    rewritten whenever final_grid.npy is newer. Returns None if neither is writable.
+    """
+    for directory in (_BASE, tempfile.gettempdir()):
+        path = os.path.join(directory, "final_grid_costs.npy")
+        try:
+            if not os.path.exists(path) or os.path.getmtime(path) < os.path.getmtime(_grid_path):
+                tmp = f"{path}.{os.getpid()}.tmp"
+                with open(tmp, "wb") as fh:
+                    np.save(fh, routing_costs(np.load(_grid_path)))
+                os.replace(tmp, path)
+            return path
+        except OSError:
+            continue
+    return None
+
+def load_routing_grid():
+    """Read-only uint16 routing grid, memory-mapped when possible."""
+    path = _routing_grid_path()
+    if path is None:
+        return routing_costs(np.load(_grid_path))
+    # np.asarray drops the memmap subclass but keeps the shared mapping
+    return np.asarray(np.load(path, mmap_mode="r"))
+
 # final_grid: lower cost = preferred (I assume)
-# Load grid and convert to lightweight dtype
-final_grid = np.load(_grid_path).astype(np.uint16)
-  # keep in memory for single-process use
+# uint16 costs, shared read-only by this process and the pool workers
+final_grid = load_routing_grid()
+
+# HPA* abstraction graph (None if not built or built for another grid)
+hierarchy_graph = load_abstraction(_hpa_path, final_grid)
+# ALT landmark tables, memory-mapped (None if not built or built for another grid)
+landmark_tables = load_landmarks(_alt_prefix, final_grid)
+# hashed once: the segment cache version and the surface store both check it
+_grid_digest = grid_digest(final_grid)
+# cost surfaces of fixed targets, memory-mapped on first use (stale ones are ignored)
+surface_store = SurfaceStore(_surface_dir, final_grid, _grid_digest)
+# tiled multi-resolution grid (None if not built); only meta.json is read here, tiles on demand
+grid_pyramid = load_pyramid(_pyramid_dir) if USE_PYRAMID else None
+# per-layer cost stack for request weights (None if not built or built for another grid)
+layer_stack = load_layer_stack(_layers_prefix, _grid_digest)
+
+def _cache_version():
+    """Grid fingerprint plus the settings that change which path a backend returns."""
+    settings = (WINDOWED_SEARCH, ADAPTIVE_CORRIDOR, CORRIDOR_WIDTHS,
+                hierarchy_graph is not None, landmark_tables is not None)
+    return f"{_grid_digest[:16]}:{settings}"
+
+# segment results shared by every worker (None if disabled or no writable location)
+segment_cache = (open_segment_cache((_BASE, tempfile.gettempdir()), "final_grid_segments.sqlite",
+                                    _cache_version(), final_grid.shape[1],
+                                    max_entries=SEGMENT_CACHE_SIZE, ttl=SEGMENT_CACHE_TTL)
+                 if USE_SEGMENT_CACHE else None)
+
+def segment_cache_stats():
+    """Cache counters for monitoring ({} when the cache is off)."""
+    return segment_cache.stats() if segment_cache is not None else {}
 
 # ------------- helpers: coordinate transforms -------------
 def coords_to_index(x, y, transform_local=transform):
     """
-    Convert S-JTSK coordinates (x,y in EPSG:5514) to grid row,col using rasterio.transform.rowcol.
+    Convert S-JTSK coordinates (x,y in EPSG:5514) to grid row,col (same as rasterio.transform.rowcol).
     Returns (row, col) integers.
     """
     row, col = rowcol(transform_local, x, y)
     return int(row), int(col)
 
+def rowcol(transform_local, x, y):
+    """
+    Cell (row, col) containing S-JTSK x, y (scalars or arrays) for an affine grid transform:
+    the floor of the inverse transform, like rasterio.transform.rowcol, without importing rasterio.
+    """
+    col, row = ~transform_local * (np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64))
+    return np.floor(row).astype(np.int64), np.floor(col).astype(np.int64)
+
 def index_to_coords(row, col, transform_local=transform):
     """
     Convert grid row,col to S-JTSK coordinates (x,y).
@@ -89,6 +250,46 @@ def haversine(lat1, lon1, lat2, lon2):
     c = 2 * atan2(sqrt(a), sqrt(1 - a))
     return R * c
 
+def cells_to_lonlat(cells, transform_local=transform):
+    """
+    Vectorised index_to_coords + to_wgs84 for an (N, 2) array of (row, col) cells.
+    Returns (lon, lat) float arrays of the cell centres.
+    """
+    a, b, c, d, e, f = tuple(transform_local)[:6]
+    cc = cells[:, 1] + 0.5
+    rr = cells[:, 0] + 0.5
+    lon, lat = to_wgs84.transform(a * cc + b * rr + c, d * cc + e * rr + f)
+    return np.asarray(lon, dtype=np.float64), np.asarray(lat, dtype=np.float64)
+
+def haversine_path(lat, lon):
+    """Total length in kilometres of the polyline through lat/lon arrays (degrees)."""
+    if len(lat) < 2:
+        return 0.0
+    lat = np.radians(lat)
+    lon = np.radians(lon)
+    dlat = np.diff(lat)
+    dlon = np.diff(lon)
+    a = np.sin(dlat / 2)**2 + np.cos(lat[:-1]) * np.cos(lat[1:]) * np.sin(dlon / 2)**2
+    return float(np.sum(2 * 6371.0 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))))
+
+def simplify_path(cells, tolerance):
+    """
+    Indices of the vertices kept by Douglas-Peucker on an (N, 2) cell path (endpoints
+    always kept). tolerance is in cells; 0 keeps every turn and only drops collinear points.
+    """
+    n = len(cells)
+    if n < 3:
+        return np.arange(n)
+    # collinear points never survive, so only the turns go into Douglas-Peucker
+    d = np.diff(cells, axis=0)
+    turns = np.flatnonzero((d[1:] != d[:-1]).any(axis=1)) + 1
+    candidates = np.concatenate(([0], turns, [n - 1]))
+    if tolerance <= 0 or len(candidates) < 3:
+        return candidates
+    keep = np.zeros(len(candidates), dtype=np.bool_)
+    simplify_kernel(cells[candidates].astype(np.float64), float(tolerance), keep)
+    return candidates[keep]
+
 # ------------- Optimised A* (NumPy arrays, no dicts) -------------
 def make_corridor_mask(grid_shape, start_rc, goal_rc, width):
     """
@@ -121,11 +322,15 @@ def make_corridor_mask(grid_shape, start_rc, goal_rc, width):
     mask = num <= (width * np.sqrt(denom))
     return mask
 
-def a_star_numpy_grid(grid, start, goal, corridor_mask=None):
+def a_star_numpy_grid(grid, start, goal, corridor_mask=None, control=None, stats=None):
     """
     grid: 2D numpy array of costs (lower = preferred)
     start, goal: (row, col) tuples of integers
     corridor_mask: optional boolean array same shape as grid (True=allowed)
+    control: optional gridsearch control vector; every CHECK_INTERVAL expansions the
+      expanded count and best f are written to it and SearchCancelled is raised if its
+      cancel flag is set
+    stats: optional dict filled with expanded / pushes / peak_heap
     returns: list of (row,col) tuples path from start to goal or empty list if not found
     """
     rows, cols = grid.shape
@@ -165,11 +370,21 @@ def a_star_numpy_grid(grid, start, goal, corridor_mask=None):
     moves = ((-1,0), (1,0), (0,-1), (0,1))
 
     # main loop
+    expanded = 0
+    peak = 1
     while heap:
         fval, _, (r, c) = heapq.heappop(heap)
         if visited[r, c]:
             continue
         visited[r, c] = True
+        expanded += 1
+
+        # cooperative checkpoint: report progress, stop if cancelled
+        if control is not None and expanded % CHECK_INTERVAL == 0:
+            control[CTL_EXPANDED] += CHECK_INTERVAL
+            control[CTL_BEST_F] = int(fval)
+            if control[CTL_CANCEL]:
+                raise SearchCancelled()
 
         # reached goal?
         if r == gr and c == gc:
@@ -183,6 +398,8 @@ def a_star_numpy_grid(grid, start, goal, corridor_mask=None):
                     break
                 cr, cc = pr, pc
             path.reverse()
+            if stats is not None:
+                stats.update(expanded=expanded, pushes=counter, peak_heap=peak)
             return path
 
         for dr, dc in moves:
@@ -204,112 +421,760 @@ def a_star_numpy_grid(grid, start, goal, corridor_mask=None):
                 h = heuristic(nr, nc, gr, gc)
                 heapq.heappush(heap, (tentative + h, counter, (nr, nc)))
                 counter += 1
+                if len(heap) > peak:
+                    peak = len(heap)
 
     # not found
+    if stats is not None:
+        stats.update(expanded=expanded, pushes=counter, peak_heap=peak)
     return []
 
-# ------------- worker function for parallel segments -------------
-def _astar_worker(args):
+SEARCH_BACKENDS = ("flat", "numpy", "hpa", "alt", "bidir")
+
+def hierarchy_usable():
+    """True when the abstraction graph is loaded and validated within HPA_TOLERANCE."""
+    return hierarchy_graph is not None and hierarchy_graph.max_excess <= HPA_TOLERANCE
+
+def segment_backend(start_rc, goal_rc, backend=None):
+    """
+    Backend for one segment: an explicit backend wins, otherwise long segments go
+    through the hierarchy (if usable) or bidirectional search, the rest use landmarks
+    (if loaded) or SEARCH_BACKEND.
+    """
+    if backend:
+        return backend
+    dist = abs(start_rc[0] - goal_rc[0]) + abs(start_rc[1] - goal_rc[1])
+    if USE_HIERARCHY and dist >= HPA_MIN_DISTANCE and hierarchy_usable():
+        return "hpa"
+    if USE_BIDIRECTIONAL and HAVE_NUMBA and dist >= BIDIR_MIN_DISTANCE:
+        return "bidir"
+    if USE_LANDMARKS and landmark_tables is not None and SEARCH_BACKEND == "flat":
+        return "alt"
+    return SEARCH_BACKEND
+
+def widening_schedule(width):
+    """Corridor widths tried by the adaptive flat/alt search: width, then the wider CORRIDOR_WIDTHS."""
+    return (width, *(w for w in CORRIDOR_WIDTHS if w > width))
+
+def find_path(grid, start_rc, goal_rc, width, backend=None, stats=None, control=None):
+    """
+    Run one corridor-limited segment search with the selected backend.
+    width: corridor half-width in cells; with ADAPTIVE_CORRIDOR the flat/alt search starts
+      there and may widen through widening_schedule(width).
+    backend: "flat", "numpy", "hpa", "alt" or "bidir"; None picks via segment_backend().
+    stats: optional dict filled by the backends (nodes expanded, heap pushes, peak heap,
+      search area in window_cells, workspace / peak memory in bytes, abstract path figures;
+      mask_s for the numpy corridor mask).
+    control: optional gridsearch control vector, checked inside the flat/alt/numpy
+      searches (hpa and bidir only run to completion).
+    returns: list of (row,col) tuples or empty list if not found
+    """
+    backend = segment_backend(start_rc, goal_rc, backend)
+    if backend == "hpa":
+        if hierarchy_graph is None:
+            raise RuntimeError("HPA backend requested but final_grid_hpa.npz is missing or stale; "
+                               "run models/build_hierarchy.py")
+        rows, cols = grid.shape
+        (sr, sc), (gr, gc) = start_rc, goal_rc
+        if not (0 <= sr < rows and 0 <= sc < cols and 0 <= gr < rows and 0 <= gc < cols):
+            return []
+        return hpa_search(hierarchy_graph, grid, start_rc, goal_rc, stats=stats)
+    window = None
+    if WINDOWED_SEARCH and width is not None:
+        rows, cols = grid.shape
+        (sr, sc), (gr, gc) = start_rc, goal_rc
+        if not (0 <= sr < rows and 0 <= sc < cols and 0 <= gr < rows and 0 <= gc < cols):
+            return []
+        window = corridor_window(grid.shape, start_rc, goal_rc, width)
+    if backend == "alt" and landmark_tables is None:
+        raise RuntimeError("ALT backend requested but final_grid_alt tables are missing or stale; "
+                           "run models/build_landmarks.py")
+    if ADAPTIVE_CORRIDOR and backend in ("flat", "alt") and width is not None:
+        return a_star_widening(grid, start_rc, goal_rc, widening_schedule(width),
+                               landmarks=landmark_tables if backend == "alt" else None,
+                               windowed=WINDOWED_SEARCH, stats=stats, control=control)
+    if backend == "bidir":
+        return bidirectional_flat(grid, start_rc, goal_rc, corridor_width=width, window=window, stats=stats)
+    if backend == "alt":
+        return a_star_flat(grid, start_rc, goal_rc, corridor_width=width, stats=stats,
+                           landmarks=landmark_tables, window=window, control=control)
+    if backend == "flat":
+        # corridor test is evaluated inside the kernel, no full-grid mask needed;
+        # search buffers come from the per-thread workspace in gridsearch.py
+        return a_star_flat(grid, start_rc, goal_rc, corridor_width=width, stats=stats, window=window,
+                           control=control)
+    if backend == "numpy":
+        t0 = time.perf_counter()
+        if window is None:
+            mask = make_corridor_mask(grid.shape, start_rc, goal_rc, width)
+            if stats is not None:
+                stats["mask_s"] = time.perf_counter() - t0
+                stats["window_cells"] = grid.size
+            return a_star_numpy_grid(grid, start_rc, goal_rc, corridor_mask=mask, control=control, stats=stats)
+        # same search on the cropped view, in window-local coordinates
+        r_lo, r_hi, c_lo, c_hi = window
+        sub = grid[r_lo:r_hi, c_lo:c_hi]
+        local_s = (start_rc[0] - r_lo, start_rc[1] - c_lo)
+        local_g = (goal_rc[0] - r_lo, goal_rc[1] - c_lo)
+        mask = make_corridor_mask(sub.shape, local_s, local_g, width)
+        if stats is not None:
+            stats["mask_s"] = time.perf_counter() - t0
+            stats["window_cells"] = sub.size
+        path = a_star_numpy_grid(sub, local_s, local_g, corridor_mask=mask, control=control, stats=stats)
+        return [(r + r_lo, c + c_lo) for (r, c) in path]
+    raise ValueError(f"Unknown search backend: {backend!r} (expected one of {SEARCH_BACKENDS})")
+
+# ------------- persistent worker pool for parallel segments -------------
+CONTROL_SLOTS = 1024     # pool tasks in flight that can be cancelled one by one
+CANCEL_GRACE = 2         # seconds a timed-out task gets to stop at its next checkpoint
+
+_pool = None
+_pool_lock = threading.Lock()
+# in pool processes: the shared control vectors and start times of their pool (see _SegmentPool)
+_pool_controls = None
+_pool_starts = None
+
+class _SegmentPool:
     """
-    Worker function executed in a separate process.
-    Loads grid from disk (final_grid.npy) to avoid pickling huge arrays.
-    args: (start_rc, goal_rc, width)
-    returns: list of (r,c) tuples or empty list
+    A process pool plus, per task in flight, a control vector and the time.monotonic() it
+    started at (0 while queued; system-wide on Linux), in shared memory: a task that outlives
+    SEGMENT_TIMEOUT from its own start is cancelled on its own (the kernels stop at their next
+    checkpoint) instead of the pool being recycled under the other requests' tasks.
+    """
+
+    def __init__(self, context):
+        raw = context.RawArray("q", CONTROL_SLOTS * len(new_control()))
+        raw_starts = context.RawArray("d", CONTROL_SLOTS)
+        self.controls = np.frombuffer(raw, dtype=np.int64).reshape(CONTROL_SLOTS, -1)
+        self.starts = np.frombuffer(raw_starts, dtype=np.float64)
+        self.free = list(range(CONTROL_SLOTS))
+        self.tasks = 0   # submitted and not finished
+        self.stuck = 0   # timed out and still running after CANCEL_GRACE
+        self.closed = False
+        self.lock = threading.Lock()
+        self.pool = context.Pool(MAX_WORKERS, initializer=_init_pool_process, initargs=(raw, raw_starts))
+
+    def submit(self, fn, args):
+        """Queue fn(args, control=<the task's control vector>); returns (AsyncResult, slot)."""
+        with self.lock:
+            slot = self.free.pop() if self.free else -1  # -1: no slot left, not cancellable
+            self.tasks += 1
+        if slot >= 0:
+            self.controls[slot] = 0
+            self.starts[slot] = 0
+
+        def finished(_):
+            with self.lock:
+                self.tasks -= 1
+                if slot >= 0:
+                    self.free.append(slot)
+
+        res = self.pool.apply_async(_pool_call, (fn, args, slot), callback=finished, error_callback=finished)
+        return res, slot
+
+    def cancel(self, slot):
+        if slot >= 0:
+            self.controls[slot, CTL_CANCEL] = 1
+
+    def wait(self, res, slot, submitted):
+        """
+        Wait for one task until SEGMENT_TIMEOUT after it started (after submitted, a monotonic
+        time, for a task without a slot); True if it finished. A task still queued when the
+        pool is terminated never finishes.
+        """
+        while True:
+            started = self.starts[slot] if slot >= 0 else submitted
+            if started:
+                res.wait(max(0.0, started + SEGMENT_TIMEOUT - time.monotonic()))
+                return res.ready()
+            if self.closed:
+                return False
+            res.wait(0.05)  # queued behind other tasks: its clock has not started
+            if res.ready():
+                return True
+
+    def terminate(self):
+        self.closed = True
+        self.pool.terminate()
+        self.pool.join()
+
+def _pool_context():
+    """
+    fork while this process has a single thread (gunicorn's post_fork, scripts): the pool then
+    shares the loaded grid and kernels copy-on-write. Once request threads run, a fork could
+    copy a lock another thread holds, so a pool started then (lazily, or after a retire) comes
+    from a forkserver that preloads this module.
+    """
+    if threading.active_count() == 1 or "forkserver" not in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("fork")
+    context = multiprocessing.get_context("forkserver")
+    context.set_forkserver_preload([__name__])
+    return context
+
+def start_worker_pool():
+    """Create the long-lived segment pool (idempotent). Call once at app startup."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = _SegmentPool(_pool_context())
+        return _pool
+
+def stop_worker_pool():
+    """Terminate the pool (kills running searches); the next route starts a fresh one."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.terminate()
+            _pool = None
+
+atexit.register(stop_worker_pool)
+
+def _retire(segment_pool):
+    """
+    Take a pool with a stuck task (a search without checkpoints: hpa, bidir, batch trees) out
+    of service: new work goes to a fresh pool, and this one is terminated once its other tasks
+    have finished (or had the time to), so no other request loses its searches.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is segment_pool:
+            _pool = None
+    with segment_pool.lock:
+        segment_pool.stuck += 1
+        if segment_pool.stuck > 1:
+            return  # already being reaped
+
+    def reap():
+        deadline = time.monotonic() + SEGMENT_TIMEOUT + CANCEL_GRACE
+        while time.monotonic() < deadline:
+            with segment_pool.lock:
+                if segment_pool.tasks <= segment_pool.stuck:
+                    break
+            time.sleep(0.1)
+        segment_pool.terminate()
+
+    threading.Thread(target=reap, name="segment-pool-reaper", daemon=True).start()
+
+def _pool_map(fn, jobs, on_result=None):
+    """
+    fn(job, control=...) for every job on the pool, results in job order; on_result(k, result)
+    as each one arrives. A task running past SEGMENT_TIMEOUT (counted from its own start, so
+    not from when this call got round to waiting for it) is cancelled and
+    multiprocessing.TimeoutError(k) raised; the pool is only retired (_retire) when the task
+    ignores the cancel. On any failure this call's remaining tasks are cancelled too.
+    """
+    segment_pool = start_worker_pool()
+    submitted = time.monotonic()
+    pending = [segment_pool.submit(fn, job) for job in jobs]
+    results = []
+    try:
+        for k, (res, slot) in enumerate(pending):
+            if not segment_pool.wait(res, slot, submitted):
+                segment_pool.cancel(slot)
+                res.wait(CANCEL_GRACE)
+                if not res.ready():
+                    _retire(segment_pool)
+                raise multiprocessing.TimeoutError(k)
+            results.append(res.get())
+            if on_result is not None:
+                on_result(k, results[-1])
+    finally:
+        for res, slot in pending:
+            if not res.ready():
+                segment_pool.cancel(slot)
+    return results
+
+def _pool_call(fn, args, slot):
+    """Pool-side task wrapper: note the start time, run fn(args) with the task's control vector."""
+    if slot < 0:
+        return fn(args)
+    _pool_starts[slot] = time.monotonic()
+    return fn(args, control=_pool_controls[slot])
+
+def _init_pool_process(raw_controls, raw_starts):
+    """
+    Pool initializer. Pool processes forked inside a gunicorn worker inherit the server's
+    Python signal handlers, which only queue SIGTERM: restore the defaults so terminate()
+    (stop_worker_pool, at worker exit) really stops them, then map the shared control
+    vectors and start times and warm up.
+    """
+    global _pool_controls, _pool_starts
+    for sig in (signal.SIGTERM, signal.SIGHUP, signal.SIGQUIT, signal.SIGUSR1, signal.SIGUSR2,
+                signal.SIGCHLD, signal.SIGWINCH, signal.SIGTTIN, signal.SIGTTOU):
+        signal.signal(sig, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.default_int_handler)
+    _pool_controls = np.frombuffer(raw_controls, dtype=np.int64).reshape(CONTROL_SLOTS, -1)
+    _pool_starts = np.frombuffer(raw_starts, dtype=np.float64)
+    warm_up()
+
+def warm_up():
+    """
+    Load the compiled kernels once instead of on the first real segment. Run by each pool
+    process, and by gunicorn.conf.py in the master so preforked workers inherit loaded kernels.
     """
     try:
-        start_rc, goal_rc, width = args
-        # load grid locally in worker
-        grid_local = np.load(_grid_path)
-        # build corridor
-        mask = make_corridor_mask(grid_local.shape, start_rc, goal_rc, width)
-        path = a_star_numpy_grid(grid_local, start_rc, goal_rc, corridor_mask=mask)
-        return path
+        find_path(final_grid, (0, 0), (0, 1), CORRIDOR_WIDTH)
+        if HAVE_NUMBA:
+            find_path(final_grid, (0, 0), (0, 1), CORRIDOR_WIDTH, backend="bidir")
+        _origin_tree((0, np.array([1], dtype=np.int64), (0, 1, 0, 2)))
+    except Exception as e:
+        if DEBUG:
+            print("Worker warm-up failed:", e)
+
+def _astar_worker(args, control=None):
+    """
+    Worker function executed in a pool process.
+    Uses the module-level memory-mapped final_grid (inherited or re-mapped on import),
+    so nothing is loaded or copied per segment.
+    args: (start_rc, goal_rc, width, backend)
+    control: the task's control vector (set to cancel by the parent on timeout)
+    returns: (list of (r,c) tuples or empty list, find_path stats dict)
+    """
+    stats = {}
+    try:
+        start_rc, goal_rc, width, backend = args
+        path = find_path(final_grid, start_rc, goal_rc, width, backend, stats, control=control)
+        return path, stats
     except Exception as e:
         # in worker, return empty on failure
         if DEBUG:
             print("Worker error:", e)
-        return []
+        return [], stats
+
+def weighted_grid(weights):
+    """
+    costlayers.WeightedGrid for a request's layer weights; None without weights or when
+    they reproduce final_grid (all 1). Raises ValueError for bad weights.
+    """
+    if weights is None:
+        return None
+    if layer_stack is None:
+        raise RuntimeError("Layer weights requested but final_grid_layers.npy is missing or stale; "
+                           "run models/prepare_rasters.py")
+    return layer_stack.grid(weights)
+
+def check_route_options(backend=None, weights=None):
+    """
+    Validate a request's backend and layer weights before anything is searched (or queued):
+    ValueError for an unknown backend, bad weights or a backend that cannot use them.
+    Returns weighted_grid(weights).
+    """
+    if backend is not None and backend not in SEARCH_BACKENDS:
+        raise ValueError(f"Unknown search backend: {backend!r} (expected one of {SEARCH_BACKENDS})")
+    weighted = weighted_grid(weights)
+    if weighted is not None and backend is not None and backend not in WEIGHTED_BACKENDS:
+        raise ValueError(f"Backend {backend!r} cannot use layer weights (expected one of {WEIGHTED_BACKENDS})")
+    return weighted
+
+def _weighted_segment_grid(weighted, start_rc, goal_rc):
+    """The weighted grid with (at least) the search window of this segment computed."""
+    if not WINDOWED_SEARCH:
+        return weighted.ensure_all()
+    return weighted.ensure_window(start_rc, goal_rc, max(CORRIDOR_WIDTH, *CORRIDOR_WIDTHS))
+
+def search_segments(segments, backend=None, control=None, on_segment=None, trace=None, weights=None):
+    """
+    Search every (start_rc, goal_rc) segment; returns the paths in segment order.
+    Segments ending on a registered cost-surface target (default backend only) are walked
+    off the surface, segments found in the segment cache are not searched again. Of the rest, a single
+    segment (or USE_PARALLEL=False) runs in this process, otherwise they are spread
+    over the persistent pool with SEGMENT_TIMEOUT each.
+    control: optional gridsearch control vector (background jobs, jobs.py). The searches
+      then run one by one in this thread, so the kernels can report progress into it
+      and stop on cancel; SearchCancelled is also raised between segments.
+    on_segment: optional callback(done, total) after each finished segment.
+    trace: optional metrics.RouteTrace; gets every segment's source (surface / cache /
+      search), backend and search stats, and the numpy backend's mask time.
+    weights: optional layer weights (see weighted_grid); the segments are then searched in
+      this process on the weighted grid, cached under their own key.
+    """
+    weighted = check_route_options(backend, weights)
+    if weighted is None:
+        backends = [segment_backend(s_idx, g_idx, backend) for (s_idx, g_idx) in segments]
+        labels = backends
+    else:
+        backends = [backend or SEARCH_BACKEND] * len(segments)
+        labels = [f"{b}@{','.join(map(str, weighted.weights))}" for b in backends]
+    results = [None] * len(segments)
+    sources = ["search"] * len(segments)
+    seg_stats = [None] * len(segments)
+    if USE_SURFACES and backend is None and weighted is None:
+        for i, (s_idx, g_idx) in enumerate(segments):
+            surface = surface_store.get(g_idx)
+            if surface is not None:
+                results[i] = surface.route_from(s_idx) or None
+                if results[i] is not None:
+                    sources[i] = "surface"
+    if segment_cache is not None:
+        for i, (s_idx, g_idx) in enumerate(segments):
+            if results[i] is None:
+                results[i] = segment_cache.get(s_idx, g_idx, CORRIDOR_WIDTH, labels[i])
+                if results[i] is not None:
+                    sources[i] = "cache"
+    todo = [i for i, path in enumerate(results) if path is None]
+    if on_segment is not None:
+        on_segment(len(segments) - len(todo), len(segments))
+
+    if control is not None or weighted is not None or not USE_PARALLEL or len(todo) <= 1:
+        for k, i in enumerate(todo):
+            if control is not None and control[CTL_CANCEL]:
+                raise SearchCancelled()
+            start_idx, goal_idx = segments[i]
+            # search on the in-memory grid for speed
+            grid = final_grid if weighted is None else _weighted_segment_grid(weighted, start_idx, goal_idx)
+            stats = {}
+            results[i] = find_path(grid, start_idx, goal_idx, CORRIDOR_WIDTH, backends[i], stats,
+                                   control=control)
+            seg_stats[i] = stats
+            if DEBUG and stats:
+                print("Segment search stats:", stats)
+            if on_segment is not None:
+                on_segment(len(segments) - len(todo) + k + 1, len(segments))
+    else:
+        def collect(k, result):
+            results[todo[k]], seg_stats[todo[k]] = result
+            if on_segment is not None:
+                on_segment(len(segments) - len(todo) + k + 1, len(segments))
+
+        try:
+            _pool_map(_astar_worker, [(*segments[i], CORRIDOR_WIDTH, backends[i]) for i in todo], collect)
+        except multiprocessing.TimeoutError as e:
+            raise RuntimeError(f"A* timed out for segment {todo[e.args[0]]} after {SEGMENT_TIMEOUT}s")
+
+    if segment_cache is not None:
+        for i in todo:
+            segment_cache.put(*segments[i], CORRIDOR_WIDTH, labels[i], results[i])
+    if trace is not None:
+        for i in range(len(segments)):
+            trace.add_segment("surface" if sources[i] == "surface" else backends[i], sources[i], seg_stats[i])
+            if seg_stats[i] and "mask_s" in seg_stats[i]:
+                trace.add_time("mask", seg_stats[i]["mask_s"])
+    return results
 
 # ------------- main compute_route (public API) -------------
-def compute_route(points):
+def compute_route(points, backend=None, simplify=None):
     """
     points: list of {'x': <lng>, 'y': <lat>} coming from frontend as {x:lng, y:lat}
+    backend: optional search backend name ("flat" / "numpy" / "hpa" / "alt" / "bidir"); by default
+      long segments use the hierarchy and the rest landmarks or SEARCH_BACKEND
+    simplify: return the simplified polyline (default SIMPLIFY_ROUTE) or every cell
     Returns: (planned_route, total_length_km)
       planned_route: list of {"x": lng, "y": lat}  (same as input coordinate order)
       total_length: float in kilometres (rounded to 2 decimals)
     """
+    lon, lat, total_length = plan_route(points, backend, simplify)
+    return [{"x": x, "y": y} for x, y in zip(lon.tolist(), lat.tolist())], total_length
+
+def plan_route(points, backend=None, simplify=None, control=None, on_segment=None, trace=None, weights=None):
+    """
+    compute_route without building the per-point dicts, for the compact encodings
+    (routeformat.py). Returns (lon, lat, total_length_km) with float64 lon/lat arrays.
+    control / on_segment: progress and cancellation hooks, see search_segments.
+    trace: optional metrics.RouteTrace, filled with stage timings (snap / search / post)
+      and per-segment search counters.
+    weights: optional layer weights, {"layer": w, ...} or a list in layer_stack.names order.
+    """
     if len(points) < 2:
         raise ValueError("Need at least two points to plan a route.")
+    if backend is not None and backend not in SEARCH_BACKENDS:
+        raise ValueError(f"Unknown search backend: {backend!r} (expected one of {SEARCH_BACKENDS})")
 
     # Convert input points to grid indices
-    segments = []
-    for i in range(len(points) - 1):
-        s = points[i]
-        g = points[i+1]
+    with _stage(trace, "snap"):
+        segments = []
+        for i in range(len(points) - 1):
+            s = points[i]
+            g = points[i+1]
 
-        # reproject lon,lat -> S-JTSK
-        sx, sy = reproject_coords(s["x"], s["y"])
-        gx, gy = reproject_coords(g["x"], g["y"])
+            # reproject lon,lat -> S-JTSK
+            sx, sy = reproject_coords(s["x"], s["y"])
+            gx, gy = reproject_coords(g["x"], g["y"])
 
-        # to grid indices (row,col)
-        s_idx = coords_to_index(sx, sy, transform)
-        g_idx = coords_to_index(gx, gy, transform)
+            # to grid indices (row,col)
+            s_idx = coords_to_index(sx, sy, transform)
+            g_idx = coords_to_index(gx, gy, transform)
 
-        segments.append((s_idx, g_idx))
+            segments.append((s_idx, g_idx))
 
-    # If only one segment, do it directly (avoid process overhead)
-    results = []
-    if not USE_PARALLEL or len(segments) == 1:
-        for start_idx, goal_idx in segments:
-            # make corridor mask based on in-memory grid for speed
-            mask = make_corridor_mask(final_grid.shape, start_idx, goal_idx, CORRIDOR_WIDTH)
-            path_idx = a_star_numpy_grid(final_grid, start_idx, goal_idx, corridor_mask=mask)
-            results.append(path_idx)
-    else:
-        # parallel execution: each worker loads grid from file.
-        args = [(s_idx, g_idx, CORRIDOR_WIDTH) for (s_idx, g_idx) in segments]
-        with ProcessPoolExecutor(max_workers=min(MAX_WORKERS, len(args))) as ex:
-            futures = [ex.submit(_astar_worker, a) for a in args]
-            for fut in as_completed(futures, timeout=None):
-                try:
-                    path_idx = fut.result(timeout=SEGMENT_TIMEOUT)
-                    results.append(path_idx)
-                except Exception as e:
-                    if DEBUG:
-                        print("Segment worker failed:", e)
-                    results.append([])
-
-    # combine segments, convert to lat/lng coords, compute length
-    all_coords = []
-    total_length = 0.0
+    with _stage(trace, "search"):
+        results = search_segments(segments, backend, control, on_segment, trace, weights)
+    with _stage(trace, "post"):
+        return stitch_segments(results, simplify)
 
+def _stage(trace, name):
+    """trace.stage(name), or a no-op context without a trace."""
+    return trace.stage(name) if trace is not None else nullcontext()
+
+def stitch_segments(results, simplify=None, transform_local=transform):
+    """
+    Join per-segment cell paths into one route: (lon, lat, total_length_km).
+    The length is measured on the full cell path; lon/lat are simplified unless simplify is False.
+    transform_local: affine of the grid the cells belong to (final_grid by default).
+    """
+    # combine segments into one cell path (dropping each repeated joint) and note which
+    # vertices to return; the length is measured on the full path
+    if simplify is None:
+        simplify = SIMPLIFY_ROUTE
+    parts = []
+    kept = []
+    offset = 0
     for i, path_idx in enumerate(results):
         if not path_idx:
             # failed segment -> raise so caller sees error
             raise RuntimeError(f"A* failed for segment {i}")
+        cells = np.asarray(path_idx, dtype=np.int64).reshape(-1, 2)
+        keep = simplify_path(cells, SIMPLIFY_TOLERANCE) if simplify else np.arange(len(cells))
+        if i != 0:
+            # avoid repeating the first point if it was included by previous segment
+            cells = cells[1:]
+            keep = keep[1:] - 1
+        parts.append(cells)
+        kept.append(keep + offset)
+        offset += len(cells)
 
-        # convert indices (row,col) -> S-JTSK coords -> WGS84 lat,lng
-        path_coords_sjtsk = [index_to_coords(r, c, transform) for (r, c) in path_idx]
-        # to_wgs84.transform(x,y) -> returns (lon, lat), we need (lat, lon)
-        geo_path_latlon = [(to_wgs84.transform(x, y)[1], to_wgs84.transform(x, y)[0]) for (x, y) in path_coords_sjtsk]
-        # geo_path_latlon elements: (lat, lon)
+    # S-JTSK cell centres -> WGS84 in one pass; length via haversine (lat, lon)
+    lon, lat = cells_to_lonlat(np.concatenate(parts), transform_local)
+    total_length = haversine_path(lat, lon)
 
-        # avoid repeating the first point if it was included by previous segment
-        if i != 0 and len(geo_path_latlon) > 0:
-            geo_path_latlon = geo_path_latlon[1:]
+    keep = np.concatenate(kept)
+    return lon[keep], lat[keep], round(total_length, 2)
 
-        # accumulate length (haversine expects lat, lon)
-        for j in range(1, len(geo_path_latlon)):
-            lat1, lon1 = geo_path_latlon[j-1]
-            lat2, lon2 = geo_path_latlon[j]
-            total_length += haversine(lat1, lon1, lat2, lon2)
+def plan_route_fine(points, simplify=None, control=None, on_segment=None, trace=None):
+    """
+    plan_route on the finest level of the grid pyramid (pyramid.py) instead of final_grid:
+    points are snapped with that level's transform and every segment is searched coarse to
+    fine (no segment cache, surfaces or worker pool: the grids differ from final_grid).
+    Returns (lon, lat, total_length_km) like plan_route; same control / on_segment / trace hooks.
+    """
+    if len(points) < 2:
+        raise ValueError("Need at least two points to plan a route.")
+    if grid_pyramid is None:
+        raise RuntimeError("Fine routing requested but final_grid_pyramid/ is missing; "
+                           "run models/prepare_rasters.py")
+    fine_transform = Affine(*grid_pyramid.transforms[0])
+    with _stage(trace, "snap"):
+        r, c = snap_points(points, fine_transform)
+    results = []
+    with _stage(trace, "search"):
+        for i in range(len(points) - 1):
+            if control is not None and control[CTL_CANCEL]:
+                raise SearchCancelled()
+            stats = {}
+            results.append(coarse_to_fine(grid_pyramid, (int(r[i]), int(c[i])), (int(r[i + 1]), int(c[i + 1])),
+                                          stats=stats, control=control))
+            if DEBUG:
+                print("Pyramid segment stats:", stats)
+            if trace is not None:
+                trace.add_segment("pyramid", "search", stats)
+            if on_segment is not None:
+                on_segment(i + 1, len(points) - 1)
+    with _stage(trace, "post"):
+        return stitch_segments(results, simplify, fine_transform)
+
+# ------------- batch planning: one search tree per origin -------------
+def snap_points(points, transform_local=transform):
+    """(rows, cols) int arrays of the grid cells under [{'x': lng, 'y': lat}, ...], in one pass."""
+    lon = np.array([float(p["x"]) for p in points])
+    lat = np.array([float(p["y"]) for p in points])
+    x, y = transformer.transform(lon, lat)
+    rows, cols = rowcol(transform_local, np.atleast_1d(x), np.atleast_1d(y))
+    return np.asarray(rows, dtype=np.int64), np.asarray(cols, dtype=np.int64)
+
+def _origin_tree(args, control=None):
+    """
+    One origin group: Dijkstra from origin until every target is settled.
+    args: (origin flat index, target flat indices, box or None for the whole grid)
+    control: accepted for _pool_map; the Dijkstra kernel has no checkpoints
+    returns: (costs per target (-1 = unreachable), cell paths as int32 (row, col) arrays, expanded)
+    """
+    origin, targets, box = args
+    stats = {}
+    ws, gen = dijkstra_flat(final_grid, [origin], box=box, targets=targets, stats=stats)
+    costs = settled_costs(ws, gen, targets)
+    cols = final_grid.shape[1]
+    paths = []
+    for t, c in zip(targets, costs):
+        if c < 0:
+            paths.append(None)
+            continue
+        flat = trace_path(ws.parent, origin, t)
+        paths.append(np.column_stack((flat // cols, flat % cols)).astype(np.int32))
+    return costs.tolist(), paths, stats.get("expanded", 0)
 
-        # format for frontend: {"x": lng, "y": lat}
-        formatted = [{"x": float(lon), "y": float(lat)} for (lat, lon) in geo_path_latlon]
-        all_coords.extend(formatted)
+def _run_trees(jobs):
+    """_origin_tree for every job, on the worker pool when there is more than one."""
+    if USE_PARALLEL and len(jobs) > 1:
+        try:
+            return _pool_map(_origin_tree, jobs)
+        except multiprocessing.TimeoutError:
+            raise RuntimeError(f"Batch search timed out after {SEGMENT_TIMEOUT}s")
+    return [_origin_tree(job) for job in jobs]
 
-    return all_coords, round(total_length, 2)
+def plan_routes(origins, destinations, pairs=None, with_paths=False, simplify=None, stats=None):
+    """
+    Many-to-many planning with one shared search tree per origin cell.
+    origins, destinations: lists of {'x': lng, 'y': lat}
+    pairs: optional list of (origin index, destination index); default all combinations
+    with_paths: also return each route as (lon, lat) arrays (simplified like compute_route)
+    stats: optional dict filled with origin_trees / expanded
+    Returns (costs, lengths_km, paths): len(origins) x len(destinations) nested lists,
+      None where a pair was not requested, is off the grid or is unreachable.
+    """
+    if not origins or not destinations:
+        raise ValueError("Need at least one origin and one destination.")
+    n_o, n_d = len(origins), len(destinations)
+    if pairs is None:
+        pairs = [(i, j) for i in range(n_o) for j in range(n_d)]
+    pairs = [(int(i), int(j)) for i, j in pairs]
+    for i, j in pairs:
+        if not (0 <= i < n_o and 0 <= j < n_d):
+            raise ValueError(f"Pair ({i}, {j}) is out of range")
+    if simplify is None:
+        simplify = SIMPLIFY_ROUTE
+
+    rows, cols = final_grid.shape
+    o_r, o_c = snap_points(origins)
+    d_r, d_c = snap_points(destinations)
+    o_ok = (o_r >= 0) & (o_r < rows) & (o_c >= 0) & (o_c < cols)
+    d_ok = (d_r >= 0) & (d_r < rows) & (d_c >= 0) & (d_c < cols)
+    o_cell = o_r * cols + o_c
+    d_cell = d_r * cols + d_c
+
+    # group by origin cell: origins snapping to the same cell share one tree
+    groups = {}
+    for i, j in pairs:
+        if o_ok[i] and d_ok[j]:
+            groups.setdefault(int(o_cell[i]), set()).add(int(d_cell[j]))
+    jobs = []
+    for origin, targets in groups.items():
+        targets = np.array(sorted(targets), dtype=np.int64)
+        box = None
+        if BATCH_MARGIN is not None:
+            r = np.concatenate(([origin // cols], targets // cols))
+            c = np.concatenate(([origin % cols], targets % cols))
+            box = (max(0, int(r.min()) - BATCH_MARGIN), min(rows, int(r.max()) + BATCH_MARGIN + 1),
+                   max(0, int(c.min()) - BATCH_MARGIN), min(cols, int(c.max()) + BATCH_MARGIN + 1))
+        jobs.append((origin, targets, box))
+
+    trees = _run_trees(jobs)
+    found = {}
+    for (origin, targets, _), (tcosts, tpaths, _) in zip(jobs, trees):
+        for t, c, path in zip(targets.tolist(), tcosts, tpaths):
+            found[(origin, t)] = (c, path)
+    if stats is not None:
+        stats["origin_trees"] = len(jobs)
+        stats["expanded"] = sum(t[2] for t in trees)
+
+    costs = [[None] * n_d for _ in range(n_o)]
+    lengths = [[None] * n_d for _ in range(n_o)]
+    paths = [[None] * n_d for _ in range(n_o)] if with_paths else None
+    for i, j in pairs:
+        if not (o_ok[i] and d_ok[j]):
+            continue
+        c, cells = found[(int(o_cell[i]), int(d_cell[j]))]
+        if cells is None:
+            continue
+        lon, lat = cells_to_lonlat(cells)
+        costs[i][j] = int(c)
+        lengths[i][j] = round(haversine_path(lat, lon), 2)
+        if with_paths:
+            keep = simplify_path(cells, SIMPLIFY_TOLERANCE) if simplify else np.arange(len(cells))
+            paths[i][j] = (lon[keep], lat[keep])
+    return costs, lengths, paths
+
+
+# ------------- waypoint order optimisation -------------
+def plan_ordered_route(points, fix_end=True, simplify=None, stats=None, trace=None):
+    """
+    compute_route with the waypoints visited in the cheapest order instead of as clicked.
+    One Dijkstra per waypoint (stopping once all other waypoints are settled, like
+    plan_routes) gives the pairwise cost matrix and the exact cell paths between them;
+    ordering.solve_order picks the order (first waypoint fixed, last too if fix_end) and
+    the route is stitched from the stored paths, so nothing is searched twice.
+    stats: optional dict filled with origin_trees / expanded / matrix_ms / order_ms
+    trace: optional metrics.RouteTrace (stages snap / search / order / post, one entry per tree)
+    Returns (lon, lat, total_length_km, order, cost, clicked_cost); order indexes points,
+    cost / clicked_cost are grid costs of the chosen and of the clicked order.
+    """
+    if len(points) < 2:
+        raise ValueError("Need at least two points to plan a route.")
+    if len(points) > ORDER_MAX_WAYPOINTS:
+        raise ValueError(f"Order optimisation takes at most {ORDER_MAX_WAYPOINTS} waypoints.")
+    rows, cols = final_grid.shape
+    with _stage(trace, "snap"):
+        r, c = snap_points(points)
+    if not ((r >= 0) & (r < rows) & (c >= 0) & (c < cols)).all():
+        raise ValueError("Waypoint outside the routing grid.")
+    cells = (r * cols + c).tolist()
+
+    t0 = time.perf_counter()
+    unique = sorted(set(cells))
+    jobs = [(o, np.array([t for t in unique if t != o], dtype=np.int64), None)
+            for o in unique] if len(unique) > 1 else []
+    with _stage(trace, "search"):
+        trees = _run_trees(jobs)
+    if trace is not None:
+        for tree in trees:
+            trace.add_segment("tree", "search", {"expanded": tree[2], "window_cells": final_grid.size})
+    legs = {}
+    for (origin, targets, _), (tcosts, tpaths, _) in zip(jobs, trees):
+        for t, cost, path in zip(targets.tolist(), tcosts, tpaths):
+            legs[(origin, t)] = (cost, path)
+    n = len(points)
+    matrix = np.zeros((n, n), dtype=np.int64)
+    for i in range(n):
+        for j in range(n):
+            if cells[i] != cells[j]:
+                cost = legs[(cells[i], cells[j])][0]
+                matrix[i, j] = cost if cost >= 0 else UNREACHABLE
+    t1 = time.perf_counter()
+    with _stage(trace, "order"):
+        order = solve_order(matrix, fix_end)
+    t2 = time.perf_counter()
+    if stats is not None:
+        stats["origin_trees"] = len(trees)
+        stats["expanded"] = sum(t[2] for t in trees)
+        stats["matrix_ms"] = round((t1 - t0) * 1e3, 3)
+        stats["order_ms"] = round((t2 - t1) * 1e3, 3)
+
+    results = []
+    for i, j in zip(order[:-1], order[1:]):
+        if cells[i] == cells[j]:
+            results.append([(cells[i] // cols, cells[i] % cols)])
+            continue
+        path = legs[(cells[i], cells[j])][1]
+        if path is None:
+            raise RuntimeError(f"No route between waypoints {i} and {j}")
+        results.append([(int(a), int(b)) for a, b in path])
+    with _stage(trace, "post"):
+        lon, lat, length = stitch_segments(results, simplify)
+    return (lon, lat, length, order, order_cost(matrix, order),
+            order_cost(matrix, list(range(n))))
+
+
+# ------------- cost layers -------------
+def cost_layers():
+    """Layer names usable as weights, with the stack's cache counters ({} if not built)."""
+    return layer_stack.stats() if layer_stack is not None else {}
+
+
+# ------------- cost surfaces of fixed targets -------------
+def surface_targets():
+    """Registered surface targets as [{"row", "col", "x": lng, "y": lat}, ...]."""
+    targets = surface_store.targets()
+    if not targets:
+        return []
+    lon, lat = cells_to_lonlat(np.array(targets, dtype=np.int64))
+    return [{"row": r, "col": c, "x": x, "y": y}
+            for (r, c), x, y in zip(targets, lon.tolist(), lat.tolist())]
 
+def register_surface(point):
+    """Snap {'x': lng, 'y': lat} to its cell and build (or rebuild) that cell's cost surface."""
+    rows, cols = snap_points([point])
+    r, c = int(rows[0]), int(cols[0])
+    if not (0 <= r < final_grid.shape[0] and 0 <= c < final_grid.shape[1]):
+        raise ValueError("Point outside the routing grid.")
+    return surface_store.register((r, c))
 
 # # If run directly, quick sanity test (not required in production)
 # if __name__ == "__main__":
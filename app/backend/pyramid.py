@@ -0,0 +1,322 @@
+"""
+pyramid.py - tiled, memory-mapped multi-resolution cost grid and coarse-to-fine routing.
+
+A pyramid is a directory (final_grid_pyramid/ next to final_grid.npy) written by
+models/prepare_rasters.py:
+- meta.json: tile size, level factor and, per level, its shape and affine transform;
+- level<k>.npy: uint16 routing costs of level k (0 = finest) stored tile-major, i.e. an
+  array of shape (tile rows, tile cols, tile, tile). A tile is one contiguous run of the
+  file, so reading a window through the read-only memory map only pages in the tiles it
+  overlaps: resident memory follows the tiles a route touches, not the grid size.
+
+Every level is FACTOR times smaller per side than the one below it; a coarse cell holds the
+median of its FACTOR x FACTOR block (so one-cell features such as a power line neither
+vanish nor block a whole coarse cell). Levels are added until the top one fits in TOP_SIZE
+cells per side.
+
+coarse_to_fine() searches the top level as a whole (corridor widening, like plan.py on
+final_grid), then refines the path one level at a time. The coarse path is cut into runs of
+CHUNK cells; each run is widened by BUFFER coarse cells and the finer level is searched
+only inside that band (cells outside it are blocked, not merely expensive), with consecutive
+runs joined at the cheapest fine cell of the coarse cell they share. A refinement window is never larger than
+(CHUNK + 2 * BUFFER) * FACTOR cells per side, however fine the grid. The band fixes the
+coarse route, so the result is a good route, not a guaranteed optimum of the finest level.
+"""
+
+import json
+import os
+
+import numpy as np
+
+from gridsearch import a_star_flat, a_star_widening
+
+TILE_SIZE = 256          # tile side in cells (128 KiB of uint16 per tile)
+FACTOR = 2               # cells per side merged into one cell of the next level
+TOP_SIZE = 1000          # stop adding levels once the top level is at most this many cells per side
+CHUNK = 64               # coarse path cells refined per window
+BUFFER = 3               # band half-width around the coarse path, in coarse cells
+TOP_WIDTHS = (40, 80)    # corridor widening schedule of the top-level search
+
+META_NAME = "meta.json"
+
+
+def _level_name(k):
+    return f"level{k}.npy"
+
+
+class TiledGrid:
+    """One pyramid level: the tile-major uint16 array (memory-mapped) and the level shape."""
+
+    def __init__(self, tiles, shape):
+        self.tiles = tiles
+        self.tile = int(tiles.shape[2])
+        self.shape = (int(shape[0]), int(shape[1]))
+
+    @classmethod
+    def open(cls, path, shape, writable=False):
+        return cls(np.load(path, mmap_mode="r+" if writable else "r"), shape)
+
+    @classmethod
+    def create(cls, path, shape, tile=TILE_SIZE):
+        """New level file of the given shape, open for writing."""
+        n_r, n_c = -(-int(shape[0]) // tile), -(-int(shape[1]) // tile)
+        tiles = np.lib.format.open_memmap(path, mode="w+", dtype=np.uint16, shape=(n_r, n_c, tile, tile))
+        return cls(tiles, shape)
+
+    @property
+    def tile_shape(self):
+        return self.tiles.shape[:2]
+
+    def tile_box(self, tr, tc):
+        """(r_lo, r_hi, c_lo, c_hi) of tile (tr, tc), clipped to the level."""
+        t = self.tile
+        return (tr * t, min(self.shape[0], (tr + 1) * t), tc * t, min(self.shape[1], (tc + 1) * t))
+
+    def window(self, r_lo, r_hi, c_lo, c_hi, touched=None):
+        """
+        Dense copy of rows r_lo:r_hi, cols c_lo:c_hi (must lie inside the level), assembled
+        from the overlapping tiles only. touched: optional set that receives their (tr, tc).
+        """
+        t = self.tile
+        out = np.empty((r_hi - r_lo, c_hi - c_lo), dtype=np.uint16)
+        for tr in range(r_lo // t, -(-r_hi // t)):
+            a, b = max(r_lo, tr * t), min(r_hi, (tr + 1) * t)
+            for tc in range(c_lo // t, -(-c_hi // t)):
+                c, d = max(c_lo, tc * t), min(c_hi, (tc + 1) * t)
+                out[a - r_lo:b - r_lo, c - c_lo:d - c_lo] = \
+                    self.tiles[tr, tc, a - tr * t:b - tr * t, c - tc * t:d - tc * t]
+                if touched is not None:
+                    touched.add((tr, tc))
+        return out
+
+    def write(self, tr, tc, block):
+        """Store block (at most tile x tile cells) as tile (tr, tc)."""
+        h, w = block.shape
+        self.tiles[tr, tc, :h, :w] = block
+
+    def flush(self):
+        self.tiles.flush()
+
+
+class GridPyramid:
+    """The levels of one pyramid directory, finest first."""
+
+    def __init__(self, directory, meta):
+        self.directory = directory
+        self.factor = int(meta["factor"])
+        self.levels = [TiledGrid.open(os.path.join(directory, _level_name(k)), level["shape"])
+                       for k, level in enumerate(meta["levels"])]
+        self.transforms = [tuple(float(v) for v in level["transform"]) for level in meta["levels"]]
+        self.key = meta.get("key")
+        self._top = None
+
+    @property
+    def shape(self):
+        return self.levels[0].shape
+
+    @property
+    def top(self):
+        return len(self.levels) - 1
+
+    def top_grid(self):
+        """Dense copy of the top level (at most TOP_SIZE^2 cells), read once."""
+        if self._top is None:
+            level = self.levels[-1]
+            self._top = level.window(0, level.shape[0], 0, level.shape[1])
+        return self._top
+
+
+def load_pyramid(directory):
+    """GridPyramid of directory, or None if no pyramid has been built there."""
+    try:
+        with open(os.path.join(directory, META_NAME)) as fh:
+            meta = json.load(fh)
+        return GridPyramid(directory, meta)
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def level_transform(transform, scale):
+    """Affine (a, b, c, d, e, f) of a level whose cells are scale base cells per side."""
+    a, b, c, d, e, f = tuple(transform)[:6]
+    return (a * scale, b * scale, c, d * scale, e * scale, f)
+
+
+def downsample(fine, coarse, factor, progress=None):
+    """Fill level coarse with the per-block medians of level fine, one coarse tile at a time."""
+    rows, cols = fine.shape
+    n_r, n_c = coarse.tile_shape
+    for tr in range(n_r):
+        for tc in range(n_c):
+            r_lo, r_hi, c_lo, c_hi = coarse.tile_box(tr, tc)
+            h, w = r_hi - r_lo, c_hi - c_lo
+            block = fine.window(r_lo * factor, min(rows, r_hi * factor), c_lo * factor, min(cols, c_hi * factor))
+            # the last row / column of blocks may hang over the fine edge: repeat the edge cells
+            block = np.pad(block, ((0, h * factor - block.shape[0]), (0, w * factor - block.shape[1])), mode="edge")
+            blocks = block.reshape(h, factor, w, factor).transpose(0, 2, 1, 3).reshape(h, w, factor * factor)
+            coarse.write(tr, tc, np.rint(np.median(blocks, axis=2)).astype(np.uint16))
+        if progress is not None:
+            progress(tr + 1, n_r)
+    coarse.flush()
+
+
+def level_shapes(shape, factor=FACTOR, top_size=TOP_SIZE):
+    """Shapes of the levels build_pyramid writes for a finest level of shape, finest first."""
+    shapes = [(int(shape[0]), int(shape[1]))]
+    while max(shapes[-1]) > top_size:
+        shapes.append((-(-shapes[-1][0] // factor), -(-shapes[-1][1] // factor)))
+    return shapes
+
+
+def build_pyramid(directory, shape, transform, fill, factor=FACTOR, top_size=TOP_SIZE, tile=TILE_SIZE,
+                  progress=None, key=None):
+    """
+    Write a pyramid whose finest level has shape (rows, cols) and the given transform.
+    fill(r_lo, r_hi, c_lo, c_hi) returns the uint16 routing costs of that window of the finest
+    level; it is called once per tile, so the finest grid never has to be in memory at once.
+    progress: optional callback(level, done, total) per finished row of tiles.
+    key: optional string stored in meta.json (GridPyramid.key) to tell what the pyramid was
+      built from, so a builder can skip an unchanged one.
+    Files are written under temporary names and swapped in with meta.json last, so running
+    processes keep their old mappings. Returns the new GridPyramid.
+    """
+    os.makedirs(directory, exist_ok=True)
+    tmp = lambda k: os.path.join(directory, _level_name(k) + ".tmp")
+    base = TiledGrid.create(tmp(0), shape, tile)
+    n_r, n_c = base.tile_shape
+    for tr in range(n_r):
+        for tc in range(n_c):
+            r_lo, r_hi, c_lo, c_hi = base.tile_box(tr, tc)
+            base.write(tr, tc, np.asarray(fill(r_lo, r_hi, c_lo, c_hi), dtype=np.uint16))
+        if progress is not None:
+            progress(0, tr + 1, n_r)
+    base.flush()
+
+    levels = [base]
+    for k, coarse_shape in enumerate(level_shapes(shape, factor, top_size)[1:], 1):
+        fine = levels[-1]
+        coarse = TiledGrid.create(tmp(k), coarse_shape, tile)
+        downsample(fine, coarse, factor,
+                   None if progress is None else (lambda done, total, k=k: progress(k, done, total)))
+        levels.append(coarse)
+
+    meta = {
+        "factor": factor,
+        "tile": tile,
+        "key": key,
+        "levels": [{"shape": list(level.shape), "transform": list(level_transform(transform, factor ** k))}
+                   for k, level in enumerate(levels)],
+    }
+    for k in range(len(meta["levels"])):
+        os.replace(tmp(k), os.path.join(directory, _level_name(k)))
+    meta_tmp = os.path.join(directory, META_NAME + ".tmp")
+    with open(meta_tmp, "w") as fh:
+        json.dump(meta, fh, indent=1)
+    os.replace(meta_tmp, os.path.join(directory, META_NAME))
+    return load_pyramid(directory)
+
+
+def _dilate(mask, steps):
+    """mask grown by steps cells (4-neighbourhood per step)."""
+    for _ in range(steps):
+        grown = mask.copy()
+        grown[1:] |= mask[:-1]
+        grown[:-1] |= mask[1:]
+        grown[:, 1:] |= mask[:, :-1]
+        grown[:, :-1] |= mask[:, 1:]
+        mask = grown
+    return mask
+
+
+def _joint(costs, r_lo, r_hi, c_lo, c_hi):
+    """Window-local cell of the cheapest cost in costs[r_lo:r_hi, c_lo:c_hi], ties to the centre."""
+    block = costs[r_lo:r_hi, c_lo:c_hi].astype(np.int64)
+    rr, cc = np.indices(block.shape)
+    off = (rr - (block.shape[0] - 1) / 2) ** 2 + (cc - (block.shape[1] - 1) / 2) ** 2
+    i = np.lexsort((off.ravel(), block.ravel()))[0]
+    return (r_lo + i // block.shape[1], c_lo + i % block.shape[1])
+
+
+def _refine(level, coarse_path, start, goal, factor, chunk, buffer, touched, stats, control):
+    """Cell path on level from start to goal, searched in bands around coarse_path (one level up)."""
+    rows, cols = level.shape
+    coarse_shape = np.array([-(-rows // factor), -(-cols // factor)])
+    coarse = np.asarray(coarse_path, dtype=np.int64).reshape(-1, 2)
+    n = len(coarse)
+    path = [start]
+    here = start
+    for a in range(0, max(n - 1, 1), chunk):
+        b = min(a + chunk, n - 1)
+        run = coarse[a:b + 1]
+        lo = np.maximum(run.min(axis=0) - buffer, 0)
+        hi = np.minimum(run.max(axis=0) + buffer + 1, coarse_shape)
+        band = np.zeros(hi - lo, dtype=np.bool_)
+        band[run[:, 0] - lo[0], run[:, 1] - lo[1]] = True
+        band = _dilate(band, buffer)
+
+        r_lo, c_lo = int(lo[0]) * factor, int(lo[1]) * factor
+        r_hi, c_hi = min(rows, int(hi[0]) * factor), min(cols, int(hi[1]) * factor)
+        costs = level.window(r_lo, r_hi, c_lo, c_hi, touched)
+        inside = band.repeat(factor, axis=0).repeat(factor, axis=1)[:r_hi - r_lo, :c_hi - c_lo]
+
+        if b == n - 1:
+            target = goal
+        else:
+            jr, jc = int(run[-1, 0]) * factor - r_lo, int(run[-1, 1]) * factor - c_lo
+            j = _joint(costs, jr, min(jr + factor, r_hi - r_lo), jc, min(jc + factor, c_hi - c_lo))
+            target = (j[0] + r_lo, j[1] + c_lo)
+        part_stats = {}
+        part = a_star_flat(costs, (here[0] - r_lo, here[1] - c_lo), (target[0] - r_lo, target[1] - c_lo),
+                           stats=part_stats, control=control, blocked=~inside)
+        if not part:
+            return []
+        path.extend((r + r_lo, c + c_lo) for r, c in part[1:])
+        here = target
+        _add_stats(stats, part_stats)
+    return path
+
+
+def _add_stats(total, part):
+    for key in ("expanded", "pushes", "window_cells"):
+        total[key] = total.get(key, 0) + part.get(key, 0)
+    total["peak_heap"] = max(total.get("peak_heap", 0), part.get("peak_heap", 0))
+
+
+def coarse_to_fine(pyramid, start, goal, chunk=CHUNK, buffer=BUFFER, widths=TOP_WIDTHS, stats=None,
+                   control=None):
+    """
+    Route from start to goal ((row, col) cells of the finest level) through the pyramid.
+    stats: optional dict filled with expanded / pushes / peak_heap / window_cells summed over
+      all searches, plus per level (finest first) the path length in "level_cells" and the
+      number of tiles read in "tiles".
+    control: optional gridsearch control vector, passed to every search.
+    returns: list of (row, col) tuples on the finest level, or empty list if not found.
+    """
+    rows, cols = pyramid.shape
+    (sr, sc), (gr, gc) = start, goal
+    if not (0 <= sr < rows and 0 <= sc < cols and 0 <= gr < rows and 0 <= gc < cols):
+        return []
+    factor = pyramid.factor
+    top = pyramid.top
+    total = {}
+    touched = [set() for _ in pyramid.levels]
+    level_cells = [0] * len(pyramid.levels)
+
+    scale = factor ** top
+    top_stats = {}
+    path = a_star_widening(pyramid.top_grid(), (sr // scale, sc // scale), (gr // scale, gc // scale),
+                           widths, stats=top_stats, control=control)
+    _add_stats(total, top_stats)
+    level_cells[top] = len(path)
+    for k in range(top - 1, -1, -1):
+        if not path:
+            break
+        scale = factor ** k
+        path = _refine(pyramid.levels[k], path, (sr // scale, sc // scale), (gr // scale, gc // scale),
+                       factor, chunk, buffer, touched[k], total, control)
+        level_cells[k] = len(path)
+    if stats is not None:
+        stats.update(total)
+        stats["level_cells"] = level_cells
+        stats["tiles"] = [len(t) for t in touched]
+    return path
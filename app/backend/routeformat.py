@@ -0,0 +1,120 @@
+"""
+routeformat.py - wire formats for /api/plan-route responses.
+
+The default response stays {"route": [{"x": lng, "y": lat}, ...], "totalLength": km}, which
+repeats two keys and prints full float precision for every vertex. Clients can ask for a
+compact encoding with ?format=<name> (wins) or the Accept header:
+
+  format     Accept                         body
+  json       application/json, */*          the default above
+  polyline   application/vnd.polyline+json  {"polyline": Google encoded polyline (lat, lng),
+                                             "precision": 5, "totalLength"}
+  flat       -                              {"coordinates": [lng0, lat0, lng1, ...], "totalLength"}
+  geojson    application/geo+json           Feature with a LineString, properties.totalLength
+  binary     application/octet-stream       little-endian float32 (lng, lat) pairs; the length
+                                            is in the X-Route-Length header
+
+Coordinates in the text formats are rounded to COORD_DECIMALS (~0.1 m). All encoders work on
+the lon/lat arrays from plan.plan_route. Extra route fields (e.g. the waypoint order of
+plan.plan_ordered_route) go next to totalLength, into properties for geojson and into
+X-Route-<Name> headers for binary. compress() gzips bodies above GZIP_MIN_BYTES for
+clients sending Accept-Encoding: gzip.
+"""
+
+import gzip
+import json
+
+import numpy as np
+
+FORMATS = ("json", "polyline", "flat", "geojson", "binary")
+MEDIA_TYPES = {
+    "application/json": "json",
+    "application/vnd.polyline+json": "polyline",
+    "application/geo+json": "geojson",
+    "application/octet-stream": "binary",
+}
+COORD_DECIMALS = 6
+POLYLINE_PRECISION = 5
+GZIP_MIN_BYTES = 1024
+GZIP_LEVEL = 5
+
+
+def negotiate(fmt=None, accept=None):
+    """
+    Output format from an explicit ?format= value or an Accept header (first listed
+    known media type; q-values are not weighed). Raises ValueError for an unknown format.
+    """
+    if fmt:
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown route format: {fmt!r} (expected one of {FORMATS})")
+        return fmt
+    for part in (accept or "").split(","):
+        media = part.split(";")[0].strip().lower()
+        if media in MEDIA_TYPES:
+            return MEDIA_TYPES[media]
+    return "json"
+
+
+def encode_polyline(lat, lon, precision=POLYLINE_PRECISION):
+    """Google encoded polyline of lat/lon arrays, built with array ops instead of a per-point loop."""
+    factor = 10 ** precision
+    pts = np.empty(2 * len(lat), dtype=np.int64)
+    pts[0::2] = np.round(np.asarray(lat) * factor)
+    pts[1::2] = np.round(np.asarray(lon) * factor)
+    delta = np.diff(pts.reshape(-1, 2), axis=0, prepend=0).ravel()
+    value = ((delta << 1) ^ (delta >> 63)).astype(np.uint64)  # zigzag: sign into the low bit
+    # up to 7 five-bit chunks per value (covers 35 bits), low chunks first
+    shifts = np.arange(7, dtype=np.uint64) * np.uint64(5)
+    chunks = (value[:, None] >> shifts) & np.uint64(31)
+    used = 1 + ((value[:, None] >> shifts[1:]) != 0).sum(axis=1)
+    k = np.arange(7)
+    chars = chunks + np.uint64(63) + np.where(k[None, :] < used[:, None] - 1, 32, 0).astype(np.uint64)
+    return chars[k[None, :] < used[:, None]].astype(np.uint8).tobytes().decode("ascii")
+
+
+def encode(fmt, lon, lat, total_length, extra=None):
+    """(body bytes, mimetype, extra headers) of the route in the given format."""
+    extra = extra or {}
+    if fmt == "binary":
+        body = np.column_stack((lon, lat)).astype("<f4").tobytes()
+        headers = {"X-Route-Length": str(total_length), "X-Route-Points": str(len(lon))}
+        for name, value in extra.items():
+            if isinstance(value, dict):
+                text = json.dumps(value, separators=(",", ":"))
+            elif isinstance(value, (list, tuple)):
+                text = ",".join(map(str, value))
+            else:
+                text = str(value)
+            headers["X-Route-" + name[0].upper() + name[1:]] = text
+        return body, "application/octet-stream", headers
+    lon_r = np.round(lon, COORD_DECIMALS)
+    lat_r = np.round(lat, COORD_DECIMALS)
+    if fmt == "json":
+        payload = {"route": [{"x": x, "y": y} for x, y in zip(lon.tolist(), lat.tolist())],
+                   "totalLength": total_length}
+        mimetype = "application/json"
+    elif fmt == "polyline":
+        payload = {"polyline": encode_polyline(lat, lon), "precision": POLYLINE_PRECISION,
+                   "totalLength": total_length}
+        mimetype = "application/vnd.polyline+json"
+    elif fmt == "flat":
+        payload = {"coordinates": np.column_stack((lon_r, lat_r)).ravel().tolist(),
+                   "totalLength": total_length}
+        mimetype = "application/json"
+    elif fmt == "geojson":
+        payload = {"type": "Feature",
+                   "geometry": {"type": "LineString",
+                                "coordinates": np.column_stack((lon_r, lat_r)).tolist()},
+                   "properties": {"totalLength": total_length}}
+        mimetype = "application/geo+json"
+    else:
+        raise ValueError(f"Unknown route format: {fmt!r} (expected one of {FORMATS})")
+    (payload["properties"] if fmt == "geojson" else payload).update(extra)
+    return json.dumps(payload, separators=(",", ":")).encode(), mimetype, {}
+
+
+def compress(body, accept_encoding):
+    """(body, headers): gzip-compressed when the client accepts it and it pays off."""
+    if len(body) < GZIP_MIN_BYTES or "gzip" not in (accept_encoding or "").lower():
+        return body, {}
+    return gzip.compress(body, compresslevel=GZIP_LEVEL), {"Content-Encoding": "gzip"}
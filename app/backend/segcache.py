@@ -0,0 +1,166 @@
+"""
+segcache.py - segment result cache shared by all server processes.
+
+Route requests snap their waypoints to grid cells, so planners clicking near the same
+substations keep asking for the same (start_cell, goal_cell) searches. Finished segment
+paths are stored in a small SQLite file next to the grid; every gunicorn worker (and the
+pool processes) opens the same file, so a segment computed by one worker is a hit for
+all of them.
+
+Entries are keyed on (start cell, goal cell, corridor width, backend, version):
+- version fingerprints the routing grid and the search settings that shape the path;
+  opening the cache with a new version drops every older entry, so regenerating
+  final_grid.npy invalidates the cache on the next start.
+- the cache holds at most max_entries paths, evicting the least recently used ones,
+  and entries older than ttl seconds count as misses.
+
+Paths are stored as int32 (row, col) pairs. Hit/miss counters live in the same file so
+stats() reports totals over all workers. Any SQLite error (locked too long, read-only
+disk, ...) degrades to a miss rather than failing the route.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS segments (
+    start INTEGER NOT NULL,
+    goal INTEGER NOT NULL,
+    width INTEGER NOT NULL,
+    backend TEXT NOT NULL,
+    version TEXT NOT NULL,
+    path BLOB NOT NULL,
+    created REAL NOT NULL,
+    used REAL NOT NULL,
+    PRIMARY KEY (start, goal, width, backend, version)
+);
+CREATE INDEX IF NOT EXISTS segments_used ON segments (used);
+CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL);
+"""
+
+
+class SegmentCache:
+    """Bounded LRU/TTL store of segment paths in a SQLite file."""
+
+    def __init__(self, path, version, cols, max_entries=5000, ttl=24 * 3600):
+        self.path = path
+        self.version = version
+        self.cols = cols
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._local = threading.local()
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM segments WHERE version != ?", (version,))
+            stale = conn.execute("SELECT value FROM counters WHERE name = 'version'").fetchone()
+            if stale is None or stale[0] != version:
+                conn.execute("DELETE FROM counters")
+                conn.execute("INSERT INTO counters VALUES ('version', ?)", (version,))
+
+    def _conn(self):
+        # one connection per process and thread (sqlite connections must not cross a fork)
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _key(self, start_rc, goal_rc, width, backend):
+        start = start_rc[0] * self.cols + start_rc[1]
+        goal = goal_rc[0] * self.cols + goal_rc[1]
+        return (start, goal, -1 if width is None else int(width), backend, self.version)
+
+    def _count(self, conn, name):
+        conn.execute("INSERT INTO counters VALUES (?, 1) "
+                     "ON CONFLICT(name) DO UPDATE SET value = value + 1", (name,))
+
+    def get(self, start_rc, goal_rc, width, backend):
+        """Cached path as a list of (row, col) tuples, or None on a miss."""
+        key = self._key(start_rc, goal_rc, width, backend)
+        now = time.time()
+        try:
+            conn = self._conn()
+            with conn:
+                row = conn.execute(
+                    "SELECT path FROM segments WHERE start = ? AND goal = ? AND width = ? "
+                    "AND backend = ? AND version = ? AND created >= ?", key + (now - self.ttl,)
+                ).fetchone()
+                if row is None:
+                    self._count(conn, "misses")
+                    return None
+                conn.execute("UPDATE segments SET used = ? WHERE start = ? AND goal = ? AND width = ? "
+                             "AND backend = ? AND version = ?", (now,) + key)
+                self._count(conn, "hits")
+        except sqlite3.Error:
+            return None
+        pairs = np.frombuffer(row[0], dtype=np.int32).reshape(-1, 2)
+        return [(int(r), int(c)) for r, c in pairs]
+
+    def put(self, start_rc, goal_rc, width, backend, path):
+        """Store a found path and evict the least recently used entries beyond max_entries."""
+        if not path:
+            return
+        key = self._key(start_rc, goal_rc, width, backend)
+        blob = np.asarray(path, dtype=np.int32).tobytes()
+        now = time.time()
+        try:
+            conn = self._conn()
+            with conn:
+                conn.execute("INSERT OR REPLACE INTO segments VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                             key + (blob, now, now))
+                conn.execute("DELETE FROM segments WHERE created < ?", (now - self.ttl,))
+                excess = conn.execute("SELECT COUNT(*) FROM segments").fetchone()[0] - self.max_entries
+                if excess > 0:
+                    conn.execute("DELETE FROM segments WHERE rowid IN "
+                                 "(SELECT rowid FROM segments ORDER BY used LIMIT ?)", (excess,))
+                    conn.execute("INSERT INTO counters VALUES ('evictions', ?) "
+                                 "ON CONFLICT(name) DO UPDATE SET value = value + ?", (excess, excess))
+        except sqlite3.Error:
+            pass
+
+    def stats(self):
+        """Hits, misses, evictions (over all processes since the last invalidation) and size."""
+        try:
+            conn = self._conn()
+            counters = dict(conn.execute("SELECT name, value FROM counters WHERE name != 'version'"))
+            entries, size = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(LENGTH(path)), 0) FROM segments").fetchone()
+        except sqlite3.Error:
+            return {}
+        hits = counters.get("hits", 0)
+        misses = counters.get("misses", 0)
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / (hits + misses), 3) if hits + misses else 0.0,
+            "evictions": counters.get("evictions", 0),
+            "entries": entries,
+            "path_bytes": size,
+            "max_entries": self.max_entries,
+            "version": self.version,
+        }
+
+    def clear(self):
+        """Drop all entries and counters."""
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM segments")
+            conn.execute("DELETE FROM counters WHERE name != 'version'")
+
+
+def open_segment_cache(directories, filename, version, cols, **kwargs):
+    """Open the cache in the first writable directory; None if none works."""
+    for directory in directories:
+        try:
+            return SegmentCache(os.path.join(directory, filename), version, cols, **kwargs)
+        except (sqlite3.Error, OSError):
+            continue
+    return None
@@ -0,0 +1,206 @@
+"""
+surfaces.py - accumulated-cost surfaces for fixed targets (substations).
+
+For a registered target cell t one reverse Dijkstra over the whole grid gives, for
+every cell x, the cost of the cheapest route x -> t and the first step of that route.
+Both are stored next to the grid and memory-mapped read-only, so every process shares
+them:
+- cost: uint32 (uint64 if the grid needs it), the dtype maximum where t cannot be reached;
+- direction: uint8 code of the next cell (0 up, 1 down, 2 left, 3 right, DIR_NONE),
+  i.e. the predecessor field of the reverse search in 1 byte per cell.
+A route from any cell to t is then a walk along the directions (gridsearch.trace_directions),
+O(path length), with no search. The route is cost-optimal on the whole grid.
+
+overview() min-pools the cost raster for display (reachability corridors), png() renders
+it as an 8-bit grayscale image without an imaging dependency.
+Surfaces are built offline with models/build_surfaces.py (SurfaceStore.register()) and are
+ignored once final_grid.npy changes (digest check). Serving processes notice a rebuilt or
+removed surface by its .npz (inode and mtime, checked on every get()).
+"""
+
+import os
+import struct
+import threading
+import zlib
+
+import numpy as np
+
+from gridsearch import DIR_NONE, dijkstra_flat, grid_digest, settled_costs, trace_directions
+
+
+class CostSurface:
+    """Accumulated cost and next-step direction of every cell towards one target."""
+
+    def __init__(self, target, shape, cost, direction, digest):
+        self.target = (int(target[0]), int(target[1]))
+        self.shape = (int(shape[0]), int(shape[1]))
+        self.cost = cost
+        self.direction = direction
+        self.digest = str(digest)
+
+    @property
+    def unreached(self):
+        return np.iinfo(self.cost.dtype).max
+
+    @property
+    def nbytes(self):
+        return self.cost.nbytes + self.direction.nbytes
+
+    def cost_from(self, start_rc):
+        """Route cost from start_rc to the target, or None if unreachable."""
+        c = self.cost[start_rc[0] * self.shape[1] + start_rc[1]]
+        return None if c == self.unreached else int(c)
+
+    def route_from(self, start_rc):
+        """Cheapest path start_rc -> target as (row, col) tuples (empty if unreachable)."""
+        rows, cols = self.shape
+        sr, sc = start_rc
+        if not (0 <= sr < rows and 0 <= sc < cols):
+            return []
+        flat = trace_directions(self.direction, cols, sr * cols + sc,
+                                self.target[0] * cols + self.target[1])
+        return [(int(i // cols), int(i % cols)) for i in flat]
+
+    def overview(self, factor=8):
+        """Cost raster min-pooled over factor x factor blocks (float64, NaN = unreachable)."""
+        rows, cols = self.shape
+        cost = np.asarray(self.cost).reshape(rows, cols)
+        r, c = -(-rows // factor), -(-cols // factor)
+        padded = np.full((r * factor, c * factor), self.unreached, dtype=cost.dtype)
+        padded[:rows, :cols] = cost
+        pooled = padded.reshape(r, factor, c, factor).min(axis=(1, 3)).astype(np.float64)
+        pooled[pooled == self.unreached] = np.nan
+        return pooled
+
+    def png(self, factor=4):
+        """overview() as a grayscale PNG: dark = cheap, log-scaled, white = unreachable."""
+        values = self.overview(factor)
+        ok = np.isfinite(values)
+        img = np.full(values.shape, 255, dtype=np.uint8)
+        if ok.any():
+            v = np.log1p(values[ok])
+            span = max(float(v.max() - v.min()), 1e-9)
+            img[ok] = np.round((v - v.min()) / span * 254).astype(np.uint8)
+        return _png_gray(img)
+
+    def save(self, prefix):
+        # write-then-rename: other processes may have the previous files memory-mapped
+        for suffix, array in (("_cost.npy", self.cost), ("_dir.npy", self.direction)):
+            tmp = f"{prefix}{suffix}.{os.getpid()}.tmp"
+            with open(tmp, "wb") as fh:
+                np.save(fh, array)
+            os.replace(tmp, prefix + suffix)
+        tmp = f"{prefix}.npz.{os.getpid()}.tmp"
+        with open(tmp, "wb") as fh:
+            np.savez(fh, target=np.array(self.target), shape=np.array(self.shape),
+                     digest=np.array(self.digest))
+        os.replace(tmp, prefix + ".npz")
+
+
+def _png_gray(img):
+    """Minimal 8-bit grayscale PNG encoder (filter 0 rows, one zlib stream)."""
+    def chunk(kind, data):
+        return (struct.pack(">I", len(data)) + kind + data
+                + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF))
+    h, w = img.shape
+    raw = np.hstack((np.zeros((h, 1), dtype=np.uint8), img)).tobytes()
+    return (b"\x89PNG\r\n\x1a\n"
+            + chunk(b"IHDR", struct.pack(">IIBBBBB", w, h, 8, 0, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(raw, 6))
+            + chunk(b"IEND", b""))
+
+
+def build_surface(grid, target_rc, digest=None):
+    """Reverse Dijkstra from target_rc over the whole grid -> CostSurface."""
+    rows, cols = grid.shape
+    target = target_rc[0] * cols + target_rc[1]
+    ws, gen = dijkstra_flat(grid, [target], reverse=True)
+    n = rows * cols
+    g = settled_costs(ws, gen, np.arange(n))
+    settled = g >= 0
+    top = int(g.max())
+    cost_dtype = np.uint32 if top < np.iinfo(np.uint32).max else np.uint64
+    cost = np.full(n, np.iinfo(cost_dtype).max, dtype=cost_dtype)
+    cost[settled] = g[settled]
+
+    # reverse search: parent[x] is the neighbour x steps to on its way to the target
+    step = ws.parent[:n].astype(np.int64) - np.arange(n)
+    direction = np.full(n, DIR_NONE, dtype=np.uint8)
+    has_next = settled & (ws.parent[:n] >= 0)
+    for code, delta in enumerate((-cols, cols, -1, 1)):
+        direction[has_next & (step == delta)] = code
+    return CostSurface(target_rc, (rows, cols), cost, direction,
+                       digest if digest is not None else grid_digest(grid))
+
+
+def load_surface(prefix, digest=None):
+    """Memory-map a surface saved with CostSurface.save(prefix); None if missing or stale."""
+    try:
+        with np.load(prefix + ".npz") as meta:
+            target = tuple(meta["target"])
+            shape = tuple(meta["shape"])
+            saved = str(meta["digest"])
+        # np.asarray drops the memmap subclass but keeps the mapped buffer
+        cost = np.asarray(np.load(prefix + "_cost.npy", mmap_mode="r"))
+        direction = np.asarray(np.load(prefix + "_dir.npy", mmap_mode="r"))
+    except (OSError, ValueError, KeyError):
+        return None
+    if digest is not None and saved != digest:
+        return None
+    return CostSurface(target, shape, cost, direction, saved)
+
+
+class SurfaceStore:
+    """The registered surfaces of one grid, kept in a directory as <row>_<col>{.npz,_cost,_dir}."""
+
+    def __init__(self, directory, grid, digest=None):
+        self.directory = directory
+        self.grid = grid
+        self.digest = digest if digest is not None else grid_digest(grid)
+        self._loaded = {}
+        self._lock = threading.Lock()
+
+    def _prefix(self, target_rc):
+        return os.path.join(self.directory, f"{int(target_rc[0])}_{int(target_rc[1])}")
+
+    def targets(self):
+        """Registered target cells (row, col) with a surface for this grid."""
+        if not os.path.isdir(self.directory):
+            return []
+        found = []
+        for name in sorted(os.listdir(self.directory)):
+            if name.endswith(".npz"):
+                r, c = name[:-4].split("_")
+                if self.get((int(r), int(c))) is not None:
+                    found.append((int(r), int(c)))
+        return found
+
+    def get(self, target_rc):
+        """The surface towards target_rc, or None if it is not registered (or stale)."""
+        key = (int(target_rc[0]), int(target_rc[1]))
+        try:
+            st = os.stat(self._prefix(key) + ".npz")
+        except OSError:
+            with self._lock:
+                self._loaded.pop(key, None)
+            return None
+        # save() replaces the .npz last, so a new inode / mtime means a rebuilt surface
+        version = (st.st_ino, st.st_mtime_ns)
+        cached = self._loaded.get(key)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        # a stale surface (other grid digest) is remembered as None for this version too,
+        # so it is not loaded again on every request until it is rebuilt
+        surface = load_surface(self._prefix(key), self.digest)
+        with self._lock:
+            self._loaded[key] = (version, surface)
+        return surface
+
+    def register(self, target_rc):
+        """Build (or rebuild) and save the surface for target_rc; returns it memory-mapped."""
+        key = (int(target_rc[0]), int(target_rc[1]))
+        os.makedirs(self.directory, exist_ok=True)
+        build_surface(self.grid, key, self.digest).save(self._prefix(key))
+        with self._lock:
+            self._loaded.pop(key, None)
+        return self.get(key)
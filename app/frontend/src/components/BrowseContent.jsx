@@ -75,10 +75,12 @@ export default function BrowseContent() {
         try {
           // include bounding box to not get unnecessary data
           const bbox = await geocodeLocation(locationQuery); // [south, west, north, east]
+          // same zoom geocodeLocation sets on the map; the backend simplifies geometries to it
+          const zoom = locationQuery === "Czech Republic" ? 7 : 12;
           const response = await fetch(API_ROUTES.mapData, {
             method: "POST",
             headers: { "Content-Type": "application/json" },
-            body: JSON.stringify({ bbox, zone: filters.zone }),
+            body: JSON.stringify({ bbox, zoom, zone: filters.zone }),
           });
 
           if (!response.ok){
@@ -0,0 +1,86 @@
+"""
+Batch planning (plan.plan_routes) against independent per-pair searches.
+
+Picks seeded origins and destinations on the grid (a few origins, a dozen candidate
+connection points within ~150 km) and computes every origin x destination route:
+  - independent: one plan.find_path per pair, as N separate /api/plan-route calls would
+    (default backend and corridor, segment cache bypassed);
+  - batch: plan_routes, one Dijkstra tree per origin, serial and on the worker pool.
+Reports wall time, expanded nodes (grid-level only; HPA's abstract search is not counted)
+and how the exact batch costs compare with the per-pair searches (never dearer). A tree
+costs about the same whatever its destination count, so batching pays off with many
+destinations per origin.
+
+Usage: python benchmarks/bench_batch_routes.py [origins] [destinations]
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app", "backend")
+sys.path.insert(0, BACKEND_DIR)
+
+import plan  # noqa: E402
+
+SEED = 0
+SPREAD = 300  # cells around the study centre
+
+
+def sample(n, rng, centre):
+    rows, cols = plan.final_grid.shape
+    r = np.clip(centre[0] + rng.integers(-SPREAD, SPREAD, n), 0, rows - 1)
+    c = np.clip(centre[1] + rng.integers(-SPREAD, SPREAD, n), 0, cols - 1)
+    cells = np.column_stack((r, c))
+    lon, lat = plan.cells_to_lonlat(cells)
+    return [{"x": x, "y": y} for x, y in zip(lon, lat)], [tuple(map(int, rc)) for rc in cells]
+
+
+def path_cost(path):
+    return sum(int(plan.final_grid[p]) for p in path[1:])
+
+
+def main():
+    n_o = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    n_d = int(sys.argv[2]) if len(sys.argv) > 2 else 12
+    rng = np.random.default_rng(SEED)
+    rows, cols = plan.final_grid.shape
+    centre = (rows // 2, cols // 2)
+    origins, o_cells = sample(n_o, rng, centre)
+    destinations, d_cells = sample(n_d, rng, centre)
+    print(f"{n_o} origins x {n_d} destinations = {n_o * n_d} routes")
+
+    plan.find_path(plan.final_grid, (0, 0), (0, 1), plan.CORRIDOR_WIDTH)  # compile
+    plan.USE_PARALLEL = False
+    plan.plan_routes(origins[:1], destinations[:1])
+
+    t0 = time.perf_counter()
+    independent, expanded = [], 0
+    for s in o_cells:
+        for t in d_cells:
+            st = {}
+            independent.append(path_cost(plan.find_path(plan.final_grid, s, t, plan.CORRIDOR_WIDTH, stats=st)))
+            expanded += st.get("expanded", 0) + sum(a["expanded"] for a in st.get("attempts", [])[:-1])
+    print(f"{'independent find_path':<26} {(time.perf_counter() - t0) * 1e3:>8.0f} ms {expanded:>10} expanded")
+
+    for parallel in (False, True):
+        plan.USE_PARALLEL = parallel
+        if parallel:
+            plan.start_worker_pool()
+        st = {}
+        t0 = time.perf_counter()
+        costs, lengths, _ = plan.plan_routes(origins, destinations, stats=st)
+        ms = (time.perf_counter() - t0) * 1e3
+        name = "batch, worker pool" if parallel else "batch, serial"
+        print(f"{name:<26} {ms:>8.0f} ms {st['expanded']:>10} expanded  ({st['origin_trees']} trees)")
+    plan.stop_worker_pool()
+
+    batch = np.array([c for row in costs for c in row], dtype=float)
+    ref = np.array(independent, dtype=float)
+    print(f"batch vs corridor cost: equal {int((batch == ref).sum())}, cheaper {int((batch < ref).sum())}, "
+          f"dearer {int((batch > ref).sum())}; total {batch.sum() / ref.sum() - 1:+.1%}")
+
+
+if __name__ == "__main__":
+    main()
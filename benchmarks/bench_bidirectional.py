@@ -0,0 +1,102 @@
+"""
+Validate and time bidirectional search (gridsearch.bidirectional_flat) on long segments.
+
+On a seeded set of long origin-destination pairs it runs, inside the same corridor window:
+plan.a_star_numpy_grid (the original search, reference), unidirectional A* with the Manhattan
+heuristic and, when the tables are loaded, the ALT heuristic, and bidirectional Dijkstra.
+For every engine it reports expanded nodes and time, and how many path costs are equal to /
+cheaper / dearer than the reference. Bidirectional search is exact in the corridor, so it must
+never come out dearer than the reference and must match ALT exactly; the script exits non-zero
+otherwise.
+
+Usage: python benchmarks/bench_bidirectional.py [pairs]
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app", "backend")
+sys.path.insert(0, BACKEND_DIR)
+
+import plan  # noqa: E402
+from gridsearch import a_star_flat, bidirectional_flat, corridor_window  # noqa: E402
+
+SEED = 0
+MIN_DISTANCE = plan.BIDIR_MIN_DISTANCE
+
+
+def od_pairs(n):
+    rng = np.random.default_rng(SEED)
+    rows, cols = plan.final_grid.shape
+    pairs = []
+    while len(pairs) < n:
+        s = (int(rng.integers(rows)), int(rng.integers(cols)))
+        t = (int(rng.integers(rows)), int(rng.integers(cols)))
+        if abs(s[0] - t[0]) + abs(s[1] - t[1]) >= MIN_DISTANCE:
+            pairs.append((s, t))
+    return pairs
+
+
+def path_cost(grid, path):
+    return sum(int(grid[p]) for p in path[1:])
+
+
+def numpy_reference(grid, s, t, width, window):
+    r_lo, r_hi, c_lo, c_hi = window
+    sub = grid[r_lo:r_hi, c_lo:c_hi]
+    ls, lt = (s[0] - r_lo, s[1] - c_lo), (t[0] - r_lo, t[1] - c_lo)
+    mask = plan.make_corridor_mask(sub.shape, ls, lt, width)
+    return [(r + r_lo, c + c_lo) for r, c in plan.a_star_numpy_grid(sub, ls, lt, corridor_mask=mask)]
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    grid = plan.final_grid
+    width = plan.CORRIDOR_WIDTH
+    pairs = od_pairs(n)
+    engines = {
+        "manhattan": lambda s, t, w, st: a_star_flat(grid, s, t, width, stats=st, window=w),
+        "bidir": lambda s, t, w, st: bidirectional_flat(grid, s, t, width, window=w, stats=st),
+    }
+    if plan.landmark_tables is not None:
+        engines["alt"] = lambda s, t, w, st: a_star_flat(grid, s, t, width, stats=st,
+                                                         landmarks=plan.landmark_tables, window=w)
+    for run in engines.values():
+        run((0, 0), (0, 1), None, {})  # compile
+
+    ref_cost, ref_ms = [], 0.0
+    costs = {name: [] for name in engines}
+    totals = {name: [0, 0.0] for name in engines}
+    for s, t in pairs:
+        window = corridor_window(grid.shape, s, t, width)
+        t0 = time.perf_counter()
+        ref_cost.append(path_cost(grid, numpy_reference(grid, s, t, width, window)))
+        ref_ms += (time.perf_counter() - t0) * 1e3
+        for name, run in engines.items():
+            st = {}
+            t0 = time.perf_counter()
+            path = run(s, t, window, st)
+            totals[name][1] += (time.perf_counter() - t0) * 1e3
+            totals[name][0] += st.get("expanded", 0)
+            costs[name].append(path_cost(grid, path))
+
+    print(f"{n} pairs, distance >= {MIN_DISTANCE}, corridor width {width}")
+    print(f"{'numpy (reference)':<18} {'':>10} {ref_ms:>9.0f} ms")
+    ref = np.array(ref_cost)
+    for name in engines:
+        c = np.array(costs[name])
+        print(f"{name:<18} {totals[name][0]:>10} expanded {totals[name][1]:>9.0f} ms  "
+              f"equal {int((c == ref).sum())}  cheaper {int((c < ref).sum())}  dearer {int((c > ref).sum())}")
+
+    bidir = np.array(costs["bidir"])
+    failed = bool((bidir > ref).any())
+    if "alt" in costs and not np.array_equal(bidir, np.array(costs["alt"])):
+        failed = True
+    print("FAILED: bidirectional cost is not optimal" if failed else "OK")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Compare serial and concurrent CORINE paging against the local ArcGIS stand-in.
+
+Starts app/backend/fixtures/arcgis_standin.py on the sample features with a fixed
+per-page latency, then times: the old loop (one requests.post per page, one page at a
+time), corine.fetch_features with concurrency 1 and FETCH_CONCURRENCY, and the same with
+every 5th request failing (503) to exercise the retries. Each run must return every
+feature exactly once, in order.
+
+Usage: python benchmarks/bench_corine_fetch.py [page_size] [latency_s]
+"""
+import json
+import os
+import sys
+import time
+
+import requests
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app", "backend")
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, os.path.join(BACKEND_DIR, "fixtures"))
+
+import corine  # noqa: E402
+from arcgis_standin import SAMPLE, serve  # noqa: E402
+
+GEOMETRY = {"rings": [], "spatialReference": {"wkid": 4326}}
+
+
+def serial_fetch(url, page_size):
+    """The pre-existing loop: a new connection per page, pages one after another."""
+    features, offset = [], 0
+    while True:
+        data = requests.post(url, data=corine.page_params(offset, GEOMETRY, page_size), timeout=30).json()
+        features.extend(data.get("features", []))
+        if not data.get("exceededTransferLimit", False) or len(data["features"]) < page_size:
+            return features
+        offset += page_size
+
+
+def main():
+    page_size = int(sys.argv[1]) if len(sys.argv) > 1 else 2
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.2
+    with open(SAMPLE) as f:
+        expected = [feat["id"] for feat in json.load(f)["features"]]
+    pages = -(-len(expected) // page_size)
+    print(f"{len(expected)} features, {pages} pages of {page_size}, {latency * 1e3:.0f} ms per page")
+
+    runs = [
+        ("serial loop", 0, lambda url: serial_fetch(url, page_size)),
+        ("pooled, concurrency 1", 0,
+         lambda url: corine.fetch_features(url, GEOMETRY, page_size=page_size, concurrency=1)),
+        (f"pooled, concurrency {corine.FETCH_CONCURRENCY}", 0,
+         lambda url: corine.fetch_features(url, GEOMETRY, page_size=page_size)),
+        (f"concurrency {corine.FETCH_CONCURRENCY}, every 5th 503", 5,
+         lambda url: corine.fetch_features(url, GEOMETRY, page_size=page_size)),
+    ]
+    corine.FETCH_BACKOFF = 0.05
+    for name, fail_every, run in runs:
+        server, url = serve(json.load(open(SAMPLE))["features"], latency=latency, fail_every=fail_every)
+        t0 = time.perf_counter()
+        features = run(url)
+        ms = (time.perf_counter() - t0) * 1e3
+        requests_made = server.RequestHandlerClass.counter["requests"]
+        server.shutdown()
+        ok = [feat["id"] for feat in features] == expected
+        print(f"{name:<32} {ms:>7.0f} ms  {requests_made:>3} requests  {'OK' if ok else 'MISMATCH'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Tune the adaptive corridor schedule (plan.CORRIDOR_WIDTHS) on a seeded benchmark set.
+
+For every schedule it runs gridsearch.a_star_widening on the same origin-destination pairs
+and reports, against the fixed CORRIDOR_WIDTH search: total expanded nodes, total search
+time, how many segments needed widening, the mean number of attempts, how many paths got
+cheaper / dearer and the change in summed path cost. Per-attempt stats come straight from the stats["attempts"] list.
+
+Usage: python benchmarks/bench_corridor_schedule.py [pairs]
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app", "backend")
+sys.path.insert(0, BACKEND_DIR)
+
+import plan  # noqa: E402
+from gridsearch import a_star_flat, a_star_widening, corridor_window  # noqa: E402
+
+SCHEDULES = [(10, 20, 40, 80, 160), (20, 40, 80), (20, 40), (40, 80), (40, 160)]
+SEED = 0
+
+
+def od_pairs(n):
+    rng = np.random.default_rng(SEED)
+    rows, cols = plan.final_grid.shape
+    pairs = []
+    for _ in range(n):
+        s = (int(rng.integers(rows)), int(rng.integers(cols)))
+        d = int(rng.choice([50, 200, 600]))
+        t = (int(np.clip(s[0] + rng.integers(-d, d + 1), 0, rows - 1)),
+             int(np.clip(s[1] + rng.integers(-d, d + 1), 0, cols - 1)))
+        pairs.append((s, t))
+    return pairs
+
+
+def path_cost(grid, path):
+    return sum(int(grid[p]) for p in path[1:])
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    grid = plan.final_grid
+    landmarks = plan.landmark_tables if plan.USE_LANDMARKS else None
+    pairs = od_pairs(n)
+    a_star_widening(grid, (0, 0), (0, 1), SCHEDULES[0], landmarks=landmarks)  # compile
+
+    base_cost, base_exp, t0 = [], 0, time.perf_counter()
+    for s, t in pairs:
+        st = {}
+        p = a_star_flat(grid, s, t, plan.CORRIDOR_WIDTH, stats=st, landmarks=landmarks,
+                        window=corridor_window(grid.shape, s, t, plan.CORRIDOR_WIDTH))
+        base_cost.append(path_cost(grid, p))
+        base_exp += st.get("expanded", 0)
+    base_ms = (time.perf_counter() - t0) * 1e3
+    print(f"fixed width {plan.CORRIDOR_WIDTH}: {base_exp} expanded, {base_ms:.0f} ms")
+
+    print(f"{'schedule':<22} {'expanded':>9} {'ms':>7} {'widened':>8} {'attempts':>8} "
+          f"{'cheaper':>8} {'dearer':>7} {'total cost':>13}")
+    for widths in SCHEDULES:
+        expanded, widened, attempts, cheaper, dearer, total = 0, 0, 0, 0, 0, 0
+        t0 = time.perf_counter()
+        for (s, t), ref in zip(pairs, base_cost):
+            st = {}
+            p = a_star_widening(grid, s, t, widths, landmarks=landmarks, stats=st)
+            cost = path_cost(grid, p)
+            expanded += st.get("expanded", 0)
+            attempts += len(st.get("attempts", [1]))
+            widened += len(st.get("attempts", [1])) > 1
+            cheaper += cost < ref
+            dearer += cost > ref
+            total += cost
+        ms = (time.perf_counter() - t0) * 1e3
+        print(f"{str(widths):<22} {expanded:>9} {ms:>7.0f} {widened:>8} {attempts / n:>8.2f} "
+              f"{cheaper:>8} {dearer:>7} {total / sum(base_cost) - 1:>+12.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Payload size and serialisation time of /api/map-data queries (corine.FeatureStore).
+
+Builds a store from synthetic CORINE-like polygons spread over Czechia (irregular rings
+with many vertices, random Code_18) and times the unfiltered collection against viewport
+queries: the whole country at zoom 7, a region at zoom 10, a city at zoom 12 and 14,
+and a city with a class filter.
+
+Usage: python benchmarks/bench_map_query.py [features] [vertices]
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app", "backend")
+sys.path.insert(0, BACKEND_DIR)
+
+import geopandas as gpd  # noqa: E402
+from shapely.geometry import Polygon  # noqa: E402
+
+from corine import FeatureStore  # noqa: E402
+
+CODES = ["111", "112", "121", "211", "231", "242", "311", "312", "313", "512"]
+CZ = (48.55, 12.09, 51.06, 18.86)  # south, west, north, east
+QUERIES = [
+    ("country, zoom 7", dict(bbox=CZ, zoom=7)),
+    ("region, zoom 10", dict(bbox=(49.8, 14.0, 50.3, 14.9), zoom=10)),
+    ("city, zoom 12", dict(bbox=(50.0, 14.3, 50.15, 14.6), zoom=12)),
+    ("city, zoom 14", dict(bbox=(50.0, 14.3, 50.15, 14.6), zoom=14)),
+    ("city, zoom 12, forest", dict(bbox=(50.0, 14.3, 50.15, 14.6), zoom=12, classes=("31",))),
+]
+
+
+def synthetic(n, vertices, seed=0):
+    rng = np.random.default_rng(seed)
+    south, west, north, east = CZ
+    polys = []
+    for _ in range(n):
+        cx, cy = rng.uniform(west, east), rng.uniform(south, north)
+        ang = np.sort(rng.uniform(0, 2 * np.pi, vertices))
+        rad = rng.uniform(0.004, 0.02) * (1 + 0.3 * rng.standard_normal(vertices)).clip(0.4)
+        polys.append(Polygon(np.column_stack([cx + 1.5 * rad * np.cos(ang), cy + rad * np.sin(ang)])))
+    return gpd.GeoDataFrame({"Code_18": rng.choice(CODES, n), "Area_Ha": rng.uniform(25, 500, n)},
+                            geometry=polys, crs="EPSG:4326")
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 15000
+    vertices = int(sys.argv[2]) if len(sys.argv) > 2 else 150
+    gdf = synthetic(n, vertices)
+    t0 = time.perf_counter()
+    store = FeatureStore(gdf)
+    print(f"{n} polygons x {vertices} vertices, store built in {time.perf_counter() - t0:.1f}s")
+
+    t0 = time.perf_counter()
+    full = store.query()
+    print(f"{'unfiltered (first build)':<26} {len(full) / 1e6:>8.2f} MB {(time.perf_counter() - t0) * 1e3:>8.0f} ms")
+    for name, q in QUERIES:
+        t0 = time.perf_counter()
+        body = store.query(q["bbox"], q["zoom"], q.get("classes", ()))
+        ms = (time.perf_counter() - t0) * 1e3
+        count = len(store.select(q["bbox"], q.get("classes", ())))
+        print(f"{name:<26} {len(body) / 1e6:>8.2f} MB {ms:>8.0f} ms  {count:>6} features")
+
+
+if __name__ == "__main__":
+    main()
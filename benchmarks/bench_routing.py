@@ -0,0 +1,279 @@
+"""
+Reproducible routing benchmark over the shipped final_grid.npy.
+
+A seeded workload of origin-destination pairs is drawn from cells inside the CORINE cover
+(non-zero cost), in four categories:
+  short          Manhattan distance 20-80 cells
+  medium         150-300 cells
+  cross-country  >= 600 cells
+  detour         100-400 cells whose straight line runs >= 30% over water / Natura / barrier
+                 cells (cost >= DETOUR_COST in the uint16 routing grid)
+Every engine routes every pair (the dict-based pathfinding.a_star only the short ones) on the
+uint16 routing grid plan.py uses, with plan.CORRIDOR_WIDTH and the same corridor window:
+  pathfinding  original dict/heapq A* over the full grid (pathfinding.py)
+  numpy        plan.a_star_numpy_grid with the corridor mask (the reference)
+  flat         compiled kernel, Manhattan (must return the numpy cost exactly)
+  widening     a_star_widening through plan.CORRIDOR_WIDTHS (the default flat path)
+  alt          compiled kernel with the landmark heuristic (if final_grid_alt is built)
+  bidir        bidirectional Dijkstra (must match alt: both are exact in the corridor)
+  hpa          hierarchical search (if final_grid_hpa.npz is built)
+  plan         plan.find_path with the default backend selection (what a request gets)
+  optimum      full-grid Dijkstra: the cheapest possible cost, no engine may beat it
+
+Per engine and category: latency p50 / p90 / p99 / mean, mean nodes expanded, peak memory
+allocated during a call (tracemalloc, separate pass so timings are not skewed; reused
+search workspaces are not counted), and path costs against numpy (equal / cheaper /
+dearer) and the optimum (mean excess).
+
+--json PATH writes the run (settings, grid digest, per-pair costs and the summary) as a
+baseline; --compare PATH prints latency changes against such a baseline and checks that
+every engine still returns the same costs. Exits non-zero when an invariant above or the
+baseline cost check fails.
+
+Usage: python benchmarks/bench_routing.py [--pairs N] [--engines a,b] [--json out.json]
+                                          [--compare baseline.json]
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app", "backend")
+sys.path.insert(0, BACKEND_DIR)
+
+import plan  # noqa: E402
+import pathfinding  # noqa: E402
+from gridsearch import (a_star_flat, a_star_widening, bidirectional_flat, corridor_window,  # noqa: E402
+                        dijkstra_flat, grid_digest, settled_costs, HAVE_NUMBA)
+from hierarchy import hpa_search  # noqa: E402
+
+SEED = 20240601
+CATEGORIES = {
+    "short": (20, 80),
+    "medium": (150, 300),
+    "cross-country": (600, None),
+    "detour": (100, 400),
+}
+DETOUR_COST = 45          # water 45/50, plus Natura surcharges
+DETOUR_SHARE = 0.3
+PATHFINDING_CATEGORIES = ("short",)
+PERCENTILES = (50, 90, 99)
+
+
+def line_share(grid, s, t):
+    """Share of cells on the straight line s -> t with cost >= DETOUR_COST."""
+    steps = max(abs(t[0] - s[0]), abs(t[1] - s[1]), 1)
+    r = np.rint(np.linspace(s[0], t[0], steps + 1)).astype(int)
+    c = np.rint(np.linspace(s[1], t[1], steps + 1)).astype(int)
+    return float((grid[r, c] >= DETOUR_COST).mean())
+
+
+def workload(grid, per_category):
+    """{category: [(start, goal), ...]}, the same for a given seed, grid and size."""
+    rng = np.random.default_rng(SEED)
+    inside = np.flatnonzero(grid.ravel() != 0)
+    cols = grid.shape[1]
+    pairs = {}
+    for name, (lo, hi) in CATEGORIES.items():
+        found = []
+        while len(found) < per_category:
+            a, b = rng.choice(inside, 2)
+            s = (int(a // cols), int(a % cols))
+            t = (int(b // cols), int(b % cols))
+            d = abs(s[0] - t[0]) + abs(s[1] - t[1])
+            if d < lo or (hi is not None and d > hi):
+                continue
+            if name == "detour" and line_share(grid, s, t) < DETOUR_SHARE:
+                continue
+            found.append((s, t))
+        pairs[name] = found
+    return pairs
+
+
+def path_cost(grid, path):
+    return int(sum(int(grid[p]) for p in path[1:])) if path else -1
+
+
+def make_engines(grid, width):
+    wide = grid.astype(np.int64)  # pathfinding.a_star adds numpy scalars to Python ints
+
+    def numpy_ref(s, t, window, stats):
+        r_lo, r_hi, c_lo, c_hi = window
+        sub = grid[r_lo:r_hi, c_lo:c_hi]
+        ls, lt = (s[0] - r_lo, s[1] - c_lo), (t[0] - r_lo, t[1] - c_lo)
+        mask = plan.make_corridor_mask(sub.shape, ls, lt, width)
+        path = plan.a_star_numpy_grid(sub, ls, lt, corridor_mask=mask, stats=stats)
+        return [(r + r_lo, c + c_lo) for r, c in path]
+
+    def optimum(s, t, window, stats):
+        cols = grid.shape[1]
+        goal = t[0] * cols + t[1]
+        ws, gen = dijkstra_flat(grid, [s[0] * cols + s[1]], targets=[goal], stats=stats)
+        return settled_costs(ws, gen, [goal])[0]
+
+    engines = {
+        "pathfinding": lambda s, t, w, st: pathfinding.a_star(wide, s, t),
+        "numpy": numpy_ref,
+        "flat": lambda s, t, w, st: a_star_flat(grid, s, t, width, stats=st, window=w),
+        "widening": lambda s, t, w, st: a_star_widening(grid, s, t, plan.CORRIDOR_WIDTHS, stats=st),
+        "bidir": lambda s, t, w, st: bidirectional_flat(grid, s, t, width, window=w, stats=st),
+        "plan": lambda s, t, w, st: plan.find_path(grid, s, t, width, stats=st),
+        "optimum": optimum,
+    }
+    if plan.landmark_tables is not None:
+        engines["alt"] = lambda s, t, w, st: a_star_flat(grid, s, t, width, stats=st,
+                                                         landmarks=plan.landmark_tables, window=w)
+    if plan.hierarchy_graph is not None:
+        engines["hpa"] = lambda s, t, w, st: hpa_search(plan.hierarchy_graph, grid, s, t, stats=st)
+    return engines
+
+
+def run_engine(name, run, grid, pairs, width):
+    """Timed pass, then a tracemalloc pass; per pair: (ms, expanded, cost, peak_bytes)."""
+    rows = []
+    for s, t in pairs:
+        window = corridor_window(grid.shape, s, t, width)
+        st = {}
+        t0 = time.perf_counter()
+        out = run(s, t, window, st)
+        ms = (time.perf_counter() - t0) * 1e3
+        cost = int(out) if name == "optimum" else path_cost(grid, out)
+        rows.append([ms, int(st.get("expanded", 0)), cost, 0])
+    for row, (s, t) in zip(rows, pairs):
+        window = corridor_window(grid.shape, s, t, width)
+        tracemalloc.start()
+        run(s, t, window, {})
+        row[3] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return rows
+
+
+def summarise(rows, ref_costs, opt_costs):
+    ms = np.array([r[0] for r in rows])
+    cost = np.array([r[2] for r in rows])
+    ref = np.array(ref_costs)
+    opt = np.array(opt_costs)
+    ok = (cost >= 0) & (opt > 0)
+    out = {f"p{p}_ms": round(float(np.percentile(ms, p)), 3) for p in PERCENTILES}
+    out.update({
+        "mean_ms": round(float(ms.mean()), 3),
+        "expanded_mean": int(np.mean([r[1] for r in rows])),
+        "alloc_peak_kb": int(max(r[3] for r in rows) / 1024),
+        "equal": int((cost == ref).sum()),
+        "cheaper": int(((cost < ref) & (cost >= 0)).sum()),
+        "dearer": int((cost > ref).sum()),
+        "failed": int((cost < 0).sum()),
+        "excess_mean": round(float(np.mean(cost[ok] / opt[ok] - 1)), 4) if ok.any() else None,
+    })
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--pairs", type=int, default=10, help="pairs per category")
+    parser.add_argument("--engines", help="comma-separated subset (numpy and optimum always run)")
+    parser.add_argument("--json", help="write this run as a baseline")
+    parser.add_argument("--compare", help="baseline JSON to compare against")
+    args = parser.parse_args()
+
+    grid = plan.final_grid
+    width = plan.CORRIDOR_WIDTH
+    engines = make_engines(grid, width)
+    if args.engines:
+        keep = set(args.engines.split(",")) | {"numpy", "optimum"}
+        engines = {k: v for k, v in engines.items() if k in keep}
+    work = workload(grid, args.pairs)
+    # compile / warm up on one pair per category: windows with barrier cells pick a wider
+    # cost dtype, which is a separate kernel specialisation
+    for run in engines.values():
+        for s, t in (pairs[0] for pairs in work.values()):
+            run(s, t, corridor_window(grid.shape, s, t, width), {})
+    results, costs = {}, {}
+    for name, run in engines.items():
+        results[name], costs[name] = {}, {}
+        for category, pairs in work.items():
+            if name == "pathfinding" and category not in PATHFINDING_CATEGORIES:
+                continue
+            rows = run_engine(name, run, grid, pairs, width)
+            costs[name][category] = [r[2] for r in rows]
+            results[name][category] = rows
+
+    summary = {}
+    for name in engines:
+        summary[name] = {c: summarise(rows, costs["numpy"][c], costs["optimum"][c])
+                         for c, rows in results[name].items()}
+
+    print(f"{args.pairs} pairs per category, seed {SEED}, corridor width {width}, "
+          f"numba {HAVE_NUMBA}, grid {grid_digest(grid)[:12]}")
+    for category in work:
+        print(f"\n{category}")
+        print(f"  {'engine':<12}{'p50 ms':>9}{'p90 ms':>9}{'p99 ms':>9}{'expanded':>10}{'alloc KB':>10}"
+              f"{'equal':>7}{'cheaper':>8}{'dearer':>7}{'excess':>8}")
+        for name in engines:
+            s = summary[name].get(category)
+            if s is None:
+                continue
+            excess = f"{s['excess_mean']:.1%}" if s["excess_mean"] is not None else "-"
+            print(f"  {name:<12}{s['p50_ms']:>9.1f}{s['p90_ms']:>9.1f}{s['p99_ms']:>9.1f}"
+                  f"{s['expanded_mean']:>10}{s['alloc_peak_kb']:>10}{s['equal']:>7}{s['cheaper']:>8}"
+                  f"{s['dearer']:>7}{excess:>8}")
+
+    failures = []
+    for category in work:
+        if "flat" in costs and costs["flat"][category] != costs["numpy"][category]:
+            failures.append(f"flat cost differs from numpy ({category})")
+        if "alt" in costs and "bidir" in costs and costs["alt"][category] != costs["bidir"][category]:
+            failures.append(f"bidir cost differs from alt ({category})")
+        opt = costs["optimum"][category]
+        for name in engines:
+            got = costs[name].get(category, [])
+            if any(0 <= c < o for c, o in zip(got, opt)):
+                failures.append(f"{name} beats the full-grid optimum ({category})")
+
+    run = {
+        "meta": {
+            "seed": SEED, "pairs_per_category": args.pairs, "corridor_width": width,
+            "corridor_widths": list(plan.CORRIDOR_WIDTHS), "grid_digest": grid_digest(grid),
+            "numba": HAVE_NUMBA, "python": platform.python_version(), "machine": platform.machine(),
+            "cpus": os.cpu_count(), "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "summary": summary,
+        "costs": costs,
+    }
+    if args.compare:
+        with open(args.compare) as f:
+            base = json.load(f)
+        if base["meta"]["grid_digest"] != run["meta"]["grid_digest"]:
+            print("\nbaseline was recorded on another grid; costs are not compared")
+        else:
+            for name, per_cat in costs.items():
+                for category, got in per_cat.items():
+                    expected = base["costs"].get(name, {}).get(category)
+                    if expected is not None and expected[:len(got)] != got[:len(expected)]:
+                        failures.append(f"{name} costs changed against the baseline ({category})")
+        print(f"\nagainst {args.compare} ({base['meta']['time']}):")
+        for name in engines:
+            for category, s in summary[name].items():
+                b = base["summary"].get(name, {}).get(category)
+                if b is None:
+                    continue
+                change = [f"p{p} {s[f'p{p}_ms'] / b[f'p{p}_ms'] - 1:+.0%}" if b[f"p{p}_ms"] else f"p{p} -"
+                          for p in (50, 90)]
+                print(f"  {name:<12}{category:<15}{'  '.join(change)}  "
+                      f"expanded {s['expanded_mean'] - b['expanded_mean']:+d}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(run, f, indent=1)
+        print(f"\nwrote {args.json}")
+
+    print("\n" + ("FAILED:\n  " + "\n  ".join(failures) if failures else "OK"))
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
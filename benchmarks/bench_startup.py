@@ -0,0 +1,184 @@
+"""
+Cold start and per-worker memory of the gunicorn deployment (app/backend/gunicorn.conf.py).
+
+Cold start: `import main` in REPEATS fresh interpreters (median seconds), plus the slowest
+imports from `python -X importtime`.
+
+Serving: gunicorn is started once per configuration (workers x preload on / off) on a free
+local port. The time until /health answers is the start-up time; then a few routes (sync
+and one async job polled through /api/jobs, which may land on any worker) warm every
+worker up. Memory is read from /proc/<pid>/smaps_rollup for the master, each worker and the
+segment pool processes below it:
+  rss      resident set, counting pages shared with other processes in full
+  pss      proportional set size: shared pages divided among their users (sums to the total)
+  shared   resident pages also mapped by another process (copy-on-write / mmap)
+  private  pages only this process has
+"fit" is how many workers of that configuration fit in the compose mem_limit, from the
+master's PSS plus the mean PSS of one worker with its pool.
+
+Linux only (/proc). Usage: python benchmarks/bench_startup.py [--workers 1,2,4]
+                                                           [--repeats N] [--mem-limit GB]
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app", "backend"))
+
+REPEATS = 5
+MEM_LIMIT_GB = 6          # docker-compose.yml mem_limit
+START_TIMEOUT = 120
+ROUTES = [
+    [{"x": 14.42, "y": 50.08}, {"x": 14.10, "y": 50.14}],
+    [{"x": 16.61, "y": 49.19}, {"x": 16.65, "y": 49.36}, {"x": 16.80, "y": 49.30}],
+    [{"x": 15.78, "y": 50.04}, {"x": 15.83, "y": 50.21}],
+]
+
+
+def import_seconds():
+    code = "import time; t = time.perf_counter(); import main; print(time.perf_counter() - t)"
+    out = subprocess.run([sys.executable, "-c", code], cwd=BACKEND_DIR, capture_output=True, text=True, check=True)
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+def slowest_imports(n=8):
+    """[(cumulative s, self s, module)] for the top-level imports of main, slowest first."""
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"], cwd=BACKEND_DIR,
+                         capture_output=True, text=True, check=True)
+    rows = []
+    for line in out.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        own, total, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        if depth <= 2:
+            rows.append((int(total) / 1e6, int(own) / 1e6, name.strip()))
+    return sorted(rows, reverse=True)[:n]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def request(port, path, body=None):
+    data = json.dumps(body).encode() if body is not None else None
+    req = urllib.request.Request(f"http://127.0.0.1:{port}{path}", data=data,
+                                 headers={"Content-Type": "application/json"} if data else {})
+    with urllib.request.urlopen(req, timeout=300) as resp:
+        return resp.status, resp.read()
+
+
+def children(pid):
+    kids = []
+    for task in os.listdir(f"/proc/{pid}/task"):
+        try:
+            with open(f"/proc/{pid}/task/{task}/children") as fh:
+                kids += [int(p) for p in fh.read().split()]
+        except OSError:
+            pass
+    return kids
+
+
+def memory(pid):
+    """{rss, pss, shared, private} in MiB from smaps_rollup."""
+    fields = {}
+    with open(f"/proc/{pid}/smaps_rollup") as fh:
+        for line in fh:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                fields[parts[0].rstrip(":")] = int(parts[1]) / 1024
+    return {
+        "rss": fields["Rss"],
+        "pss": fields["Pss"],
+        "shared": fields["Shared_Clean"] + fields["Shared_Dirty"],
+        "private": fields["Private_Clean"] + fields["Private_Dirty"],
+    }
+
+
+def exercise(port, workers):
+    """Route through every worker (round robin is not guaranteed, so send plenty)."""
+    for _ in range(2 * workers):
+        for points in ROUTES:
+            status, _ = request(port, "/api/plan-route?format=polyline", {"points": points})
+            assert status == 200, status
+    status, body = request(port, "/api/plan-route", {"points": ROUTES[0], "async": True})
+    job = json.loads(body)["job"]
+    for _ in range(600):
+        state = json.loads(request(port, f"/api/jobs/{job}")[1])["state"]
+        if state in ("done", "failed", "cancelled"):
+            break
+        time.sleep(0.1)
+    assert state == "done", state
+    assert request(port, f"/api/jobs/{job}/result")[0] == 200
+
+
+def serve(workers, preload):
+    port = free_port()
+    env = dict(os.environ, WEB_WORKERS=str(workers), WEB_PRELOAD="1" if preload else "0",
+               WEB_BIND=f"127.0.0.1:{port}", LOG_LEVEL="WARNING")
+    t0 = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "main:app"],
+                            cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while True:
+            if proc.poll() is not None:
+                raise RuntimeError("gunicorn exited during start-up")
+            if time.perf_counter() - t0 > START_TIMEOUT:
+                raise RuntimeError("gunicorn did not come up")
+            try:
+                if request(port, "/health")[0] == 200:
+                    break
+            except OSError:
+                time.sleep(0.05)
+        ready = time.perf_counter() - t0
+        exercise(port, workers)
+        master = memory(proc.pid)
+        per_worker = []
+        for pid in children(proc.pid):
+            totals = memory(pid)
+            for sub in children(pid):
+                for key, value in memory(sub).items():
+                    totals[key] += value
+            per_worker.append(totals)
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+    return ready, master, per_worker
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--workers", default="1,2,4", help="comma-separated worker counts")
+    parser.add_argument("--repeats", type=int, default=REPEATS, help="cold imports timed")
+    parser.add_argument("--mem-limit", type=float, default=MEM_LIMIT_GB, help="container limit in GB")
+    args = parser.parse_args()
+
+    times = [import_seconds() for _ in range(args.repeats)]
+    print(f"import main: median {statistics.median(times):.2f} s (min {min(times):.2f}, {args.repeats} runs)")
+    for total, own, name in slowest_imports():
+        print(f"  {name:<24} {total:6.3f} s  (self {own:.3f} s)")
+
+    limit = args.mem_limit * 1024
+    print(f"\n{'workers':>7} {'preload':>7} {'ready s':>8} {'master pss':>11} {'worker rss':>11} "
+          f"{'worker pss':>11} {'shared':>8} {'private':>8} {'total pss':>10} {'fit':>5}")
+    for workers in [int(w) for w in args.workers.split(",")]:
+        for preload in (False, True):
+            ready, master, per_worker = serve(workers, preload)
+            mean = {key: statistics.mean(w[key] for w in per_worker) for key in master}
+            total = master["pss"] + sum(w["pss"] for w in per_worker)
+            fit = int((limit - master["pss"]) // mean["pss"])
+            print(f"{workers:>7} {'on' if preload else 'off':>7} {ready:>8.2f} {master['pss']:>9.0f}Mi "
+                  f"{mean['rss']:>9.0f}Mi {mean['pss']:>9.0f}Mi {mean['shared']:>6.0f}Mi "
+                  f"{mean['private']:>6.0f}Mi {total:>8.0f}Mi {fit:>5}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Cold per-request process pools vs. the persistent segment pool in plan.py.
+
+"cold" reproduces the old compute_route behaviour: a new ProcessPoolExecutor per request
+whose workers np.load final_grid.npy for every segment. "persistent" is
+plan.search_segments on the long-lived, memory-mapped pool. Both run the same seeded
+routes with 2-10 waypoints; only the segment search is timed (no reprojection).
+
+Usage: python benchmarks/bench_worker_pool.py [repeats]
+"""
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app", "backend")
+sys.path.insert(0, BACKEND_DIR)
+
+import plan  # noqa: E402
+
+WAYPOINTS = range(2, 11)
+SEED = 0
+
+
+def _cold_worker(args):
+    start_rc, goal_rc, width, backend = args
+    grid_local = plan.routing_costs(np.load(plan._grid_path))
+    return plan.find_path(grid_local, start_rc, goal_rc, width, backend)
+
+
+def cold_search(segments):
+    if len(segments) == 1:
+        # the old code also searched single segments in-process
+        return [plan.find_path(plan.final_grid, s, g, plan.CORRIDOR_WIDTH) for (s, g) in segments]
+    args = [(s, g, plan.CORRIDOR_WIDTH, None) for (s, g) in segments]
+    with ProcessPoolExecutor(max_workers=min(plan.MAX_WORKERS, len(args))) as ex:
+        return list(ex.map(_cold_worker, args))
+
+
+def random_route(rng, n_points, step=120):
+    """Waypoints a few dozen km apart, kept inside the grid."""
+    rows, cols = plan.final_grid.shape
+    r, c = int(rng.integers(step, rows - step)), int(rng.integers(step, cols - step))
+    points = [(r, c)]
+    for _ in range(n_points - 1):
+        r = int(np.clip(r + rng.integers(-step, step), 0, rows - 1))
+        c = int(np.clip(c + rng.integers(-step, step), 0, cols - 1))
+        points.append((r, c))
+    return list(zip(points[:-1], points[1:]))
+
+
+def timed(fn, segments, repeats):
+    times = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        paths = fn(segments)
+        times.append(time.perf_counter() - t0)
+    return statistics.median(times), paths
+
+
+def main():
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    rng = np.random.default_rng(SEED)
+    plan.start_worker_pool()
+    plan.search_segments(random_route(rng, 3))  # let the workers finish warming up
+
+    print(f"{'waypoints':>9} {'cold ms':>9} {'persistent ms':>14} {'speedup':>8}")
+    for n in WAYPOINTS:
+        segments = random_route(rng, n)
+        cold, cold_paths = timed(cold_search, segments, repeats)
+        warm, warm_paths = timed(plan.search_segments, segments, repeats)
+        assert cold_paths == warm_paths, "pools returned different paths"
+        print(f"{n:>9} {cold * 1e3:>9.1f} {warm * 1e3:>14.1f} {cold / warm:>7.1f}x")
+    plan.stop_worker_pool()
+
+
+if __name__ == "__main__":
+    main()
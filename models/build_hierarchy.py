@@ -0,0 +1,55 @@
+"""
+Build the HPA* abstraction graph for the routing backend.
+
+Reads app/backend/final_grid.npy (same uint16 view the backend routes on), partitions it
+into clusters, precomputes entrance and in-cluster costs and writes
+app/backend/final_grid_hpa.npz. Run it again after prepare_rasters.py regenerates the grid;
+the backend ignores a graph built for a different grid.
+
+Every graph is validated against an exact full-grid Dijkstra (hierarchy.measure_excess).
+One whose worst cost excess is above hierarchy.MAX_EXCESS is rejected and rebuilt with
+half the entrance spacing; if even spacing 1 fails, nothing is written (and a previous
+graph is removed) so the backend falls back to its exact searches.
+
+Usage: python build_hierarchy.py [cluster_size] [entrance_spacing]
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app", "backend")
+sys.path.insert(0, BACKEND_DIR)
+
+from gridsearch import routing_costs  # noqa: E402
+from hierarchy import CLUSTER_SIZE, ENTRANCE_SPACING, MAX_EXCESS, build_abstraction, measure_excess  # noqa: E402
+
+VALIDATION_PAIRS = 50
+
+cluster_size = int(sys.argv[1]) if len(sys.argv) > 1 else CLUSTER_SIZE
+spacing = int(sys.argv[2]) if len(sys.argv) > 2 else ENTRANCE_SPACING
+
+grid = routing_costs(np.load(os.path.join(BACKEND_DIR, "final_grid.npy")))
+out_path = os.path.join(BACKEND_DIR, "final_grid_hpa.npz")
+
+while True:
+    print(f"Building abstraction (cluster {cluster_size}, entrance every {spacing} cells)...")
+    t0 = time.time()
+    abstraction = build_abstraction(grid, cluster_size, spacing)
+    print(f"  {abstraction.n_nodes} nodes, {abstraction.adj_indices.shape[0]} edges in {time.time() - t0:.1f}s")
+
+    print(f"Validating against exact full-grid Dijkstra on {VALIDATION_PAIRS} pairs...")
+    max_excess, mean_excess = measure_excess(abstraction, grid, n_pairs=VALIDATION_PAIRS)
+    print(f"  cost excess: max {max_excess:+.1%}, mean {mean_excess:+.1%}")
+    if max_excess <= MAX_EXCESS:
+        break
+    print(f"  rejected: max excess above {MAX_EXCESS:.0%}")
+    if spacing == 1:
+        if os.path.exists(out_path):
+            os.remove(out_path)
+        sys.exit("No abstraction within tolerance; removed any previous graph.")
+    spacing = max(1, spacing // 2)
+
+abstraction.save(out_path)
+print("Saved", out_path)
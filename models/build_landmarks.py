@@ -0,0 +1,50 @@
+"""
+Build ALT landmark tables for the routing backend.
+
+Runs forward and reverse full-grid Dijkstra from LANDMARK_COUNT landmarks chosen by
+farthest-point selection on app/backend/final_grid.npy (uint16 view, as routed) and writes
+app/backend/final_grid_alt.npz plus the memory-mapped final_grid_alt_{fwd,rev}.npy.
+Afterwards it reports expanded nodes with and without the landmark heuristic on the
+same seeded endpoints. Rerun after prepare_rasters.py regenerates the grid.
+
+Usage: python build_landmarks.py [landmark_count]
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app", "backend")
+sys.path.insert(0, BACKEND_DIR)
+
+from gridsearch import a_star_flat, routing_costs  # noqa: E402
+from landmarks import LANDMARK_COUNT, build_landmarks, load_landmarks  # noqa: E402
+
+CORRIDOR_WIDTH = 40      # same corridor as plan.py
+SAMPLE_PAIRS = 20
+
+count = int(sys.argv[1]) if len(sys.argv) > 1 else LANDMARK_COUNT
+grid = routing_costs(np.load(os.path.join(BACKEND_DIR, "final_grid.npy")))
+prefix = os.path.join(BACKEND_DIR, "final_grid_alt")
+
+print(f"Building {count} landmarks...")
+t0 = time.time()
+tables = build_landmarks(grid, count)
+tables.save(prefix)
+print(f"  done in {time.time() - t0:.1f}s, {tables.nbytes / 1e6:.0f} MB of tables, saved {prefix}*")
+
+tables = load_landmarks(prefix, grid)
+rng = np.random.default_rng(0)
+rows, cols = grid.shape
+plain, alt = [], []
+for _ in range(SAMPLE_PAIRS):
+    s = (int(rng.integers(rows)), int(rng.integers(cols)))
+    t = (int(rng.integers(rows)), int(rng.integers(cols)))
+    st_plain, st_alt = {}, {}
+    a_star_flat(grid, s, t, corridor_width=CORRIDOR_WIDTH, stats=st_plain)
+    a_star_flat(grid, s, t, corridor_width=CORRIDOR_WIDTH, stats=st_alt, landmarks=tables)
+    plain.append(st_plain["expanded"])
+    alt.append(st_alt["expanded"])
+print(f"Expanded nodes over {SAMPLE_PAIRS} pairs: Manhattan {int(np.mean(plain))} avg, "
+      f"ALT {int(np.mean(alt))} avg ({np.sum(alt) / np.sum(plain):.0%} of Manhattan)")
@@ -0,0 +1,51 @@
+"""
+Build accumulated-cost surfaces for fixed route targets (substations).
+
+Each lon,lat argument is snapped to its grid cell and one reverse full-grid Dijkstra writes
+app/backend/final_grid_surfaces/<row>_<col>{.npz,_cost.npy,_dir.npy} (see surfaces.py);
+plan.py then answers every segment ending on that cell by walking the direction raster.
+Afterwards it compares the walk with a corridor A* search from seeded start cells.
+Rerun after prepare_rasters.py regenerates the grid (stale surfaces are ignored).
+
+Usage: python build_surfaces.py lon,lat [lon,lat ...]
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app", "backend")
+sys.path.insert(0, BACKEND_DIR)
+
+from gridsearch import a_star_flat  # noqa: E402
+from plan import CORRIDOR_WIDTH, final_grid, register_surface  # noqa: E402
+
+SAMPLE_STARTS = 10
+
+if len(sys.argv) < 2:
+    sys.exit(__doc__)
+
+rng = np.random.default_rng(0)
+rows, cols = final_grid.shape
+for arg in sys.argv[1:]:
+    lon, lat = (float(v) for v in arg.split(","))
+    t0 = time.time()
+    surface = register_surface({"x": lon, "y": lat})
+    print(f"Surface {surface.target} ({lon}, {lat}): {time.time() - t0:.1f}s, "
+          f"{surface.nbytes / 1e6:.1f} MB ({surface.cost.dtype} cost + uint8 direction)")
+
+    surface.route_from(surface.target)  # compile the walk before timing it
+    walk, search, worse = [], [], 0
+    for _ in range(SAMPLE_STARTS):
+        s = (int(rng.integers(rows)), int(rng.integers(cols)))
+        t = time.perf_counter()
+        path = surface.route_from(s)
+        walk.append(time.perf_counter() - t)
+        t = time.perf_counter()
+        found = a_star_flat(final_grid, s, surface.target, corridor_width=CORRIDOR_WIDTH)
+        search.append(time.perf_counter() - t)
+        if path and found:
+            worse += sum(int(final_grid[c]) for c in found[1:]) > surface.cost_from(s)
+    print(f"  {SAMPLE_STARTS} starts: walk {np.mean(walk) * 1e3:.2f} ms avg, corridor A* "
+          f"{np.mean(search) * 1e3:.1f} ms avg; corridor path dearer in {worse} cases")
@@ -0,0 +1,37 @@
+"""
+Ingest CORINE Land Cover 2018 polygons for Czechia into the backend's local store.
+
+Fetches every page from the EEA ArcGIS server (corine.CORINE_URL), or imports a GeoJSON
+FeatureCollection from disk, and writes app/backend/corine_clc2018.gpkg (or the path in
+CORINE_STORE), which /api/map-data then serves without network access. Rerun when the
+upstream dataset changes; a running server picks the new file up on its next request.
+
+Usage: python ingest_corine.py [features.geojson]
+e.g.   python ingest_corine.py ../app/backend/fixtures/corine_sample.geojson
+"""
+import os
+import sys
+import time
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app", "backend")
+sys.path.insert(0, BACKEND_DIR)
+
+from corine import STORE_PATH, fetch_features, load_store, read_feature_file, write_store  # noqa: E402
+
+t0 = time.time()
+if len(sys.argv) > 1:
+    print(f"Importing {sys.argv[1]}...")
+    features = read_feature_file(sys.argv[1])
+else:
+    print("Fetching CORINE pages from the EEA server...")
+    features = fetch_features()
+print(f"  {len(features)} features in {time.time() - t0:.1f}s")
+
+t0 = time.time()
+count = write_store(features, STORE_PATH)
+size = os.path.getsize(STORE_PATH)
+print(f"  wrote {count} features to {STORE_PATH} ({size / 1e6:.1f} MB) in {time.time() - t0:.1f}s")
+
+t0 = time.time()
+store = load_store(STORE_PATH)
+print(f"  store loads in {time.time() - t0:.2f}s, {len(store.geojson) / 1e6:.1f} MB of GeoJSON served per request")
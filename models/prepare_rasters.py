@@ -1,125 +1,421 @@
-from rasterio.transform import from_bounds
-from rasterio.features import rasterize
-from shapely.geometry import box
-import geopandas as gpd
+"""
+Build the routing rasters: app/backend/final_grid.npy, transform.pkl and final_grid_pyramid/.
+
+The build runs in two steps:
+1. Every enabled layer is rasterised once per grid (final_grid and the pyramid's finest level)
+   into models/raster_cache/. The cache holds what the layer *is*, not what it costs: CORINE as
+   its Code_18 per cell (UNPARSED_CLASS where the code is not a number), Natura 2000 and
+   ZABAGED as 0/1 coverage, temperature / moisture as reprojected values. An entry is keyed on
+   the hash of the layer's source files, its read settings and the grid spec (shape +
+   transform), so it is rebuilt only when one of those changes. Missing entries are built in
+   parallel processes, one per layer. Each process reads its source once (only the part inside
+   the grid bounds) and rasterises it tile by tile (--tile) into a memory-mapped file.
+2. Every layer's score table (or score function) is applied to its cached raster by lookup and
+   the layers are summed. Natura and ZABAGED only count on cells covered by CORINE; this replaces
+   the old gpd.overlay with the CORINE polygons. A score tweak only reruns this step.
+   The scored layers of final_grid are also stored as one stack, final_grid_layers.npy + .json
+   (layer names, digest of the routing grid they add up to), for query-time layer weights
+   (app/backend/costlayers.py).
+   The pyramid is keyed like the layer rasters: on the cache entries of its layers (so on
+   their source digests), their score settings and the pyramid layout. An unchanged key skips
+   the 8000 x 8000 build; any score tweak still rebuilds it, since it changes every level.
+
+Usage: python prepare_rasters.py [--layers corine,natura,...] [--workers N] [--tile N] [--force]
+                                 [--no-pyramid]
+"""
+import argparse
+import glob
+import hashlib
+import inspect
+import json
 import os
-import matplotlib.pyplot as plt
 import pickle
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
 import numpy as np
-import rasterio
-from rasterio.enums import Resampling as Rsp
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app", "backend")
+sys.path.insert(0, BACKEND_DIR)
+
+from gridsearch import grid_digest, routing_costs  # noqa: E402
+from pyramid import FACTOR, TILE_SIZE, TOP_SIZE, build_pyramid, load_pyramid  # noqa: E402
 
 TARGET_CRS = "EPSG:5514"
 GRID_SHAPE = (1000, 1000)  # rows, cols
+PYRAMID_SHAPE = (8000, 8000)  # finest level of final_grid_pyramid/ (~37 m cells)
+PYRAMID_TILE = 2048        # the pyramid's layers are rasterised in windows of this many cells per side
+EDGE_BUFFER = 10000        # metres cropped off each side of the CORINE extent (edge effects)
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "raster_cache")
+CACHE_VERSION = 2          # bump when the rasterisation itself changes
+WORKERS = 3                # layer processes
+
+CORINE_PATH = "../backend/corine.shp"
+NATURA_PATH = "/home/yhusieva/sgoinfre/GreenHack/models/data/NATURA2000/eea_v_3035_100_k_natura2000_p_2023_v01_r00/SHP_files/Natura2000_end2023_epsg3035.shp"
+ZABAGED_PATH = "/home/yhusieva/sgoinfre/GreenHack/models/data/ZABAGED/ZABAGED-5514-gpkg-20250407/ZABAGED_RESULTS.gpkg"
+TEMPERATURE_PATH = "/sgoinfre/yhusieva/GreenHack/models/data/TEMPERATURE/192656/c_gls_LST_202505011400_GLOBE_GEO_V2.1.1__esko_LST.tif"  # pick one LST file
+MOISTURE_PATH = "/sgoinfre/yhusieva/GreenHack/models/data/MOISTURE/Results/c_gls_SSM1km_202505080000_CEURO_S1CSAR_V1.2.1__esko_ssm.tif"  # pick one .tif file
+
+CORINE_SCORES = {
+    111: 1,   # Continuous Urban
+    112: 2,   # Discontinuous Urban
+    121: 1,   # Industrial
+    211: 5,   # Arable Land – more suitable
+    231: 8,   # Pastures – better than forests
+    311: 30,  # Broadleaf Forest
+    312: 35,  # Coniferous Forest – slightly harder
+    313: 32,  # Mixed Forest
+    321: 12,  # Natural Grasslands
+    322: 10,  # Moors and Heathland – not awful
+    324: 18,  # Transitional Woodland
+    511: 50,  # Water
+    512: 45,  # Water bodies
+    523: 20,  # Sea and ocean – less relevant inland but still bad
+}
+CORINE_DEFAULT = 15  # Reasonable default for other land types
+# The shipped final_grid was built by mapping the Code_18 *strings* through CORINE_SCORES'
+# int keys, which matched nothing: every CORINE cell scored CORINE_DEFAULT. False keeps that
+# grid; True applies the table (forest 30-35, urban 1, ...), which changes every route, so
+# regenerate and check the grid when switching it on.
+CORINE_APPLY_SCORES = False
+
+
+def temperature_score(kelvin):
+    celsius = kelvin - 273.15
+    # Normalise (adjust these thresholds based on your context)
+    normalised = np.clip((celsius - 10) / 30, 0, 1)  # scale between 0 (cool) and 1 (hot)
+    return normalised * 20  # Scale penalty up to max 20
+
+
+def moisture_score(percent):
+    # Normalise: scale 0–1 (assuming 0–100 is possible range)
+    return np.clip(percent / 100.0, 0, 1) * 15  # moisture penalty
+
+
+# kind: "classes" (integer column burnt in, scored by table), "coverage" (0/1, one score),
+# "raster" (reprojected values, scored by a function). clip: only count on CORINE cells.
+LAYERS = {
+    "corine": {"kind": "classes", "path": CORINE_PATH, "column": "Code_18",
+               "scores": CORINE_SCORES, "default": CORINE_DEFAULT, "apply_scores": CORINE_APPLY_SCORES,
+               "enabled": True},
+    "natura": {"kind": "coverage", "path": NATURA_PATH, "score": 50,  # Massive penalty to avoid
+               "clip": True, "enabled": True},
+    "zabaged": {"kind": "coverage", "path": ZABAGED_PATH, "layer": "ElektrickeVedeni",
+                "score": -20,  # Reduce cost to favour these cells
+                "clip": True, "enabled": True},
+    "temperature": {"kind": "raster", "path": TEMPERATURE_PATH, "score": temperature_score, "enabled": False},
+    "moisture": {"kind": "raster", "path": MOISTURE_PATH, "score": moisture_score, "enabled": False},
+}
+READ_SETTINGS = ("kind", "path", "column", "layer")  # spec fields that change the cached raster
+# spec fields that change the layer's costs
+SCORE_SETTINGS = ("scores", "score", "default", "apply_scores", "clip")
+UNPARSED_CLASS = np.iinfo(np.uint16).max  # class of features whose code is not a number
+
+
+# ------------- cache keys -------------
+def source_digest(path):
+    """
+    sha256 over path and its sidecar files (same stem: .dbf, .shx, .prj, ...). Digests are
+    remembered in CACHE_DIR/sources.json per (size, mtime), so unchanged sources are not re-read.
+    """
+    memo_path = os.path.join(CACHE_DIR, "sources.json")
+    try:
+        with open(memo_path) as fh:
+            memo = json.load(fh)
+    except (OSError, ValueError):
+        memo = {}
+    files = sorted(glob.glob(glob.escape(os.path.splitext(path)[0]) + ".*")) or [path]
+    stamp = [[f, os.path.getsize(f), os.stat(f).st_mtime_ns] for f in files]
+    entry = memo.get(os.path.abspath(path))
+    if entry and entry["stamp"] == stamp:
+        return entry["digest"]
+    h = hashlib.sha256()
+    for f in files:
+        h.update(os.path.basename(f).encode())
+        with open(f, "rb") as fh:
+            for block in iter(lambda: fh.read(1 << 20), b""):
+                h.update(block)
+    memo[os.path.abspath(path)] = {"stamp": stamp, "digest": h.hexdigest()}
+    with open(memo_path + ".tmp", "w") as fh:
+        json.dump(memo, fh, indent=1)
+    os.replace(memo_path + ".tmp", memo_path)
+    return h.hexdigest()
 
-cz_border = gpd.read_file("../backend/corine.shp")
-cz_border = cz_border.to_crs(TARGET_CRS)
-
-# def process_temperature_raster(transform):
-#     path = "/sgoinfre/yhusieva/GreenHack/models/data/TEMPERATURE/192656/c_gls_LST_202505011400_GLOBE_GEO_V2.1.1__esko_LST.tif"  # pick one LST file
-#     array = load_raster_as_array(path, transform, GRID_SHAPE, TARGET_CRS)
-#     # Convert Kelvin to Celsius
-#     array = array - 273.15
-#     # Normalise (adjust these thresholds based on your context)
-#     normalised = np.clip((array - 10) / 30, 0, 1)  # scale between 0 (cool) and 1 (hot)
-#     return normalised * 20  # Scale penalty up to max 20
-
-# def process_moisture_raster(transform):
-#     path = "/sgoinfre/yhusieva/GreenHack/models/data/MOISTURE/Results/c_gls_SSM1km_202505080000_CEURO_S1CSAR_V1.2.1__esko_ssm.tif"  # pick one .tif file
-#     array = load_raster_as_array(path, transform, GRID_SHAPE, TARGET_CRS)
-#     # Normalise: scale 0–1 (assuming 0–100 is possible range)
-#     normalised = np.clip(array / 100.0, 0, 1)
-#     return normalised * 15  # moisture penalty
-
-def get_transform_and_bounds():
-    corine = gpd.read_file("../backend/corine.shp")
-    corine = corine.to_crs(TARGET_CRS)
-    bounds = corine.total_bounds  # [minx, miny, maxx, maxy]
-    
+
+def cache_path(name, grid):
+    """Cache file of layer name on grid: name-grid-<key>.npy."""
+    spec = LAYERS[name]
+    settings = {k: spec[k] for k in READ_SETTINGS if k in spec}
+    payload = json.dumps([CACHE_VERSION, TARGET_CRS, settings, source_digest(spec["path"]),
+                          grid["shape"], grid["transform"]], sort_keys=True)
+    key = hashlib.sha256(payload.encode()).hexdigest()[:16]
+    return os.path.join(CACHE_DIR, f"{name}-{grid['name']}-{key}.npy")
+
+
+def score_settings(spec):
+    """JSON-able score settings of a layer (score functions by a hash of their source)."""
+    settings = {}
+    for k in SCORE_SETTINGS:
+        if k not in spec:
+            continue
+        value = spec[k]
+        if callable(value):
+            value = hashlib.sha256(inspect.getsource(value).encode()).hexdigest()[:16]
+        elif isinstance(value, dict):
+            value = sorted(value.items())
+        settings[k] = value
+    return settings
+
+
+def pyramid_key(names, paths, grid):
+    """Key of the pyramid built from layers names on grid (their cache entries in paths)."""
+    payload = json.dumps([CACHE_VERSION, FACTOR, TOP_SIZE, TILE_SIZE, grid["shape"], grid["transform"],
+                          [[n, os.path.basename(paths[n, grid["name"]]), score_settings(LAYERS[n])]
+                           for n in names]], sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()[:16]
+
+
+# ------------- grid specs -------------
+def grid_bounds():
+    """CORINE extent in TARGET_CRS minus EDGE_BUFFER per side, remembered per CORINE source digest."""
+    import geopandas as gpd
+
+    path = os.path.join(CACHE_DIR, f"bounds-{source_digest(CORINE_PATH)[:16]}.json")
+    if os.path.exists(path):
+        with open(path) as fh:
+            return tuple(json.load(fh))
+    minx, miny, maxx, maxy = gpd.read_file(CORINE_PATH).to_crs(TARGET_CRS).total_bounds
     # Shrink slightly to crop any weird edge effects
-    minx, miny, maxx, maxy = bounds
-    buffer = 10000  # 10km
-    minx += buffer
-    miny += buffer
-    maxx -= buffer
-    maxy -= buffer
-
-    transform = from_bounds(minx, miny, maxx, maxy, GRID_SHAPE[1], GRID_SHAPE[0])
-    bounds_geom = box(minx, miny, maxx, maxy)
-    return transform, bounds_geom
-
-def rasterize_gdf(gdf, value_column, transform):
-    out_shape = GRID_SHAPE
-    shapes = ((geom, val) for geom, val in zip(gdf.geometry, gdf[value_column]))
-    return rasterize(shapes, out_shape=out_shape, transform=transform, fill=0, dtype='float32')
-
-def process_corine(transform, bounds_geom):
-    corine = gpd.read_file("../backend/corine.shp")
-    corine = corine.to_crs(TARGET_CRS)
-    corine = corine[corine.geometry.intersects(bounds_geom)]
-    
-    corine["score"] = corine["Code_18"].map({
-        111: 1,   # Continuous Urban
-        112: 2,   # Discontinuous Urban
-        121: 1,   # Industrial
-        211: 5,   # Arable Land – more suitable
-        231: 8,   # Pastures – better than forests
-        311: 30,  # Broadleaf Forest
-        312: 35,  # Coniferous Forest – slightly harder
-        313: 32,  # Mixed Forest
-        321: 12,  # Natural Grasslands
-        322: 10,  # Moors and Heathland – not awful
-        324: 18,  # Transitional Woodland
-        511: 50,  # Water
-        512: 45,  # Water bodies
-        523: 20,  # Sea and ocean – less relevant inland but still bad
-    }).fillna(15)  # Reasonable default for other land types
-
-    return rasterize_gdf(corine, "score", transform)
-
-def process_natura(transform, bounds_geom):
-    natura = gpd.read_file("/home/yhusieva/sgoinfre/GreenHack/models/data/NATURA2000/eea_v_3035_100_k_natura2000_p_2023_v01_r00/SHP_files/Natura2000_end2023_epsg3035.shp")
-    natura = natura.to_crs(TARGET_CRS)
-    natura = natura[natura.geometry.intersects(bounds_geom)]
-    natura = gpd.overlay(natura, cz_border, how="intersection")
-
-    natura["score"] = 50  # Massive penalty to avoid
-    return rasterize_gdf(natura, "score", transform)
-
-def process_zabaged(transform, bounds_geom):
-    zabaged_path = "/home/yhusieva/sgoinfre/GreenHack/models/data/ZABAGED/ZABAGED-5514-gpkg-20250407/ZABAGED_RESULTS.gpkg"
-    layer_name = "ElektrickeVedeni"  # ⚠️ try this one first
-    zabaged = gpd.read_file(zabaged_path, layer=layer_name)
-    zabaged = zabaged.to_crs(TARGET_CRS)
-    zabaged = zabaged[zabaged.geometry.intersects(bounds_geom)]
-    zabaged = gpd.overlay(zabaged, cz_border, how="intersection")
-
-    zabaged["score"] = -20  # Reduce cost to favour these cells
-    return rasterize_gdf(zabaged, "score", transform)
-
-transform, bounds_geom = get_transform_and_bounds()
-print("Processing CORINE...")
-corine_raster = process_corine(transform, bounds_geom)
-print("Processing NATURA2000...")
-natura_raster = process_natura(transform, bounds_geom)
-print("Processing ZABAGED...")
-zabaged_raster = process_zabaged(transform, bounds_geom)
-# print("Processing Temperature...")
-# temp_raster = process_temperature_raster(transform)
-# print(f"Temperature (°C) – min: {temp_raster.min() + 273.15}, max: {temp_raster.max() + 273.15}")
-# print("Processing Moisture...")
-# moisture_raster = process_moisture_raster(transform)
-# print(f"Moisture (%) – min: {moisture_raster.min() / 15 * 100}, max: {moisture_raster.max() / 15 * 100}")
-final_grid = (
-    corine_raster +
-    natura_raster +
-    zabaged_raster
-    # temp_raster +
-    # moisture_raster
-)
-np.save("/home/yhusieva/sgoinfre/GreenHack/app/backend/final_grid.npy", final_grid)
-with open("/home/yhusieva/sgoinfre/GreenHack/app/backend/transform.pkl", "wb") as f:
-    pickle.dump(transform, f)
+    bounds = (minx + EDGE_BUFFER, miny + EDGE_BUFFER, maxx - EDGE_BUFFER, maxy - EDGE_BUFFER)
+    with open(path, "w") as fh:
+        json.dump([float(v) for v in bounds], fh)
+    return bounds
+
+
+def grid_spec(name, shape, bounds, tile=None):
+    from rasterio.transform import from_bounds
+
+    transform = from_bounds(*bounds, shape[1], shape[0])
+    return {"name": name, "shape": list(shape), "transform": list(transform)[:6], "tile": tile}
+
+
+# ------------- step 1: layer rasters (worker processes) -------------
+def read_layer(spec, bounds):
+    """The layer's features inside bounds, in TARGET_CRS (vector layers), or its path (rasters)."""
+    if spec["kind"] == "raster":
+        return spec["path"]
+    import geopandas as gpd
+    import pandas as pd
+    from shapely.geometry import box
+
+    area = gpd.GeoSeries([box(*bounds)], crs=TARGET_CRS)
+    gdf = gpd.read_file(spec["path"], layer=spec.get("layer"), bbox=area).to_crs(TARGET_CRS)
+    if spec["kind"] == "classes":
+        # 0 is "no feature": a code that does not parse still marks a feature (scored as default)
+        codes = pd.to_numeric(gdf[spec["column"]], errors="coerce")
+        codes = codes.where((codes > 0) & (codes < UNPARSED_CLASS), UNPARSED_CLASS)
+        gdf["value"] = codes.astype(np.uint16)
+    else:
+        gdf["value"] = np.uint8(1)
+    return gdf[["value", "geometry"]]
+
+
+def layer_dtype(spec):
+    return {"classes": np.uint16, "coverage": np.uint8, "raster": np.float32}[spec["kind"]]
+
+
+def burn(spec, data, transform, shape):
+    """Raster of one window (transform = its top-left corner) of the layer."""
+    from rasterio.features import rasterize
+
+    if spec["kind"] == "raster":
+        import rasterio
+        from rasterio.warp import Resampling, reproject
+
+        out = np.full(shape, np.nan, dtype=np.float32)
+        with rasterio.open(data) as src:
+            reproject(rasterio.band(src, 1), out, dst_transform=transform, dst_crs=TARGET_CRS,
+                      dst_nodata=np.nan, resampling=Resampling.bilinear)
+        return out
+    from shapely.geometry import box
+
+    x0, y0 = transform * (0, 0)
+    x1, y1 = transform * (shape[1], shape[0])
+    part = data.iloc[data.sindex.query(box(min(x0, x1), min(y0, y1), max(x0, x1), max(y0, y1)))]
+    if not len(part):
+        return np.zeros(shape, dtype=layer_dtype(spec))
+    return rasterize(zip(part.geometry, part["value"]), out_shape=shape, transform=transform,
+                     fill=0, dtype=np.dtype(layer_dtype(spec)).name)
+
+
+def build_layer(name, spec, bounds, targets):
+    """
+    Worker: read layer name once and write its raster for every (grid, cache path) in targets,
+    window by window (grid["tile"]) into a memory-mapped file that replaces the cache entry.
+    Older entries of the same layer and grid are removed. Returns (name, seconds).
+    """
+    from rasterio.transform import Affine
+
+    t0 = time.time()
+    data = read_layer(spec, bounds)
+    for grid, path in targets:
+        rows, cols = grid["shape"]
+        tile = grid["tile"] or max(rows, cols)
+        transform = Affine(*grid["transform"])
+        tmp = f"{path}.{os.getpid()}.tmp"
+        out = np.lib.format.open_memmap(tmp, mode="w+", dtype=layer_dtype(spec), shape=(rows, cols))
+        for r_lo in range(0, rows, tile):
+            for c_lo in range(0, cols, tile):
+                r_hi, c_hi = min(rows, r_lo + tile), min(cols, c_lo + tile)
+                out[r_lo:r_hi, c_lo:c_hi] = burn(spec, data, transform * Affine.translation(c_lo, r_lo),
+                                                 (r_hi - r_lo, c_hi - c_lo))
+        out.flush()
+        del out
+        os.replace(tmp, path)
+        for old in glob.glob(os.path.join(CACHE_DIR, f"{name}-{grid['name']}-*.npy")):
+            if old != path:
+                os.remove(old)
+    return name, time.time() - t0
+
+
+# ------------- step 2: scores -------------
+def score_table(spec):
+    """
+    Lookup array class -> score of a "classes" layer: class 0 = no feature = 0, codes missing
+    from the table (and UNPARSED_CLASS) = default; the table only with "apply_scores".
+    """
+    lut = np.full(np.iinfo(np.uint16).max + 1, spec["default"], dtype=np.float32)
+    if spec.get("apply_scores", True):
+        for code, score in spec["scores"].items():
+            lut[code] = score
+    lut[UNPARSED_CLASS] = spec["default"]
+    lut[0] = 0
+    return lut
+
+
+def scored_layers(rasters, window=(slice(None), slice(None))):
+    """[(name, float32 scores)] of the cached layer rasters {name: array} inside window."""
+    covered = rasters["corine"][window] > 0 if "corine" in rasters else None
+    scored_all = []
+    for name, values in rasters.items():
+        spec = LAYERS[name]
+        values = np.asarray(values[window])
+        if spec["kind"] == "classes":
+            scored = score_table(spec)[values]
+        elif spec["kind"] == "coverage":
+            scored = values.astype(np.float32) * np.float32(spec["score"])
+        else:
+            scored = np.nan_to_num(spec["score"](values), nan=0).astype(np.float32)
+        if spec.get("clip") and covered is not None:
+            scored = np.where(covered, scored, np.float32(0))
+        scored_all.append((name, scored))
+    return scored_all
+
+
+def sum_layers(layers):
+    """Sum (float32, in layer order) of scored_layers() output."""
+    total = None
+    for _, scored in layers:
+        total = scored if total is None else total + scored
+    return total
+
+
+def combine(rasters, window=(slice(None), slice(None))):
+    """Summed scores (float32) of the cached layer rasters {name: array} inside window."""
+    return sum_layers(scored_layers(rasters, window))
+
+
+def save_layer_stack(layers, final_grid, prefix):
+    """
+    Write the scored layers as one (layers, rows, cols) array, int16 when every score is a
+    whole number in range, else float32, plus the json with names and routing grid digest.
+    """
+    stack = np.stack([scored for _, scored in layers])
+    info = np.iinfo(np.int16)
+    if np.array_equal(stack, np.rint(stack)) and stack.min() >= info.min and stack.max() <= info.max:
+        stack = stack.astype(np.int16)
+    np.save(prefix + ".npy", stack)
+    with open(prefix + ".json", "w") as fh:
+        json.dump({"layers": [name for name, _ in layers],
+                   "digest": grid_digest(routing_costs(final_grid))}, fh, indent=1)
+    return stack
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--layers", help="comma-separated layers (default: the enabled ones in LAYERS)")
+    parser.add_argument("--workers", type=int, default=WORKERS, help="layer processes (1 = serial)")
+    parser.add_argument("--tile", type=int, help="rasterise in windows of this many cells (all grids)")
+    parser.add_argument("--force", action="store_true", help="rebuild the layer rasters even if cached")
+    parser.add_argument("--no-pyramid", action="store_true", help="only final_grid.npy, no final_grid_pyramid/")
+    args = parser.parse_args()
+
+    names = args.layers.split(",") if args.layers else [n for n, spec in LAYERS.items() if spec["enabled"]]
+    unknown = [n for n in names if n not in LAYERS]
+    if unknown:
+        parser.error(f"unknown layers {unknown} (expected some of {list(LAYERS)})")
+    os.makedirs(CACHE_DIR, exist_ok=True)
+
+    t0 = time.time()
+    bounds = grid_bounds()
+    grids = [grid_spec("final", GRID_SHAPE, bounds, args.tile)]
+    if not args.no_pyramid:
+        grids.append(grid_spec("pyramid", PYRAMID_SHAPE, bounds, args.tile or PYRAMID_TILE))
+    paths = {(n, g["name"]): cache_path(n, g) for n in names for g in grids}
+    todo = {}
+    for n in names:
+        for g in grids:
+            if args.force or not os.path.exists(paths[n, g["name"]]):
+                todo.setdefault(n, []).append((g, paths[n, g["name"]]))
+    for n in names:
+        if n not in todo:
+            print(f"{n}: cached")
+
+    if todo:
+        jobs = [(n, LAYERS[n], bounds, targets) for n, targets in todo.items()]
+        if args.workers > 1 and len(jobs) > 1:
+            with ProcessPoolExecutor(min(args.workers, len(jobs))) as pool:
+                done = [pool.submit(build_layer, *job) for job in jobs]
+                results = [f.result() for f in done]
+        else:
+            results = [build_layer(*job) for job in jobs]
+        for n, seconds in results:
+            print(f"{n}: rasterised in {seconds:.1f}s")
+
+    def rasters(grid):
+        return {n: np.load(paths[n, grid["name"]], mmap_mode="r") for n in names}
+
+    final = grids[0]
+    layers = scored_layers(rasters(final))
+    final_grid = sum_layers(layers)
+    np.save(os.path.join(BACKEND_DIR, "final_grid.npy"), final_grid)
+    stack = save_layer_stack(layers, final_grid, os.path.join(BACKEND_DIR, "final_grid_layers"))
+    print(f"final_grid_layers.npy {stack.shape} {stack.dtype}")
+    with open(os.path.join(BACKEND_DIR, "transform.pkl"), "wb") as f:
+        from rasterio.transform import Affine
+        pickle.dump(Affine(*final["transform"]), f)
+    print(f"final_grid.npy {final_grid.shape}, costs {final_grid.min():g}..{final_grid.max():g}")
+
+    if not args.no_pyramid:
+        fine = grids[1]
+        directory = os.path.join(BACKEND_DIR, "final_grid_pyramid")
+        key = pyramid_key(names, paths, fine)
+        pyramid = load_pyramid(directory)
+        if pyramid is not None and pyramid.key == key and not args.force:
+            print("pyramid: cached")
+        else:
+            layers = rasters(fine)
+            # same conversion as plan.py's routing grid (negative sums clamp to 0)
+            pyramid = build_pyramid(directory, fine["shape"], fine["transform"],
+                                    lambda r_lo, r_hi, c_lo, c_hi: routing_costs(combine(
+                                        layers, (slice(r_lo, r_hi), slice(c_lo, c_hi)))),
+                                    progress=lambda k, done, total: print(
+                                        f"  pyramid level {k}: {done}/{total} tile rows", end="\r"),
+                                    key=key)
+            print("\npyramid levels:", [level.shape for level in pyramid.levels])
+    print(f"done in {time.time() - t0:.1f}s")
+
 
 # def show_final_grid(grid, transform, cz_border):
 #     extent = (
@@ -138,4 +434,7 @@ with open("/home/yhusieva/sgoinfre/GreenHack/app/backend/transform.pkl", "wb") a
 #     plt.tight_layout()
 #     plt.show()
 
-# show_final_grid(final_grid, transform, cz_border)
\ No newline at end of file
+# show_final_grid(final_grid, transform, cz_border)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,6 @@
+"""Backend tests import the app modules the way the app does (from app/backend)."""
+import os
+import sys
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app", "backend")
+sys.path.insert(0, BACKEND_DIR)
@@ -0,0 +1,29 @@
+"""Request validation of the Flask endpoints (main.py): bad input is a 400, not a 500."""
+import pytest
+
+import main
+import plan
+
+POINTS = [{"x": 14.42, "y": 50.08}, {"x": 14.43, "y": 50.09}]
+
+
+@pytest.fixture
+def client():
+    return main.app.test_client()
+
+
+needs_layers = pytest.mark.skipif(plan.layer_stack is None, reason="final_grid_layers.npy not built")
+
+
+@pytest.mark.parametrize("query,body,headers", [
+    ("?format=nope", {}, {}),
+    ("", {"format": "nope"}, {}),
+    ("", {"backend": "nope"}, {}),
+    ("", {"backend": "nope", "async": True}, {}),
+    pytest.param("", {"weights": {"nope": 2}}, {}, marks=needs_layers),
+    pytest.param("", {"weights": {"natura": -1}, "async": True}, {}, marks=needs_layers),
+])
+def test_plan_route_rejects_bad_options(client, query, body, headers):
+    response = client.post(f"/api/plan-route{query}", json={"points": POINTS, **body}, headers=headers)
+    assert response.status_code == 400, response.get_json()
+    assert "error" in response.get_json()
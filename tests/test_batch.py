@@ -0,0 +1,73 @@
+"""Batch planning (plan.plan_routes): one tree per origin gives each pair's single-pair result."""
+import numpy as np
+import pytest
+
+import plan
+from gridsearch import dijkstra_flat, settled_costs
+from hierarchy import exact_cost
+
+SHAPE = (40, 50)
+
+
+@pytest.fixture
+def grid(monkeypatch):
+    rng = np.random.default_rng(5)
+    grid = rng.integers(1, 60, size=SHAPE).astype(np.uint16)
+    grid[rng.random(SHAPE) < 0.15] = 0
+    monkeypatch.setattr(plan, "final_grid", grid)
+    return grid
+
+
+def cells(rng, n):
+    return sorted({int(v) for v in rng.integers(0, SHAPE[0] * SHAPE[1], size=n)})
+
+
+def check_path(grid, path, origin, target, cost):
+    cols = SHAPE[1]
+    assert tuple(path[0]) == divmod(origin, cols) and tuple(path[-1]) == divmod(target, cols)
+    assert (np.abs(np.diff(path, axis=0)).sum(axis=1) == 1).all()
+    assert sum(int(grid[r, c]) for r, c in path[1:]) == cost
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_tree_matches_single_pair_search(grid, seed):
+    rng = np.random.default_rng(seed)
+    origin = int(rng.integers(grid.size))
+    targets = np.array(cells(rng, 8), dtype=np.int64)
+    costs, paths, _ = plan._origin_tree((origin, targets, None))
+    for t, c, path in zip(targets.tolist(), costs, paths):
+        assert c == exact_cost(grid, divmod(origin, SHAPE[1]), divmod(t, SHAPE[1]))
+        check_path(grid, path, origin, t, c)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_boxed_tree_matches_single_pair_search(grid, seed):
+    rng = np.random.default_rng(seed)
+    box = (5, 30, 10, 40)
+    inside = [r * SHAPE[1] + c for r in range(box[0], box[1]) for c in range(box[2], box[3])]
+    origin, *rest = (int(v) for v in rng.choice(inside, size=7, replace=False))
+    targets = np.array(sorted(rest), dtype=np.int64)
+    costs, paths, _ = plan._origin_tree((origin, targets, box))
+    for t, c, path in zip(targets.tolist(), costs, paths):
+        ws, gen = dijkstra_flat(grid, [origin], box=box, targets=[t])
+        assert c == int(settled_costs(ws, gen, [t])[0])
+        check_path(grid, path, origin, t, c)
+        assert all(box[0] <= r < box[1] and box[2] <= col < box[3] for r, col in path)
+
+
+def test_plan_routes_matches_single_pairs(monkeypatch):
+    # the shipped grid, a few points around Prague (as in test_api)
+    monkeypatch.setattr(plan, "USE_PARALLEL", False)
+    origins = [{"x": 14.42, "y": 50.08}, {"x": 14.43, "y": 50.09}]
+    destinations = [{"x": 14.45, "y": 50.07}, {"x": 14.40, "y": 50.10}, {"x": 14.42, "y": 50.08}]
+    stats = {}
+    costs, lengths, paths = plan.plan_routes(origins, destinations, pairs=[(0, 0), (0, 1), (1, 2)],
+                                             with_paths=True, stats=stats)
+    assert stats["origin_trees"] == 2
+    assert costs[0][2] is None and costs[1][0] is None
+    o_r, o_c = plan.snap_points(origins)
+    d_r, d_c = plan.snap_points(destinations)
+    for i, j in [(0, 0), (0, 1), (1, 2)]:
+        expected = exact_cost(plan.final_grid, (int(o_r[i]), int(o_c[i])), (int(d_r[j]), int(d_c[j])))
+        assert costs[i][j] == expected
+        assert lengths[i][j] > 0 and len(paths[i][j][0]) >= 2
@@ -0,0 +1,68 @@
+"""CORINE feature store (corine.py) built from fixtures/corine_sample.geojson, offline."""
+import json
+
+import pytest
+import requests
+
+pytest.importorskip("geopandas")
+import shapely  # noqa: E402
+
+import corine  # noqa: E402
+from fixtures.arcgis_standin import SAMPLE  # noqa: E402
+
+BBOX = (50.15, 14.43, 50.18, 14.47)  # south, west, north, east
+
+
+@pytest.fixture
+def offline(monkeypatch):
+    def refuse(*args, **kwargs):
+        raise AssertionError("the store must be served without network access")
+    monkeypatch.setattr(requests.Session, "send", refuse)
+
+
+@pytest.fixture
+def features():
+    return corine.read_feature_file(SAMPLE)
+
+
+@pytest.fixture
+def store(tmp_path, features, offline):
+    path = str(tmp_path / "corine.gpkg")
+    assert corine.write_store(features, path) == len(features)
+    return corine.load_store(path)
+
+
+def ids(body):
+    return [f["id"] for f in json.loads(body)["features"]]
+
+
+def test_reloads_every_feature(store, features):
+    assert len(store) == len(features)
+    assert ids(store.geojson) == [f["id"] for f in features]
+    assert corine.load_store(store.path) is store
+
+
+def test_bbox_query(store, features):
+    south, west, north, east = BBOX
+    box = shapely.box(west, south, east, north)
+    expected = [f["id"] for f in features if shapely.geometry.shape(f["geometry"]).intersects(box)]
+    assert 0 < len(expected) < len(features)
+    assert ids(store.query(bbox=BBOX)) == expected
+
+
+def test_zoom_query_simplifies(store):
+    full = json.loads(store.query(bbox=BBOX))["features"]
+    coarse = json.loads(store.query(bbox=BBOX, zoom=6))["features"]
+    assert [f["id"] for f in coarse] == [f["id"] for f in full]
+    assert [f["properties"] for f in coarse] == [f["properties"] for f in full]
+
+    def vertices(fs):
+        return sum(len(shapely.get_coordinates(shapely.geometry.shape(f["geometry"]))) for f in fs)
+    assert vertices(coarse) < vertices(full)
+
+
+def test_class_filter(store, features):
+    code = features[0]["properties"]["Code_18"]
+    found = json.loads(store.query(classes=corine.parse_classes(code[:2])))["features"]
+    assert found and all(f["properties"]["Code_18"].startswith(code[:2]) for f in found)
+    assert len(found) == sum(f["properties"]["Code_18"].startswith(code[:2]) for f in features)
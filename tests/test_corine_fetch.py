@@ -0,0 +1,61 @@
+"""Upstream CORINE pager (corine.iter_pages) against fixtures/arcgis_standin.py on a free port."""
+import json
+
+import pytest
+
+import corine
+from fixtures.arcgis_standin import SAMPLE, serve
+
+PAGE_SIZE = 5        # the 24 sample features -> 5 pages
+CONCURRENCY = 3
+GEOMETRY = {"rings": []}  # the stand-in ignores the clip polygon
+
+
+@pytest.fixture
+def features():
+    return corine.read_feature_file(SAMPLE)
+
+
+@pytest.fixture
+def standin(features):
+    servers = []
+
+    def start(**kwargs):
+        server, url = serve(features, **kwargs)
+        servers.append(server)
+        return server.RequestHandlerClass.counter, url
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def fetch(url):
+    return list(corine.iter_pages(url, GEOMETRY, page_size=PAGE_SIZE, concurrency=CONCURRENCY))
+
+
+def test_all_pages_in_offset_order(standin, features):
+    counter, url = standin(latency=0.05)
+    pages = fetch(url)
+    assert [len(p) for p in pages] == [5, 5, 5, 5, 4]
+    assert [f["id"] for page in pages for f in page] == [f["id"] for f in features]
+    # pages are requested ahead, but never more than CONCURRENCY at once
+    assert 1 < counter["peak"] <= CONCURRENCY
+    assert counter["requests"] <= len(pages) + CONCURRENCY
+
+
+def test_failed_page_is_retried(standin, features):
+    counter, url = standin(fail_every=3)
+    pages = fetch(url)
+    assert [f["id"] for page in pages for f in page] == [f["id"] for f in features]
+    assert counter["failed"] >= 1
+
+
+def test_streamed_collection_is_valid_geojson(standin, features):
+    _, url = standin()
+    body = b"".join(corine.stream_feature_collection(corine.iter_pages(url, GEOMETRY, page_size=PAGE_SIZE,
+                                                                      concurrency=CONCURRENCY)))
+    collection = json.loads(body)
+    assert collection["type"] == "FeatureCollection"
+    assert collection["features"] == features
@@ -0,0 +1,60 @@
+"""Layer weights (costlayers.py): meaning of a weight and the uint16 conversion."""
+import numpy as np
+import pytest
+
+from costlayers import LayerStack, WeightedGrid
+from gridsearch import routing_costs
+
+NAMES = ["corine", "natura", "zabaged"]
+
+
+@pytest.fixture
+def layers():
+    # CORINE class scores, Natura surcharges and ZABAGED corridor bonuses (-20 / -5),
+    # with cells where the bonus outweighs everything else
+    rng = np.random.default_rng(7)
+    shape = (70, 90)
+    corine = rng.choice([0, 1, 10, 45, 65], size=shape)
+    natura = rng.choice([0, 0, 30], size=shape)
+    zabaged = rng.choice([0, 0, 0, -5, -20], size=shape)
+    return np.stack([corine, natura, zabaged]).astype(np.int16)
+
+
+def weighted(layers, weights):
+    return WeightedGrid(layers, weights).ensure_all().astype(np.int64)
+
+
+def test_all_ones_matches_routing_grid(layers):
+    stack = LayerStack(layers, NAMES)
+    assert stack.grid({}) is None
+    np.testing.assert_array_equal(weighted(layers, (1, 1, 1)), routing_costs(layers.sum(axis=0)))
+
+
+def test_negative_sums_clamp_to_zero(layers):
+    grid = weighted(layers, (0, 0, 1))
+    assert grid.max() == 0
+    costs = routing_costs(np.array([-20.0, -5.0, -0.5, 0.0, 3.7, 1e6], dtype=np.float32))
+    np.testing.assert_array_equal(costs, [0, 0, 0, 0, 3, np.iinfo(np.uint16).max])
+
+
+@pytest.mark.parametrize("k", range(len(NAMES)))
+def test_raising_a_weight_is_monotone(layers, k):
+    rng = np.random.default_rng(k)
+    for _ in range(20):
+        low = rng.uniform(0, 3, size=len(NAMES)).round(2)
+        high = low.copy()
+        high[k] += rng.uniform(0.01, 3)
+        before, after = weighted(layers, low), weighted(layers, high)
+        penalised, favoured = layers[k] > 0, layers[k] < 0
+        # never cheaper where the layer penalises, never dearer where it favours
+        assert (after[penalised] >= before[penalised]).all()
+        assert (after[favoured] <= before[favoured]).all()
+        assert (after[layers[k] == 0] == before[layers[k] == 0]).all()
+
+
+def test_lazy_blocks_match_full_grid(layers):
+    full = weighted(layers, (1, 2, 0.5))
+    grid = WeightedGrid(layers, (1, 2, 0.5), tile=16)
+    part = grid.ensure(10, 20, 30, 70)
+    np.testing.assert_array_equal(part[10:20, 30:70], full[10:20, 30:70])
+    assert not grid.done.all()
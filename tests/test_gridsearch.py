@@ -0,0 +1,71 @@
+"""Compiled searches (gridsearch.py) against the reference heapq A* (plan.a_star_numpy_grid)."""
+import numpy as np
+import pytest
+
+from gridsearch import a_star_flat, bidirectional_flat
+from hierarchy import exact_cost
+from landmarks import build_landmarks
+import plan
+from plan import a_star_numpy_grid, make_corridor_mask
+
+SHAPE = (40, 50)
+WRAPPED = 65516  # a -20 bonus cast to uint16 without clamping
+
+
+def cases(n, seed=8, zero_share=0.15):
+    """Seeded grids with zero-cost and wrapped cells, and a start / goal pair on each."""
+    rng = np.random.default_rng(seed)
+    for _ in range(n):
+        grid = rng.integers(1, 60, size=SHAPE).astype(np.uint16)
+        grid[rng.random(SHAPE) < zero_share] = 0
+        grid[rng.random(SHAPE) < 0.05] = WRAPPED
+        start = (int(rng.integers(SHAPE[0])), int(rng.integers(SHAPE[1])))
+        goal = (int(rng.integers(SHAPE[0])), int(rng.integers(SHAPE[1])))
+        yield grid, start, goal
+
+
+def path_cost(grid, path):
+    return sum(int(grid[cell]) for cell in path[1:])
+
+
+@pytest.mark.parametrize("grid,start,goal", list(cases(20)))
+def test_flat_matches_numpy(grid, start, goal):
+    expected = a_star_numpy_grid(grid, start, goal)
+    found = a_star_flat(grid, start, goal)
+    assert found == expected
+    assert path_cost(grid, found) == path_cost(grid, expected)
+
+
+@pytest.mark.parametrize("grid,start,goal", list(cases(10, seed=9)))
+def test_flat_corridor_matches_numpy(grid, start, goal):
+    width = 4
+    expected = a_star_numpy_grid(grid, start, goal, corridor_mask=make_corridor_mask(grid.shape, start, goal, width))
+    found = a_star_flat(grid, start, goal, corridor_width=width)
+    assert found == expected
+
+
+def test_adaptive_corridor_starts_at_requested_width(monkeypatch):
+    grid, start, goal = next(cases(1, seed=12))
+    monkeypatch.setattr(plan, "ADAPTIVE_CORRIDOR", True)
+    monkeypatch.setattr(plan, "CORRIDOR_WIDTHS", (4, 8, 16))
+    for width, expected in ((4, [4, 8, 16]), (6, [6, 8, 16]), (20, [20])):
+        stats = {}
+        plan.find_path(grid, start, goal, width, backend="flat", stats=stats)
+        widths = [attempt["width"] for attempt in stats["attempts"]]
+        assert widths == expected[:len(widths)]
+
+
+@pytest.mark.parametrize("grid,start,goal", list(cases(10, seed=10)))
+def test_bidirectional_is_exact(grid, start, goal):
+    found = bidirectional_flat(grid, start, goal)
+    assert found[0] == start and found[-1] == goal
+    assert path_cost(grid, found) == exact_cost(grid, start, goal)
+
+
+@pytest.mark.parametrize("grid,start,goal", list(cases(10, seed=11, zero_share=0.4)))
+def test_bidirectional_matches_flat_on_zero_cost_cells(grid, start, goal):
+    # zero-cost cells make Manhattan distance inadmissible: plain A* may then return a
+    # dearer path, A* with the (admissible) landmark bound may not
+    found = path_cost(grid, bidirectional_flat(grid, start, goal))
+    assert found == path_cost(grid, a_star_flat(grid, start, goal, landmarks=build_landmarks(grid, 4)))
+    assert found <= path_cost(grid, a_star_flat(grid, start, goal))
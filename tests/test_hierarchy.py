@@ -0,0 +1,54 @@
+"""HPA* abstraction (hierarchy.py): routes stay within MAX_EXCESS of the exact optimum."""
+import numpy as np
+import pytest
+
+from hierarchy import MAX_EXCESS, build_abstraction, exact_cost, hpa_search, load_abstraction, measure_excess
+
+SHAPE = (120, 150)
+CLUSTER = 20           # 6 x 8 clusters with the default entrance spacing
+MIN_DISTANCE = 60      # validation pairs are at least this far apart, as in the offline build
+
+
+@pytest.fixture(scope="module")
+def grid():
+    return np.random.default_rng(2).integers(1, 60, size=SHAPE).astype(np.uint16)
+
+
+@pytest.fixture(scope="module")
+def graph(grid):
+    graph = build_abstraction(grid, cluster_size=CLUSTER)
+    # what models/build_hierarchy.py checks before it saves a graph
+    max_excess, _ = measure_excess(graph, grid, n_pairs=40, min_distance=MIN_DISTANCE)
+    assert max_excess <= MAX_EXCESS
+    return graph
+
+
+def pairs(n, seed):
+    rng = np.random.default_rng(seed)
+    while n:
+        s = (int(rng.integers(SHAPE[0])), int(rng.integers(SHAPE[1])))
+        t = (int(rng.integers(SHAPE[0])), int(rng.integers(SHAPE[1])))
+        if abs(s[0] - t[0]) + abs(s[1] - t[1]) >= MIN_DISTANCE:
+            n -= 1
+            yield s, t
+
+
+@pytest.mark.parametrize("start,goal", list(pairs(20, seed=1)))
+def test_hpa_within_max_excess(grid, graph, start, goal):
+    stats = {}
+    path = hpa_search(graph, grid, start, goal, stats=stats)
+    assert path[0] == start and path[-1] == goal
+    assert all(abs(a[0] - b[0]) + abs(a[1] - b[1]) == 1 for a, b in zip(path, path[1:]))
+    cost = sum(int(grid[cell]) for cell in path[1:])
+    assert cost == stats["cost"]
+    optimum = exact_cost(grid, start, goal)
+    assert optimum <= cost <= optimum * (1 + MAX_EXCESS)
+
+
+def test_saved_graph_keeps_its_validation(tmp_path, grid, graph):
+    path = str(tmp_path / "hpa.npz")
+    graph.save(path)
+    loaded = load_abstraction(path, grid)
+    assert loaded.max_excess == graph.max_excess
+    np.testing.assert_array_equal(loaded.adj_weights, graph.adj_weights)
+    assert load_abstraction(path, grid[::-1].copy()) is None
@@ -0,0 +1,133 @@
+"""Route jobs shared through the job store (jobs.py): states other workers see."""
+import os
+import pickle
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+
+import numpy as np
+import pytest
+
+import jobs
+from jobs import JobManager, JobStore, RouteJob
+
+
+@pytest.fixture
+def store(tmp_path):
+    return JobStore(str(tmp_path / "jobs.sqlite"))
+
+
+def published(store, state="running"):
+    job = RouteJob()
+    job.state = state
+    store.publish(job)
+    return job
+
+
+def set_row(store, job, **fields):
+    assignments = ", ".join(f"{name} = ?" for name in fields)
+    store._conn().execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job.id))
+
+
+def dead_pid():
+    proc = subprocess.Popen([sys.executable, "-c", "pass"])
+    proc.wait()
+    return proc.pid
+
+
+def test_live_owner_keeps_job_running(store):
+    job = published(store)
+    remote = store.get(job.id)
+    assert remote.state == "running"
+    assert remote.progress()["state"] == "running"
+
+
+def test_dead_owner_fails_job(store):
+    job = published(store)
+    set_row(store, job, owner=dead_pid())
+    remote = store.get(job.id)
+    assert remote.state == "failed"
+    assert remote.progress()["state"] == "failed"
+    assert remote.error
+
+
+def test_stale_heartbeat_fails_job(store):
+    job = published(store)
+    set_row(store, job, heartbeat=time.time() - jobs.HEARTBEAT_TIMEOUT - 1)
+    assert store.get(job.id).state == "failed"
+
+
+def test_finished_job_is_left_alone(store):
+    job = published(store, state="done")
+    set_row(store, job, owner=dead_pid(), heartbeat=0)
+    assert store.get(job.id).state == "done"
+
+
+def test_purge_drops_orphans(store):
+    orphan = published(store)
+    running = published(store)
+    set_row(store, orphan, heartbeat=time.time() - store.ttl - 1)
+    store.purge()
+    assert store.row(orphan.id) is None
+    assert store.row(running.id) is not None
+
+
+def test_store_created_before_heartbeats_is_migrated(tmp_path):
+    path = str(tmp_path / "old.sqlite")
+    conn = sqlite3.connect(path)
+    conn.executescript("CREATE TABLE jobs (id TEXT PRIMARY KEY, state TEXT NOT NULL, progress TEXT NOT NULL, "
+                       "result BLOB, error TEXT, cancel INTEGER NOT NULL DEFAULT 0, updated REAL NOT NULL);"
+                       "INSERT INTO jobs VALUES ('old', 'running', '{}', NULL, NULL, 0, 0);")
+    conn.close()
+    store = JobStore(path)
+    assert store.get("old").state == "failed"
+    job = published(store)
+    assert store.get(job.id).state == "running"
+
+
+def test_cancelled_queued_job_is_published(store):
+    release = threading.Event()
+
+    def body(control=None, on_segment=None):
+        release.wait(10)
+        return ()
+
+    manager = JobManager(body, workers=1, store=store)
+    try:
+        running = manager.submit()
+        queued = manager.submit()
+        assert manager.cancel(queued.id) is queued
+        assert queued.state == "cancelled"
+        assert store.get(queued.id).state == "cancelled"
+    finally:
+        release.set()
+        running.future.result(10)
+        manager.shutdown()
+
+
+def test_result_round_trips_without_pickle(store):
+    job = RouteJob()
+    job.state, job.result = "done", (np.array([14.4, 14.5]), np.array([50.0, 50.1]), 12.34)
+    store.publish(job)
+    lon, lat, length = store.get(job.id).result
+    np.testing.assert_array_equal(lon, job.result[0])
+    np.testing.assert_array_equal(lat, job.result[1])
+    assert length == 12.34 and isinstance(length, float)
+
+
+def test_pickled_result_is_not_loaded(store):
+    job = published(store, state="done")
+    set_row(store, job, result=pickle.dumps((np.zeros(2), np.zeros(2), 1.0)))
+    remote = store.get(job.id)
+    assert remote.state == "failed" and remote.result is None
+
+
+def test_private_directory(tmp_path, monkeypatch):
+    monkeypatch.setattr(jobs.tempfile, "gettempdir", lambda: str(tmp_path))
+    path = jobs.private_directory("greenhack")
+    assert path is not None and os.stat(path).st_mode & 0o777 == 0o700
+    assert jobs.private_directory("greenhack") == path
+    os.chmod(path, 0o777)
+    assert jobs.private_directory("greenhack") is None
@@ -0,0 +1,53 @@
+"""Landmark (ALT) heuristic (landmarks.py): the bound never exceeds the true remaining cost."""
+import numpy as np
+import pytest
+
+from gridsearch import _heuristic, a_star_flat, dijkstra_flat, settled_costs
+from hierarchy import exact_cost
+from landmarks import build_landmarks
+
+SHAPE = (40, 50)
+
+
+def make_grid(seed, high):
+    """Seeded grid with zero-cost cells; high above ~3000 makes the tables quantise with scale > 1."""
+    rng = np.random.default_rng(seed)
+    grid = rng.integers(1, high, size=SHAPE).astype(np.uint16)
+    grid[rng.random(SHAPE) < 0.2] = 0
+    return grid
+
+
+def distances_to(grid, goal):
+    """d(v, goal) for every cell v (reverse Dijkstra from the goal)."""
+    cols = grid.shape[1]
+    ws, gen = dijkstra_flat(grid, [goal[0] * cols + goal[1]], reverse=True)
+    return settled_costs(ws, gen, np.arange(grid.size))
+
+
+@pytest.mark.parametrize("seed,high", [(1, 60), (2, 60), (3, 6000)])
+def test_bound_never_exceeds_true_cost(seed, high):
+    grid = make_grid(seed, high)
+    tables = build_landmarks(grid, 4)
+    assert (tables.scale > 1).any() == (high > 60)
+    fwd, rev, scale = tables.arrays()
+    frame = np.array([0, 0, SHAPE[1]], dtype=np.int64)
+    rng = np.random.default_rng(seed)
+    for _ in range(5):
+        goal = (int(rng.integers(SHAPE[0])), int(rng.integers(SHAPE[1])))
+        truth = distances_to(grid, goal)
+        bound = np.array([_heuristic(fwd, rev, scale, frame, r, c, *goal)
+                          for r in range(SHAPE[0]) for c in range(SHAPE[1])])
+        assert (bound <= truth).all()
+        assert bound.max() > 0
+
+
+@pytest.mark.parametrize("seed", [4, 5, 6])
+def test_alt_search_is_exact(seed):
+    grid = make_grid(seed, 60)
+    tables = build_landmarks(grid, 4)
+    rng = np.random.default_rng(seed)
+    for _ in range(5):
+        start = (int(rng.integers(SHAPE[0])), int(rng.integers(SHAPE[1])))
+        goal = (int(rng.integers(SHAPE[0])), int(rng.integers(SHAPE[1])))
+        path = a_star_flat(grid, start, goal, landmarks=tables)
+        assert sum(int(grid[cell]) for cell in path[1:]) == exact_cost(grid, start, goal)
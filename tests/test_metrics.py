@@ -0,0 +1,57 @@
+"""Metrics (metrics.py): /metrics sums the snapshots of every worker of the server."""
+import json
+import os
+import time
+
+import pytest
+
+import metrics
+from metrics import Counter, Histogram, MetricsStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return MetricsStore(str(tmp_path / "metrics.sqlite"))
+
+
+def other_worker(store, values, pid=None, server=None):
+    store._conn().execute("INSERT INTO snapshots VALUES (?, ?, ?, ?)",
+                          (pid or os.getpid() + 100000, server or os.getppid(), json.dumps(values), time.time()))
+
+
+def sample(text, line):
+    return [l for l in text.splitlines() if l.startswith(line + " ")][0].split()[-1]
+
+
+def test_counter_snapshots_add_up():
+    counter = Counter("c", "doc", ("k",))
+    counter.inc(2, k="a")
+    values = {}
+    counter.merge(values, counter.snapshot())
+    counter.merge(values, [[["a"], 3], [["b"], 1]])
+    assert values == {("a",): 5, ("b",): 1}
+
+
+def test_histogram_snapshots_add_up():
+    hist = Histogram("h", "doc", buckets=(1, 10))
+    hist.observe(0.5)
+    hist.observe(5)
+    values = {}
+    hist.merge(values, hist.snapshot())
+    hist.merge(values, hist.snapshot())
+    assert values == {(): ([2, 4, 4], 11.0)}
+
+
+def test_render_sums_workers(store):
+    metrics.HEAP_PUSHES.inc(7)
+    own = int(sample(metrics.render(), "greenhack_search_heap_pushes_total"))
+    other_worker(store, {"greenhack_search_heap_pushes_total": [[[], 5]]})
+    assert int(sample(metrics.render(store), "greenhack_search_heap_pushes_total")) == own + 5
+
+
+def test_earlier_server_runs_are_dropped(store):
+    other_worker(store, {"greenhack_search_heap_pushes_total": [[[], 10 ** 6]]}, server=os.getppid() + 1)
+    reopened = MetricsStore(store.path)
+    assert all(snap.get("greenhack_search_heap_pushes_total") != [[[], 10 ** 6]] for snap in reopened.collect())
+    count = reopened._conn().execute("SELECT COUNT(*) FROM snapshots WHERE server != ?", (os.getppid(),))
+    assert count.fetchone()[0] == 0
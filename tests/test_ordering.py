@@ -0,0 +1,64 @@
+"""Waypoint ordering (ordering.py) on small random asymmetric cost matrices."""
+import itertools
+
+import numpy as np
+import pytest
+
+import ordering
+from ordering import UNREACHABLE, order_cost, solve_order
+
+
+def matrices(n_matrices, sizes, seed, unreachable_share=0.0, cheap_input=False):
+    """
+    Seeded asymmetric integer cost matrices, optionally with unreachable legs. cheap_input
+    makes the input order's legs cheap and scatters cheaper traps for nearest neighbour.
+    """
+    rng = np.random.default_rng(seed)
+    for _ in range(n_matrices):
+        n = int(rng.choice(sizes))
+        cost = rng.integers(1, 100, size=(n, n)).astype(np.int64)
+        if cheap_input:
+            cost += 50
+            cost[np.arange(n - 1), np.arange(1, n)] = rng.integers(1, 60, size=n - 1)
+            cost[rng.random((n, n)) < 0.2] = rng.integers(0, 5)
+        cost[rng.random((n, n)) < unreachable_share] = UNREACHABLE
+        np.fill_diagonal(cost, 0)
+        yield cost
+
+
+def brute_force(cost, fix_end):
+    n = cost.shape[0]
+    free = range(1, n - 1 if fix_end else n)
+    tail = [n - 1] if fix_end else []
+    return min(order_cost(cost, [0, *middle, *tail]) for middle in itertools.permutations(free))
+
+
+def keeps_endpoints(order, n, fix_end):
+    return sorted(order) == list(range(n)) and order[0] == 0 and (not fix_end or order[-1] == n - 1)
+
+
+@pytest.mark.parametrize("fix_end", [True, False])
+@pytest.mark.parametrize("cost", list(matrices(15, range(2, 9), seed=1, unreachable_share=0.1)))
+def test_held_karp_matches_brute_force(cost, fix_end):
+    order = solve_order(cost, fix_end=fix_end)
+    assert keeps_endpoints(order, cost.shape[0], fix_end)
+    assert order_cost(cost, order) == brute_force(cost, fix_end)
+
+
+@pytest.mark.parametrize("fix_end", [True, False])
+@pytest.mark.parametrize("cost", [*matrices(30, range(5, 10), seed=2),
+                                  *matrices(30, range(5, 10), seed=4, cheap_input=True)])
+def test_heuristic_never_worse_than_input_order(cost, fix_end, monkeypatch):
+    monkeypatch.setattr(ordering, "EXACT_MAX", 0)
+    n = cost.shape[0]
+    order = solve_order(cost, fix_end=fix_end)
+    assert keeps_endpoints(order, n, fix_end)
+    assert brute_force(cost, fix_end) <= order_cost(cost, order) <= order_cost(cost, list(range(n)))
+
+
+@pytest.mark.parametrize("cost", list(matrices(5, [ordering.EXACT_MAX + 8], seed=3)))
+def test_heuristic_on_larger_matrices(cost):
+    n = cost.shape[0]
+    order = solve_order(cost)
+    assert keeps_endpoints(order, n, True)
+    assert order_cost(cost, order) <= order_cost(cost, list(range(n)))
@@ -0,0 +1,73 @@
+"""Grid pyramid (pyramid.py): tiled levels and coarse-to-fine routing on a small grid."""
+import numpy as np
+import pytest
+
+from gridsearch import a_star_flat
+from pyramid import FACTOR, TOP_SIZE, build_pyramid, coarse_to_fine, level_shapes
+
+SHAPE = (100, 120)
+TOP = 30   # 100x120 -> 50x60 -> 25x30: three levels (with TOP_SIZE the whole grid would be one)
+TILE = 16
+
+
+@pytest.fixture
+def grid():
+    rng = np.random.default_rng(6)
+    return rng.integers(1, 60, size=SHAPE).astype(np.uint16)
+
+
+@pytest.fixture
+def pyramid(tmp_path, grid):
+    fill = lambda r_lo, r_hi, c_lo, c_hi: grid[r_lo:r_hi, c_lo:c_hi]
+    return build_pyramid(str(tmp_path), SHAPE, (1, 0, 0, 0, -1, 0), fill, top_size=TOP, tile=TILE)
+
+
+def path_cost(grid, path):
+    return sum(int(grid[cell]) for cell in path[1:])
+
+
+def test_level_shapes():
+    # a grid the size of final_grid.npy is its own top level: no refinement at all ...
+    assert level_shapes((1000, 1000)) == [(1000, 1000)]
+    # ... the pyramid is built finer (prepare_rasters.PYRAMID_SHAPE) and halved down to TOP_SIZE
+    assert level_shapes((8000, 8000)) == [(8000, 8000), (4000, 4000), (2000, 2000), (1000, 1000)]
+    assert level_shapes((8001, 10)) == [(8001, 10), (4001, 5), (2001, 3), (1001, 2), (501, 1)]
+    assert max(SHAPE) <= TOP_SIZE  # so the tests below build with their own top size
+
+
+def test_levels(grid, pyramid):
+    assert [level.shape for level in pyramid.levels] == level_shapes(SHAPE, top_size=TOP)
+    assert [level.shape for level in pyramid.levels] == [(100, 120), (50, 60), (25, 30)]
+    np.testing.assert_array_equal(pyramid.levels[0].window(0, 100, 0, 120), grid)
+    blocks = grid.astype(np.float64).reshape(50, FACTOR, 60, FACTOR).transpose(0, 2, 1, 3).reshape(50, 60, -1)
+    np.testing.assert_array_equal(pyramid.levels[1].window(0, 50, 0, 60), np.rint(np.median(blocks, axis=2)))
+    assert pyramid.transforms[2][0] == FACTOR ** 2
+
+
+def test_single_level_is_a_direct_search(tmp_path, grid):
+    fill = lambda r_lo, r_hi, c_lo, c_hi: grid[r_lo:r_hi, c_lo:c_hi]
+    flat = build_pyramid(str(tmp_path / "flat"), SHAPE, (1, 0, 0, 0, -1, 0), fill, tile=TILE)
+    assert len(flat.levels) == 1
+    start, goal = (3, 4), (90, 110)
+    path = coarse_to_fine(flat, start, goal, widths=(200,))
+    assert path == a_star_flat(grid, start, goal, corridor_width=200)
+
+
+@pytest.mark.parametrize("start,goal", [((3, 4), (90, 110)), ((95, 2), (5, 117)), ((50, 10), (52, 100))])
+def test_refines_to_the_direct_route(grid, pyramid, start, goal):
+    # one chunk and a band over the whole level: refinement is the unrestricted fine search
+    stats = {}
+    path = coarse_to_fine(pyramid, start, goal, chunk=1000, buffer=1000, widths=(200,), stats=stats)
+    assert path == a_star_flat(grid, start, goal)
+    assert [n > 0 for n in stats["level_cells"]] == [True, True, True]
+
+
+@pytest.mark.parametrize("start,goal", [((3, 4), (90, 110)), ((95, 2), (5, 117))])
+def test_banded_refinement_follows_the_coarse_route(grid, pyramid, start, goal):
+    stats = {}
+    path = coarse_to_fine(pyramid, start, goal, chunk=8, buffer=2, stats=stats)
+    assert path[0] == start and path[-1] == goal
+    assert all(abs(a[0] - b[0]) + abs(a[1] - b[1]) == 1 for a, b in zip(path, path[1:]))
+    assert stats["level_cells"][0] == len(path)
+    # a good route, not necessarily the finest level's optimum
+    assert path_cost(grid, path) >= path_cost(grid, a_star_flat(grid, start, goal, corridor_width=200))
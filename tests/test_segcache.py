@@ -0,0 +1,75 @@
+"""Segment cache (segcache.py): LRU eviction, TTL expiry and invalidation on a new version."""
+import types
+
+import pytest
+
+import segcache
+from segcache import SegmentCache
+
+COLS = 100
+PATH = [(0, 0), (0, 1), (1, 1)]
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(segcache, "time", types.SimpleNamespace(time=lambda: now[0]))
+    return now
+
+
+def open_cache(tmp_path, version="v1", **kwargs):
+    return SegmentCache(str(tmp_path / "segments.sqlite"), version, COLS, **kwargs)
+
+
+def segment(i):
+    return (i, 0), (i, 1), 40, "flat"
+
+
+def test_round_trip(tmp_path, clock):
+    cache = open_cache(tmp_path)
+    assert cache.get(*segment(1)) is None
+    cache.put(*segment(1), PATH)
+    assert cache.get(*segment(1)) == PATH
+    assert cache.get((1, 0), (1, 1), 80, "flat") is None   # other corridor width
+    assert cache.get((1, 0), (1, 1), 40, "alt") is None    # other backend
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 3, 1)
+
+
+def test_least_recently_used_is_evicted(tmp_path, clock):
+    cache = open_cache(tmp_path, max_entries=2)
+    cache.put(*segment(1), PATH)
+    clock[0] += 1
+    cache.put(*segment(2), PATH)
+    clock[0] += 1
+    assert cache.get(*segment(1)) == PATH   # 1 is now more recently used than 2
+    clock[0] += 1
+    cache.put(*segment(3), PATH)
+    assert cache.get(*segment(2)) is None
+    assert cache.get(*segment(1)) == PATH
+    assert cache.get(*segment(3)) == PATH
+    assert cache.stats()["evictions"] == 1 and cache.stats()["entries"] == 2
+
+
+def test_expired_entry_is_a_miss(tmp_path, clock):
+    cache = open_cache(tmp_path, ttl=60)
+    cache.put(*segment(1), PATH)
+    clock[0] += 59
+    assert cache.get(*segment(1)) == PATH   # use does not extend the lifetime
+    clock[0] += 2
+    assert cache.get(*segment(1)) is None
+    cache.put(*segment(2), PATH)            # a put also drops expired entries
+    assert cache.stats()["entries"] == 1
+
+
+def test_new_version_drops_old_entries(tmp_path, clock):
+    old = open_cache(tmp_path, version="v1")
+    old.put(*segment(1), PATH)
+    old.get(*segment(1))
+    new = open_cache(tmp_path, version="v2")
+    assert new.get(*segment(1)) is None
+    stats = new.stats()
+    assert (stats["entries"], stats["hits"], stats["version"]) == (0, 0, "v2")
+    # reopening with the same version keeps what is there
+    new.put(*segment(1), PATH)
+    assert open_cache(tmp_path, version="v2").get(*segment(1)) == PATH
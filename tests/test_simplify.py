@@ -0,0 +1,73 @@
+"""Route simplification (gridsearch.simplify_kernel, plan.simplify_path) against a reference Douglas-Peucker."""
+import numpy as np
+import pytest
+
+from gridsearch import simplify_kernel
+from plan import simplify_path
+
+
+def reference_dp(pts, tolerance):
+    """Textbook recursive Douglas-Peucker; indices of the kept points."""
+    def deviation(k, i, j):
+        chord = pts[j] - pts[i]
+        rel = pts[k] - pts[i]
+        norm = np.hypot(*chord)
+        return np.hypot(*rel) if norm == 0 else abs(chord[0] * rel[1] - chord[1] * rel[0]) / norm
+
+    def recurse(i, j):
+        if j - i < 2:
+            return []
+        m = max(range(i + 1, j), key=lambda k: deviation(k, i, j))
+        if deviation(m, i, j) <= tolerance + 1e-9:
+            return []
+        return recurse(i, m) + [m] + recurse(m, j)
+
+    return [0] + recurse(0, len(pts) - 1) + [len(pts) - 1]
+
+
+def random_walk(seed, n=300):
+    """A 4-connected cell path, as the searches return them (may revisit a cell or close a loop)."""
+    rng = np.random.default_rng(seed)
+    steps = np.array([(0, 1), (1, 0), (0, -1), (-1, 0)])[rng.integers(0, 4, size=n - 1)]
+    return np.vstack(([0, 0], np.cumsum(steps, axis=0)))
+
+
+@pytest.mark.parametrize("seed", range(10))
+@pytest.mark.parametrize("tolerance", [0.0, 0.5, 1.5, 4.0])
+def test_kernel_matches_reference(seed, tolerance):
+    pts = random_walk(seed).astype(np.float64)
+    keep = np.zeros(len(pts), dtype=np.bool_)
+    simplify_kernel(pts, tolerance, keep)
+    assert np.flatnonzero(keep).tolist() == reference_dp(pts, tolerance)
+
+
+def test_closed_loop_keeps_endpoints():
+    pts = np.array([(0, 0), (0, 3), (3, 3), (3, 0), (0, 0)], dtype=np.float64)
+    keep = np.zeros(len(pts), dtype=np.bool_)
+    simplify_kernel(pts, 1.0, keep)
+    # the chord is a single point: deviation is the distance to it, every corner stays
+    assert np.flatnonzero(keep).tolist() == reference_dp(pts, 1.0) == [0, 1, 2, 3, 4]
+
+
+@pytest.mark.parametrize("seed", range(5))
+@pytest.mark.parametrize("tolerance", [0, 2])
+def test_simplify_path(seed, tolerance):
+    cells = random_walk(seed)
+    kept = simplify_path(cells, tolerance)
+    assert kept[0] == 0 and kept[-1] == len(cells) - 1
+    assert (np.diff(kept) > 0).all()
+    if tolerance == 0:
+        # only collinear points go: every kept interior vertex is a turn
+        d = np.diff(cells, axis=0)
+        turns = np.flatnonzero((d[1:] != d[:-1]).any(axis=1)) + 1
+        assert kept[1:-1].tolist() == turns.tolist()
+    else:
+        # same vertices as Douglas-Peucker over the turns
+        candidates = simplify_path(cells, 0)
+        expected = reference_dp(cells[candidates].astype(np.float64), tolerance)
+        assert kept.tolist() == candidates[expected].tolist()
+
+
+def test_short_paths_are_kept():
+    assert simplify_path(np.array([(0, 0), (0, 1)]), 2).tolist() == [0, 1]
+    assert simplify_path(np.array([(0, 0), (0, 1), (0, 2)]), 2).tolist() == [0, 2]
@@ -0,0 +1,55 @@
+"""Surface store (surfaces.py): serving processes see surfaces rebuilt or removed offline."""
+import os
+
+import numpy as np
+import pytest
+
+import surfaces
+from surfaces import SurfaceStore
+
+
+@pytest.fixture
+def grid():
+    return np.random.default_rng(3).integers(1, 20, size=(30, 40)).astype(np.uint16)
+
+
+def test_rebuilt_surface_is_reloaded(tmp_path, grid):
+    builder = SurfaceStore(str(tmp_path), grid)
+    server = SurfaceStore(str(tmp_path), grid)
+    builder.register((5, 7))
+    first = server.get((5, 7))
+    assert first is not None and server.get((5, 7)) is first
+
+    # another process rebuilds the surface (new .npz inode)
+    builder.register((5, 7))
+    second = server.get((5, 7))
+    assert second is not None and second is not first
+    np.testing.assert_array_equal(second.cost, first.cost)
+
+
+def test_removed_surface_is_dropped(tmp_path, grid):
+    builder = SurfaceStore(str(tmp_path), grid)
+    server = SurfaceStore(str(tmp_path), grid)
+    builder.register((2, 3))
+    assert server.targets() == [(2, 3)]
+    os.remove(os.path.join(str(tmp_path), "2_3.npz"))
+    assert server.get((2, 3)) is None
+    assert server.targets() == []
+
+
+def test_stale_surface_is_not_reloaded(tmp_path, grid, monkeypatch):
+    SurfaceStore(str(tmp_path), grid).register((4, 4))
+    server = SurfaceStore(str(tmp_path), grid, digest="another grid")
+    loads = []
+    load_surface = surfaces.load_surface
+    monkeypatch.setattr(surfaces, "load_surface", lambda *args: loads.append(args) or load_surface(*args))
+    assert server.get((4, 4)) is None
+    assert server.get((4, 4)) is None
+    assert len(loads) == 1
+
+    # rebuilt for the server's grid: the new version is loaded
+    SurfaceStore(str(tmp_path), grid, digest="another grid").register((4, 4))
+    loads.clear()
+    assert server.get((4, 4)) is not None
+    assert server.get((4, 4)) is not None
+    assert len(loads) == 1